@@ -2,9 +2,13 @@ import os
 import json
 import re
 from datetime import datetime
+import uuid
 import importlib.util
 from unittest.mock import MagicMock
 from ai_model import AIModel
+from llm_scheduler import get_llm_scheduler
+from ollama_pool import get_ollama_pool
+from finalizer import get_finalizer
 from browser_controller import BrowserController
 from security_filter import SecurityFilter
 from website_graph import WebsiteGraph
@@ -32,7 +36,7 @@ FindElementWithVisionTool.model_rebuild()
 AnalyzeVisualLayoutTool.model_rebuild()
 
 class WebAgent:
-    def __init__(self, objective, start_url, model_name=config.MAIN_MODEL, supervisor_model_name=config.SUPERVISOR_MODEL, fast_model_name=config.FAST_MODEL, vision_model_name=config.VISION_MODEL, memory_file=config.MEMORY_FILE, critique_file=config.CRITIQUE_FILE, max_steps=config.MAX_STEPS, clarification_request_queue=None, clarification_response_queue=None, navigation_queue=None, paused_event=None, stopped_event=None, socketio=None, testing=False):
+    def __init__(self, objective, start_url, model_name=config.MAIN_MODEL, supervisor_model_name=config.SUPERVISOR_MODEL, fast_model_name=config.FAST_MODEL, vision_model_name=config.VISION_MODEL, memory_file=config.MEMORY_FILE, critique_file=config.CRITIQUE_FILE, max_steps=config.MAX_STEPS, clarification_request_queue=None, clarification_response_queue=None, navigation_queue=None, paused_event=None, stopped_event=None, socketio=None, testing=False, browser_backend=None):
         self.objective = objective
         self.start_url = start_url
         self.clarification_request_queue = clarification_request_queue
@@ -50,8 +54,13 @@ class WebAgent:
         self.self_critique = "No critiques from previous runs."
         self.last_action_result = "No action has been taken yet."
         self.security_filter = SecurityFilter()
+        # Set when the agent calls 'finish' or completes a saved strategy; feeds model selection.
+        self.succeeded = False
         
         self.run_folder = f"runs/{datetime.now().strftime('%Y-%m-%d_%H-%M-%S')}"
+        # Concurrent runs can start within the same second.
+        if os.path.exists(self.run_folder):
+            self.run_folder = f"{self.run_folder}_{uuid.uuid4().hex[:6]}"
 
         self.website_graph = WebsiteGraph(graph_file_path=config.GRAPH_FILE_PATH)
         self.strategy_manager = StrategyManager(config.STRATEGY_FILE_PATH)
@@ -61,9 +70,12 @@ class WebAgent:
             self.ai_model = MagicMock()
         else:
             self.ai_model = AIModel(main_model_name=model_name, supervisor_model_name=supervisor_model_name, fast_model_name=fast_model_name, vision_model_name=vision_model_name)
-            self.ai_model.update_models_based_on_objective(objective)
-        self.browser = BrowserController(run_folder=self.run_folder, agent=self, website_graph=self.website_graph, socketio=self.socketio, testing=self.testing)
+            self.ai_model.update_models_based_on_objective(objective, self.strategy_manager.get_domain(start_url))
+        self.browser = BrowserController(run_folder=self.run_folder, agent=self, website_graph=self.website_graph, socketio=self.socketio, testing=self.testing, backend=browser_backend)
         self.error_recovery = ErrorRecovery(self)
+        if not self.testing:
+            self.ai_model.telemetry.metrics_path = os.path.join(self.run_folder, "llm_metrics.jsonl")
+            self.ai_model.telemetry.on_update = lambda summary: self.browser._emit_to_ui('llm_metrics', summary) if self.socketio else None
 
         # Added robust encoding and error handling
         if os.path.exists(self.memory_file):
@@ -115,6 +127,17 @@ class WebAgent:
     def get_tool_definitions(self):
         return "\n".join([f"- {tool.name}: {tool.description}" for tool in self.tools])
 
+    # Strategy steps that can be replayed as plain browser actions, and their action types.
+    BATCHABLE_STRATEGY_TOOLS = {"click_element": "click", "type_text": "type", "scroll_page": "scroll"}
+
+    def _strategy_step_to_browser_action(self, step: dict):
+        """Returns the browser action for a recorded tool call, or None if it must run as a tool."""
+        action_type = self.BATCHABLE_STRATEGY_TOOLS.get(step.get("tool_name"))
+        tool_input = step.get("tool_input")
+        if action_type is None or not isinstance(tool_input, dict):
+            return None
+        return {"action_type": action_type, "details": dict(tool_input)}
+
     async def create_macro(self, objective: str):
         # Sanitize objective to create a valid file/class name
         sanitized_objective = re.sub(r'\s+', '_', objective)
@@ -202,7 +225,7 @@ class WebAgent:
         encoded_image, page_description = await self.browser.observe_and_annotate(step=step)
         strategic_plan = await self.ai_model.get_strategic_plan(
             self.objective,
-            history=self.working_memory.get_history(),
+            history=self.working_memory.get_history_for_prompt(),
             page_description=page_description,
             self_critique=self.self_critique,
             last_error=error_message
@@ -212,6 +235,8 @@ class WebAgent:
         self.working_memory.add_reflection(strategic_plan.get("reflection", ""))
         self.working_memory.add_world_model(strategic_plan.get("world_model", ""))
         self.working_memory.add_plan(strategic_plan.get("plan", []))
+        # If the page does not change before the next step, this plan is reused as is.
+        self.browser.observation_cache.set_plan(strategic_plan.get("plan", []))
 
         print("[REPLAN] New plan generated and updated in working memory.")
 
@@ -228,7 +253,8 @@ class WebAgent:
 
         print(f"[ACTION] Tool: {tool_name}, Params: {params}, Confidence: {confidence_score}, Thought: {thought}")
 
-        is_valid = await self.ai_model.validate_action(self.objective, page_description, action_json)
+        is_valid = await self.ai_model.validate_action(self.objective, page_description, action_json,
+                                                       page_state=self.browser.observation_cache.current_state())
         if not is_valid:
             print(f"[VALIDATION] Action '{tool_name}' deemed invalid by the fast model. Skipping.")
             self.last_action_result = "Action was deemed invalid by the validator."
@@ -279,6 +305,10 @@ class WebAgent:
         tool_to_execute = next((t for t in self.tools if t.name == tool_name), None)
         if tool_to_execute:
             try:
+                # Manually call the callback handler to record the action
+                await self.strategy_callback_handler.on_agent_action(
+                    AgentAction(tool=tool_name, tool_input=params, log="")
+                )
                 result = await tool_to_execute.arun(**params)
                 self.last_action_result = result
                 print(f"[INFO] Action '{tool_name}' executed successfully. Result: {result}")
@@ -315,6 +345,7 @@ class WebAgent:
 
         if tool_name == "finish":
             print("[INFO] 'finish' action called. Ending run.")
+            self.succeeded = True
             # Special case for finish, we want to stop execution entirely.
             # We can return a specific value or handle it in the loop.
             # For now, let's return a value that the loop can check.
@@ -322,7 +353,53 @@ class WebAgent:
 
         return True
 
+    async def _get_tactical_actions(self, plan: list, encoded_image: str, page_description) -> list:
+        """Returns actions for the plan steps, from one call for the whole plan when batching is enabled."""
+        if config.get_setting('TACTICAL_BATCHING', True) and len(plan) > 1:
+            actions = await self.ai_model.get_tactical_actions(plan, encoded_image, page_description,
+                                                               region=self.browser.vision_region())
+            if actions:
+                return actions
+        action_json = await self.ai_model.get_tactical_action(
+            plan=[plan[0]],
+            encoded_image=encoded_image,
+            page_description=page_description,
+            region=self.browser.vision_region()
+        )
+        return [action_json]
+
+    def _targeted_elements(self, actions: list) -> dict:
+        """Returns what the elements the given actions act on look like right now, by label."""
+        targets = {}
+        for action_json in actions:
+            params = action_json.get("params") or {}
+            try:
+                label = int(params.get("element_label"))
+            except (TypeError, ValueError):
+                continue
+            element = self.browser.labeled_elements.get(label)
+            targets[label] = (element.get("tag"), element.get("text"), element.get("href")) if element else None
+        return targets
+
+    def _actions_still_apply(self, actions: list, url_before: str, revision_before, targets_before: dict) -> bool:
+        """
+        Cheaply checks whether actions generated from an earlier observation still fit the
+        page, without observing it again: the URL and the browser's page revision are
+        unchanged, and every element they target is on the cached observation.
+        """
+        if self.browser.current_url != url_before:
+            return False
+        revision = self.browser.backend.page_revision
+        if revision is not None and revision != revision_before:
+            return False
+        return all(target is not None for target in targets_before.values()) and \
+            self._targeted_elements(actions) == targets_before
+
     async def run(self):
+        # Model checks and pulls run in the background while the browser starts.
+        self.ai_model.start_model_checks(
+            on_progress=lambda event: self.browser._emit_to_ui('model_pull_progress', event) if self.socketio else None
+        )
         await self.browser.start()
 
         # Check for special 'run_macro' objective
@@ -352,11 +429,35 @@ class WebAgent:
             # Ensure we start from the correct URL, as some strategies might assume it.
             await self.browser.goto_url(self.start_url)
 
-            for action in strategy:
+            index = 0
+            while index < len(strategy):
                 if self.stopped_event and self.stopped_event.is_set():
                     print("[INFO] Stop event received during strategy execution. Halting.")
                     break
 
+                # Consecutive click/type/scroll steps go to the browser as one batch. A click
+                # may load a new page, so it always ends the batch.
+                batch = []
+                while index < len(strategy):
+                    browser_action = self._strategy_step_to_browser_action(strategy[index])
+                    if browser_action is None:
+                        break
+                    batch.append(browser_action)
+                    index += 1
+                    if browser_action["action_type"] == "click":
+                        break
+                if batch:
+                    print(f"[STRATEGY] Executing a batch of {len(batch)} browser action(s).")
+                    success, results = await self.browser.execute_batch(batch)
+                    print(f"[STRATEGY] Batch finished with results: {results}")
+                    if not success:
+                        # If an action fails, we stop the strategy execution.
+                        print("[ERROR] A browser action from the strategy failed.")
+                        break
+                    continue
+
+                action = strategy[index]
+                index += 1
                 tool_name = action.get("tool_name")
                 tool_input = action.get("tool_input")
 
@@ -377,6 +478,7 @@ class WebAgent:
 
             print("[INFO] Strategy execution finished.")
             # The run is considered complete after executing a successful strategy.
+            self.succeeded = True
             return
 
         # Clear any recorded actions from a previous run
@@ -419,123 +521,104 @@ class WebAgent:
                 break # Stop the agent's run
             # +++ END OF NEW SECURITY STEP +++
 
-            # 2. Get strategic plan
-            strategic_plan = await self.ai_model.get_strategic_plan(
-                self.objective,
-                history=self.working_memory.get_history(),
-                page_description=page_description,
-                self_critique=self.self_critique
-            )
-            self.working_memory.add_reflection(strategic_plan.get("reflection", ""))
-            self.working_memory.add_world_model(strategic_plan.get("world_model", ""))
-            self.working_memory.add_plan(strategic_plan.get("plan", []))
-
-            plan = strategic_plan.get("plan", [])
-            if not plan:
-                print("[INFO] Plan is empty. Finishing run.")
-                break
-
-            # 3. Execute tactical actions
-            for step in plan:
-                action_json = await self.ai_model.get_tactical_action(
-                    plan=[step],
-                    encoded_image=encoded_image,
-                    page_description=page_description
+            # 2. Get strategic plan. If the last action changed nothing visible, the
+            # remaining steps of the current plan are still valid and are reused.
+            plan = self.browser.observation_cache.get_plan() if self.browser.page_unchanged else None
+            if plan:
+                print(f"[CACHE] Page unchanged since the last step. Reusing the remaining {len(plan)} plan step(s).")
+            else:
+                strategic_plan = await self.ai_model.get_strategic_plan(
+                    self.objective,
+                    history=self.working_memory.get_history_for_prompt(),
+                    page_description=page_description,
+                    self_critique=self.self_critique
                 )
+                self.working_memory.add_reflection(strategic_plan.get("reflection", ""))
+                self.working_memory.add_world_model(strategic_plan.get("world_model", ""))
+                self.working_memory.add_plan(strategic_plan.get("plan", []))
 
+                plan = strategic_plan.get("plan", [])
+                if not plan:
+                    print("[INFO] Plan is empty. Finishing run.")
+                    break
 
-                action_result = await self.execute_tactical_action(action_json, i, page_description)
-                thought = action_json.get("thought", "")
-                confidence_score = action_json.get("confidence_score", 0.0)
-                tool_name = action_json.get("tool")
-                params = action_json.get("params", {})
-                potential_actions = action_json.get("potential_actions", [])
-
-                print(f"[ACTION] Tool: {tool_name}, Params: {params}, Confidence: {confidence_score}, Thought: {thought}")
-
-                is_valid = await self.ai_model.validate_action(self.objective, page_description, action_json)
-                if not is_valid:
-                    print(f"[VALIDATION] Action '{tool_name}' deemed invalid by the fast model. Skipping.")
-                    self.last_action_result = "Action was deemed invalid by the validator."
-                    self.working_memory.add_action_result(tool_name, params, self.last_action_result)
-                    continue
-
-                # Adaptive Risk-Taking
-                if confidence_score < 0.6:
-                    print(f"[WARN] Low confidence score ({confidence_score}). Asking user for clarification.")
-                    clarification_tool = next((t for t in self.tools if t.name == "ask_user_for_clarification"), None)
-                    if clarification_tool:
-                        world_model_summary = self.working_memory.get_world_model()
-                        user_instruction = await clarification_tool.arun(
-                            world_model=f"My objective is: {self.objective}\n\nMy current understanding of the situation is:\n{world_model_summary}\n\nI was about to take the action '{tool_name}' with parameters {params} but my confidence is low. My thought process was: '{thought}'. What should I do instead?",
-                            potential_actions=potential_actions
-                        )
-                        # The user response will be handled in the next loop iteration
-                        self.last_action_result = f"User provided new instruction: {user_instruction}"
-                        self.working_memory.add_action_result(tool_name, params, self.last_action_result)
-                        continue # Skip to next iteration
-                    else:
-                        print("[ERROR] AskUserForClarificationTool not found. Cannot ask for help.")
-                        self.last_action_result = "Error: Low confidence and clarification tool is not available."
-                        break # Exit plan execution
-
-                elif confidence_score < 0.9:
-                    print(f"[WARN] Medium confidence score ({confidence_score}). Proceeding with caution.")
-
-                # Execute action
-                tool_to_execute = next((t for t in self.tools if t.name == tool_name), None)
-                if tool_to_execute:
-                    try:
-                        # Manually call the callback handler to record the action
-                        await self.strategy_callback_handler.on_agent_action(
-                            AgentAction(tool=tool_name, tool_input=params, log="")
-                        )
-                        result = await tool_to_execute.arun(**params)
-                        self.last_action_result = result
-                        print(f"[INFO] Action '{tool_name}' executed successfully. Result: {result}")
-                    except Exception as e:
-                        error_message = f"An unexpected error occurred during tool execution: {e}"
-                        print(f"[ERROR] {error_message}")
-                        self.last_action_result = error_message
-                else:
-                    self.last_action_result = f"Error: Tool '{tool_name}' not found."
-                    print(f"[ERROR] {self.last_action_result}")
-
-                self.working_memory.add_action_result(tool_name, params, self.last_action_result)
+            # 3. Execute tactical actions. The whole plan is turned into actions in one vision
+            # call; they run in order until one fails or the page changes under the remaining ones.
+            remaining = list(plan)
+            actions = []
+            observation_stale = False
+            while remaining:
+                # Whatever happens to this step, only the ones after it remain for reuse.
+                self.browser.observation_cache.set_plan(remaining[1:])
+                if not actions:
+                    if observation_stale:
+                        # Earlier actions of this plan changed the page since the screenshot was taken.
+                        encoded_image, page_description = await self.browser.observe_and_annotate(step=i)
+                        observation_stale = False
+                    actions = await self._get_tactical_actions(remaining, encoded_image, page_description)
+                action_json = actions.pop(0)
+                remaining.pop(0)
+
+                url_before, revision_before = self.browser.current_url, self.browser.backend.page_revision
+                targets_before = self._targeted_elements(actions)
 
+                action_result = await self.execute_tactical_action(action_json, i, page_description)
                 if action_result == "finish":
                     return # End the run
                 elif not action_result:
                     break # Re-plan needed, so break from plan execution to re-evaluate
+                observation_stale = True
+
+                if actions and not self._actions_still_apply(actions, url_before, revision_before, targets_before):
+                    # Only now is the page observed again. Typed values and small layout shifts
+                    # leave the remaining actions usable.
+                    session_before = self.browser.dom_session
+                    encoded_image, page_description = await self.browser.observe_and_annotate(step=i)
+                    observation_stale = False
+                    if self.browser.dom_session != session_before or self._targeted_elements(actions) != targets_before:
+                        print("[INFO] The page changed under the remaining actions. Generating new ones for the next plan step.")
+                        actions = []
 
         print("\n[INFO] Agent run has finished.")
 
     async def save_and_critique(self):
+        # Pulls still running for other runs should no longer report to this run's UI.
+        self.ai_model.stop_model_checks()
         session_log_path = os.path.join(self.run_folder, "session_log.txt")
         with open(session_log_path, 'w', encoding='utf-8', errors='ignore') as f:
             print(f"[INFO] Saving session log to {session_log_path}")
             f.write(self.working_memory.to_json())
         
-        self.website_graph.save_graph()
-
+        self.browser.observation_cache.save_stats(os.path.join(self.run_folder, "observation_cache.json"))
 
-        # Save the strategy if the run was successful
-        # For now, we consider a run successful if it completes without an error.
-        # A more robust check could be added here later.
-        actions = self.strategy_callback_handler.actions
-        if actions:
-            domain = self.strategy_manager.get_domain(self.start_url)
-            self.strategy_manager.save_strategy(domain, self.objective, actions)
 
-        critique = await self.ai_model.get_self_critique(self.working_memory.get_history())
+        # The website graph, the strategy and the self-critique are finalized in the
+        # background, together with other runs finishing around the same time.
+        await get_finalizer().submit(self)
 
-        # Log the critique
-        developer_suggestions_file = "developer_suggestions.log"
-        if critique.startswith("Directive for developer:"):
-            with open(developer_suggestions_file, 'a', encoding='utf-8') as f:
-                f.write(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] {critique}\n")
-            print(f"[INFO] Developer suggestion logged to {developer_suggestions_file}")
-        else:
-            with open(self.critique_file, 'w', encoding='utf-8', errors='ignore') as f:
-                f.write(critique)
-            print(f"[INFO] Agent critique logged to {self.critique_file}")
\ No newline at end of file
+        if not self.testing:
+            latency_path = os.path.join(self.run_folder, "llm_latency.json")
+            with open(latency_path, 'w', encoding='utf-8') as f:
+                json.dump({
+                    "roles": self.ai_model.get_latency_stats(),
+                    "structured_output": self.ai_model.get_parse_stats(),
+                    "validation": self.ai_model.validation_cache.get_stats(),
+                    "vision_images": self.ai_model.image_stats,
+                    "cascade": self.ai_model.get_cascade_stats(),
+                    "constitution_cache": self.ai_model.constitution_cache.stats,
+                    "scheduler": get_llm_scheduler().report(),
+                    "endpoints": get_ollama_pool().report(),
+                }, f, indent=2)
+            print(f"[INFO] Model latency stats saved to {latency_path}")
+            self.ai_model.telemetry.write_totals()
+            self.ai_model.record_run_outcome(self.objective, self.strategy_manager.get_domain(self.start_url), self.succeeded)
+            for call_type, totals in self.ai_model.telemetry.summary().items():
+                print(f"[LLM] {call_type}: {totals['calls']} calls, {totals['total_time']}s total, "
+                      f"{totals['prompt_tokens']} prompt / {totals['completion_tokens']} completion tokens.")
+            validation = self.ai_model.validation_cache.get_stats()
+            print(f"[VALIDATION] Run summary: {validation['hits']} cached verdicts, {validation['misses']} validator calls, "
+                  f"{validation['skipped_confidence']} skipped for confidence, {validation['skipped_read_only']} skipped as read-only.")
+            for call_type, cascade in self.ai_model.get_cascade_stats().items():
+                print(f"[CASCADE] {call_type}: {cascade['escalated']}/{cascade['calls']} escalated "
+                      f"({cascade['schema_failures']} invalid, {cascade['low_confidence']} low confidence), "
+                      f"estimated time saved: {cascade['estimated_time_saved']}s.")
\ No newline at end of file
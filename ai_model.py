@@ -3,21 +3,68 @@ import re
 import json
 import sys
 import asyncio
+import contextlib
+import hashlib
 import time
+from collections import OrderedDict
 from constitution import AGENT_CONSTITUTION, ACTION_CONSTITUTION, SUPERVISOR_CONSTITUTION
-from typing import Any, List, Mapping, Optional
+from typing import Any, Dict, List, Mapping, Optional, Union
 
 from langchain_core.callbacks import CallbackManagerForLLMRun
 from langchain_core.language_models.chat_models import BaseChatModel
-from langchain_core.messages import AIMessage, BaseMessage, HumanMessage
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, SystemMessage
 from langchain_core.outputs import ChatResult, ChatGeneration, Generation
 from pydantic import Field
 from ollama import ResponseError, RequestError
 import config
+from llm_scheduler import ModelScheduler, get_llm_scheduler
+from json_stream import JSONObjectScanner, extract_json_object
+from llm_schemas import StrategicPlan, ScoredStrategicPlan, TacticalAction, TacticalActionPlan, DynamicConstitutions, ValidationDecision
+from pydantic import BaseModel, ValidationError
+from validation_cache import ValidationCache, canonical_action
+from llm_telemetry import LLMTelemetry
+from ollama_pool import OllamaEndpoint, OllamaEndpointPool, get_ollama_pool
+from model_registry import ModelRegistry, get_model_registry
+from model_selector import ModelSelector
+from constitution_cache import ConstitutionCache, normalize_objective
+from image_prep import VISION_MIME_TYPES, prepare_vision_image, vision_input_size
+
+# Telemetry role of each structured call type.
+CALL_ROLES = {
+    "plan": "planner",
+    "tactical": "tactical",
+    "tactical_batch": "tactical",
+    "validation": "validator",
+    "verification": "validator",
+    "constitution": "constitution",
+    "plan_fast": "planner-fast",
+    "tactical_fast": "tactical-fast",
+    "tactical_batch_fast": "tactical-fast",
+}
+
+# Appended to prompts the fast, text-only model answers in cascade mode.
+TEXT_ONLY_NOTE = "You cannot see the screen; rely on the page description above."
+
+# Shared by validate_action and verify_action_with_details so both send the same system prompt.
+VALIDATOR_INSTRUCTIONS = 'You are a logical validator. Answer with a single JSON object: {"valid": true} or {"valid": false}.'
 
 class OllamaChatModel(BaseChatModel):
     model_name: str
+    # Which of the agent's models this is ("main", "fast", ...), for keep_alive and latency stats.
+    role: str = "default"
+    # How long Ollama keeps the model loaded after a call (e.g. "30m"). None uses the server default.
+    keep_alive: Optional[Union[str, float]] = None
     async_client: ollama.AsyncClient = Field(default_factory=ollama.AsyncClient)
+    # Time to first token and prompt evaluation statistics of every call, in order.
+    call_stats: List[Dict[str, Any]] = Field(default_factory=list)
+    # Holds each call until its model can run without thrashing Ollama. None runs calls immediately.
+    scheduler: Optional[ModelScheduler] = None
+    # Receives the metrics of every call, tagged with the caller's call_type.
+    telemetry: Optional[LLMTelemetry] = None
+    # Ollama servers to route calls over. None sends every call to async_client.
+    endpoint_pool: Optional[OllamaEndpointPool] = None
+    # Checks (and pulls) the model before its first call. None assumes it is available.
+    registry: Optional[ModelRegistry] = None
 
     def __init__(self, model_name: str, **kwargs: Any):
         super().__init__(model_name=model_name, **kwargs)
@@ -43,7 +90,11 @@ class OllamaChatModel(BaseChatModel):
     ) -> ChatResult:
         ollama_messages = []
         for message in messages:
-            if isinstance(message, HumanMessage):
+            if isinstance(message, SystemMessage):
+                # Instructions that are identical across calls go first, so Ollama can reuse
+                # the cached prompt prefix instead of evaluating it again.
+                ollama_messages.append({"role": "system", "content": message.content})
+            elif isinstance(message, HumanMessage):
                 content = message.content
                 images = []
                 if isinstance(content, list):
@@ -61,30 +112,58 @@ class OllamaChatModel(BaseChatModel):
             elif isinstance(message, AIMessage):
                 ollama_messages.append({"role": "assistant", "content": message.content})
 
+        # Callers that only want a JSON object ask for the stream to stop once it is complete.
+        stop_at_json = kwargs.get("stop_at_json", False)
+        # Short calls may be duplicated to a second server if the first is slow to answer.
+        hedge = kwargs.get("hedge", False)
+
         max_retries = 3
         backoff_factor = 2
         initial_delay = 1
+        failed_endpoints = []
+
+        if self.registry is not None:
+            await self.registry.ensure(self.model_name)
 
         for attempt in range(max_retries):
+            endpoint = None
             try:
-                response_content = ""
-                async for chunk in await self.async_client.chat(
-                    model=self.model_name,
-                    messages=ollama_messages,
-                    stream=True,
-                    options=kwargs.get("options", {})
-                ):
-                    content_chunk = chunk['message']['content']
-                    response_content += content_chunk
-                    if run_manager:
-                        await run_manager.on_llm_new_token(content_chunk)
-                return ChatResult(generations=[ChatGeneration(message=AIMessage(content=response_content))])
+                async with self._scheduled():
+                    if self.endpoint_pool is not None:
+                        endpoint = self.endpoint_pool.pick(self.model_name, exclude=failed_endpoints)
+                    if hedge and self._can_hedge(failed_endpoints):
+                        endpoint, result = await self._hedged_chat(endpoint, failed_endpoints, ollama_messages, stop_at_json, kwargs)
+                    else:
+                        result = await self._chat_on(endpoint, ollama_messages, stop_at_json, run_manager, kwargs)
+                response_chunks, scanner, start_time, ttft, final_chunk = result
+                stats = self._record_call_stats(start_time, ttft, final_chunk, kwargs.get("call_type") or self.role)
+                if endpoint is not None:
+                    stats["endpoint"] = endpoint.name
+                if self.scheduler:
+                    self.scheduler.record(self.model_name, stats)
+                if self.telemetry:
+                    self.telemetry.record(stats)
+                additional_kwargs = {}
+                if scanner is not None and scanner.result is not None:
+                    additional_kwargs["parsed_json"] = scanner.result
+                    stats["stopped_at_json"] = final_chunk is None
+                message = AIMessage(content="".join(response_chunks), additional_kwargs=additional_kwargs)
+                return ChatResult(generations=[ChatGeneration(message=message)], llm_output=stats)
 
             except ResponseError as e:
-                if e.status_code == 404:
+                if e.status_code == 404 and endpoint is not None and attempt < max_retries - 1 \
+                        and self.endpoint_pool.available(exclude=failed_endpoints + [endpoint]):
+                    # Only this server lacks the model; another one may have it.
+                    print(f"[OLLAMA] Model '{self.model_name}' not found on {endpoint.name}.")
+                    self.endpoint_pool.record_missing_model(endpoint, self.model_name)
+                    if self.registry is not None:
+                        self.registry.forget(endpoint, self.model_name)
+                elif e.status_code == 404:
+                    if endpoint is not None and self.registry is not None:
+                        self.registry.forget(endpoint, self.model_name)
                     error_message = f"Ollama API Error: Model '{self.model_name}' not found. Please ensure the model is installed and available."
                     print(f"[ERROR] {error_message}")
-                    # Non-recoverable, so we don't retry
+                    # No other server to try, so we don't retry
                     return ChatResult(generations=[ChatGeneration(message=AIMessage(content=f"Error: {error_message}"))])
                 elif e.status_code >= 500:
                     error_message = f"Ollama Server Error (status {e.status_code}): {e.error}. Retrying..."
@@ -106,7 +185,17 @@ class OllamaChatModel(BaseChatModel):
                 # We can retry for unexpected errors as they might be transient.
 
             if attempt < max_retries - 1:
+                if endpoint is not None:
+                    failed_endpoints.append(endpoint)
+                if self.endpoint_pool is not None and self.endpoint_pool.available(exclude=failed_endpoints):
+                    # Another server is healthy, so there is no reason to wait.
+                    print("[INFO] Retrying on another Ollama server...")
+                    continue
                 delay = initial_delay * (backoff_factor ** attempt)
+                if self.endpoint_pool is not None:
+                    # Every server failed; wait for the first circuit to close if that is sooner.
+                    failed_endpoints = []
+                    delay = min(delay, self.endpoint_pool.seconds_until_available()) or delay
                 print(f"[INFO] Waiting {delay} seconds before retrying...")
                 await asyncio.sleep(delay)
             else:
@@ -114,6 +203,137 @@ class OllamaChatModel(BaseChatModel):
                 print(f"[ERROR] {final_error}")
                 return ChatResult(generations=[ChatGeneration(message=AIMessage(content=f"Error: {final_error}"))])
 
+    async def _chat_on(self, endpoint: Optional[OllamaEndpoint], ollama_messages: List[Dict], stop_at_json: bool,
+                       run_manager: Optional[CallbackManagerForLLMRun], kwargs: Dict[str, Any]):
+        """
+        Streams one chat request to `endpoint` (or the model's own client) and keeps the
+        endpoint's load and circuit breaker up to date. Returns the response chunks, the JSON
+        scanner, the start time, the time to first token and the final chunk.
+        """
+        client = endpoint.client if endpoint is not None else self.async_client
+        if endpoint is not None:
+            endpoint.outstanding += 1
+            endpoint.stats["requests"] += 1
+        try:
+            response_chunks = []
+            scanner = JSONObjectScanner() if stop_at_json else None
+            start_time = time.perf_counter()
+            ttft = None
+            final_chunk = None
+            stream = await client.chat(
+                model=self.model_name,
+                messages=ollama_messages,
+                stream=True,
+                format=kwargs.get("format"),
+                options=kwargs.get("options", {}),
+                keep_alive=self.keep_alive
+            )
+            try:
+                async for chunk in stream:
+                    content_chunk = chunk['message']['content']
+                    if ttft is None and content_chunk:
+                        ttft = time.perf_counter() - start_time
+                    if chunk.get('done'):
+                        final_chunk = chunk
+                    response_chunks.append(content_chunk)
+                    if run_manager:
+                        await run_manager.on_llm_new_token(content_chunk)
+                    # Schema-constrained output ends with the object anyway, and reading on to the
+                    # done chunk is what gets Ollama's token counts and durations. Only free-form
+                    # answers are cut off once their JSON object is complete.
+                    if scanner is not None and scanner.feed(content_chunk) is not None and not kwargs.get("format"):
+                        break
+            finally:
+                # Closing the stream drops the connection, which makes Ollama stop generating.
+                await stream.aclose()
+        except ResponseError as e:
+            if endpoint is not None and e.status_code >= 500:
+                self.endpoint_pool.record_failure(endpoint)
+            raise
+        except Exception:
+            if endpoint is not None:
+                self.endpoint_pool.record_failure(endpoint)
+            raise
+        finally:
+            if endpoint is not None:
+                endpoint.outstanding -= 1
+        if endpoint is not None:
+            self.endpoint_pool.record_success(endpoint, self.model_name, self.keep_alive)
+        return response_chunks, scanner, start_time, ttft, final_chunk
+
+    def _can_hedge(self, failed_endpoints: List[OllamaEndpoint]) -> bool:
+        return (self.endpoint_pool is not None and config.get_setting('OLLAMA_HEDGE_DELAY', 0) > 0
+                and len(self.endpoint_pool.available(exclude=failed_endpoints)) >= 2)
+
+    async def _hedged_chat(self, primary: OllamaEndpoint, failed_endpoints: List[OllamaEndpoint],
+                           ollama_messages: List[Dict], stop_at_json: bool, kwargs: Dict[str, Any]):
+        """
+        Sends the request to `primary`, and if it has not answered within OLLAMA_HEDGE_DELAY
+        seconds, to a second server as well. The first successful answer wins and the other
+        request is cancelled. Returns the winning endpoint and its result.
+        """
+        tasks = {asyncio.create_task(self._chat_on(primary, ollama_messages, stop_at_json, None, kwargs)): primary}
+        done, _ = await asyncio.wait(tasks, timeout=config.get_setting('OLLAMA_HEDGE_DELAY', 0))
+        if not done:
+            backup = self.endpoint_pool.pick(self.model_name, exclude=failed_endpoints + [primary])
+            backup.stats["hedges"] += 1
+            print(f"[OLLAMA] {primary.name} is slow to answer. Hedging the request to {backup.name}.")
+            tasks[asyncio.create_task(self._chat_on(backup, ollama_messages, stop_at_json, None, kwargs))] = backup
+
+        error = None
+        try:
+            while tasks:
+                done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    endpoint = tasks.pop(task)
+                    if task.exception() is None:
+                        return endpoint, task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    def _scheduled(self):
+        if self.scheduler is None:
+            return contextlib.nullcontext()
+        # The scheduler learns which models are loaded from a single server only.
+        client = self.async_client
+        if self.endpoint_pool is not None:
+            endpoints = self.endpoint_pool.endpoints
+            client = endpoints[0].client if len(endpoints) == 1 else None
+        return self.scheduler.slot(self.model_name, client=client)
+
+    def _record_call_stats(self, start_time: float, ttft: Optional[float], final_chunk, call_type: str) -> Dict[str, Any]:
+        """Records the time to first token, token counts and durations Ollama reported for a call."""
+        stats = {
+            "model": self.model_name,
+            "role": self.role,
+            "call_type": call_type,
+            "ttft": round(ttft, 3) if ttft is not None else None,
+            "total_time": round(time.perf_counter() - start_time, 3),
+        }
+        if final_chunk is not None:
+            # Ollama reports durations in nanoseconds. Prompt tokens served from the cached
+            # prefix are not evaluated again, so prompt_eval_count drops when reuse works.
+            stats["prompt_eval_count"] = final_chunk.get('prompt_eval_count')
+            stats["prompt_eval_time"] = round((final_chunk.get('prompt_eval_duration') or 0) / 1e9, 3)
+            stats["load_time"] = round((final_chunk.get('load_duration') or 0) / 1e9, 3)
+            stats["eval_count"] = final_chunk.get('eval_count')
+            stats["eval_time"] = round((final_chunk.get('eval_duration') or 0) / 1e9, 3)
+        else:
+            # The stream was closed before Ollama reported these; they are unknown, not zero.
+            for key in ("prompt_eval_count", "prompt_eval_time", "load_time", "eval_count", "eval_time"):
+                stats[key] = None
+        self.call_stats.append(stats)
+        if final_chunk is None:
+            print(f"[LLM] {call_type} ({self.model_name}): first token after {stats['ttft']}s, "
+                  f"stream stopped after {stats['total_time']}s.")
+        else:
+            print(f"[LLM] {call_type} ({self.model_name}): first token after {stats['ttft']}s, "
+                  f"{stats.get('prompt_eval_count')} prompt tokens evaluated, load {stats.get('load_time')}s.")
+        return stats
 
     @property
     def _identifying_params(self) -> Mapping[str, Any]:
@@ -145,55 +365,255 @@ class AIModel:
         
         self.agent_constitution = AGENT_CONSTITUTION
         self.action_constitution = ACTION_CONSTITUTION
+        # Structured output outcomes per call type: calls, parse failures, repairs and give-ups.
+        self.parse_stats: Dict[str, Dict[str, int]] = {}
+        # The same per model, for model selection in later runs.
+        self.model_parse_stats: Dict[str, Dict[str, int]] = {}
+        self.constitution_cache = ConstitutionCache(
+            config.get_setting('CONSTITUTION_CACHE_PATH', 'constitution_cache.json'),
+            ttl=config.get_setting('CONSTITUTION_CACHE_TTL', 7 * 24 * 3600),
+            max_entries=config.get_setting('CONSTITUTION_CACHE_SIZE', 200),
+        )
+        self.model_selector = ModelSelector(config.get_setting('MODEL_STATS_PATH', 'model_stats.json'),
+                                            max_runs_per_model=config.get_setting('MODEL_STATS_MAX_RUNS', 50))
+        self.validation_cache = ValidationCache(max_entries=config.get_setting('VALIDATION_CACHE_SIZE', 256))
+        # Per-call metrics by role. The agent points it at the run folder.
+        self.telemetry = LLMTelemetry()
+
+        # Screenshots prepared for the vision model, so calls on the same observation share one encode.
+        self._prepared_images: "OrderedDict[tuple, asyncio.Future]" = OrderedDict()
+        self.image_stats = {"encodes": 0, "reuses": 0, "original_bytes": 0, "sent_bytes": 0}
+        # Cascade outcomes per call type: fast-model answers kept or escalated, and time spent on each.
+        self.cascade_stats: Dict[str, Dict[str, Any]] = {}
+        # Model clients are created on first use, and recreated when a role's model name changes.
+        self._models: Dict[str, OllamaChatModel] = {}
+        # The run's callback for model pull progress, while subscribed to the registry.
+        self._on_model_progress = None
+
+    main_model = property(lambda self: self._model("main"))
+    fast_model = property(lambda self: self._model("fast"))
+    supervisor_model = property(lambda self: self._model("supervisor"))
+    vision_model = property(lambda self: self._model("vision"))
+    scripter_model = property(lambda self: self._model("scripter"))
+
+    def _model(self, role: str) -> OllamaChatModel:
+        model_name = getattr(self, f"{role}_model_name")
+        model = self._models.get(role)
+        if model is None or model.model_name != model_name:
+            model = self._models[role] = self._create_model(role, model_name)
+        return model
+
+    def start_model_checks(self, on_progress=None):
+        """
+        Starts checking in the background that every configured model is available,
+        pulling missing ones. Calls wait only for the check of the model they use.
+        `on_progress` receives pull progress until stop_model_checks is called.
+        """
+        self._on_model_progress = on_progress
+        get_model_registry().prefetch([self.main_model_name, self.supervisor_model_name, self.fast_model_name,
+                                       self.vision_model_name, self.scripter_model_name], on_progress=on_progress)
+
+    def stop_model_checks(self):
+        """Stops sending pull progress to the callback given to start_model_checks."""
+        if self._on_model_progress is not None:
+            get_model_registry().unsubscribe(self._on_model_progress)
+            self._on_model_progress = None
+
+    def _create_model(self, role: str, model_name: str) -> OllamaChatModel:
+        keep_alive = (config.get_setting('MODEL_KEEP_ALIVE') or {}).get(role)
+        return OllamaChatModel(model_name=model_name, role=role, keep_alive=keep_alive, scheduler=get_llm_scheduler(),
+                               telemetry=self.telemetry, endpoint_pool=get_ollama_pool(), registry=get_model_registry())
+
+    def get_latency_stats(self) -> Dict[str, Dict[str, Any]]:
+        """
+        Summarizes time to first token per role. The first call has to evaluate the whole
+        prompt; later calls should be faster when the model stays loaded and the system
+        prompt prefix is reused.
+        """
+        summary = {}
+        for role, model in self._models.items():
+            calls = [c for c in model.call_stats if c.get("ttft") is not None]
+            if not calls:
+                continue
+            later = calls[1:]
+            # Calls whose stream was cut short have no Ollama metrics and are left out of those sums.
+            metered = [c for c in calls if c.get("load_time") is not None]
+            later_counts = [c["prompt_eval_count"] for c in later if c.get("prompt_eval_count") is not None]
+            summary[role] = {
+                "model": model.model_name,
+                "calls": len(calls),
+                "first_ttft": calls[0]["ttft"],
+                "mean_ttft_after_first": round(sum(c["ttft"] for c in later) / len(later), 3) if later else None,
+                "first_prompt_eval_count": calls[0].get("prompt_eval_count"),
+                "mean_prompt_eval_count_after_first": (
+                    round(sum(later_counts) / len(later_counts), 1) if later_counts else None
+                ),
+                # Time Ollama spent loading weights versus answering, to spot model thrashing.
+                "load_time": round(sum(c["load_time"] for c in metered), 3),
+                "inference_time": round(sum(c["total_time"] - c["load_time"] for c in metered), 3),
+                "unmetered_calls": len(calls) - len(metered),
+            }
+        return summary
 
-        # If not in a virtual environment, proceed with the full setup.
-        self.main_model = OllamaChatModel(model_name=self.main_model_name)
-        self.fast_model = OllamaChatModel(model_name=self.fast_model_name)
-        self.supervisor_model = OllamaChatModel(model_name=self.supervisor_model_name)
-        self.vision_model = OllamaChatModel(model_name=self.vision_model_name)
-        self.scripter_model = OllamaChatModel(model_name=self.scripter_model_name)
+    async def _image_content(self, encoded_image: str, region: Optional[Dict] = None) -> Dict[str, Any]:
+        """
+        The image part of a vision message: the screenshot cropped to `region`, downscaled to
+        the vision model's input size and re-encoded. Each result is kept for the next calls
+        on the same observation. Falls back to the original image if it cannot be processed.
+        """
+        image_format = str(config.get_setting('VISION_IMAGE_FORMAT', 'JPEG')).upper()
+        if image_format not in VISION_MIME_TYPES:
+            print(f"[WARN] Unsupported vision image format '{image_format}'. Falling back to JPEG.")
+            image_format = "JPEG"
+        quality = int(config.get_setting('VISION_IMAGE_QUALITY', 85))
+        max_size = vision_input_size(self.vision_model_name)
+        region_key = tuple(round(region.get(k, 0)) for k in ("x", "y", "width", "height")) if region else None
+        key = (encoded_image, region_key, max_size, image_format, quality)
+
+        prepared = self._prepared_images.get(key)
+        if prepared is None:
+            prepared = asyncio.ensure_future(asyncio.to_thread(
+                prepare_vision_image, encoded_image, max_size, image_format, quality, region
+            ))
+            self._prepared_images[key] = prepared
+            while len(self._prepared_images) > 4:
+                self._prepared_images.popitem(last=False)
+            self.image_stats["encodes"] += 1
+            new_encode = True
+        else:
+            self._prepared_images.move_to_end(key)
+            self.image_stats["reuses"] += 1
+            new_encode = False
 
         try:
-            print("[INFO] Performing full Ollama model check...")
-            # Check if the model exists locally
-            response = ollama.list()
-            # Safely access the 'models' key, defaulting to an empty list if not found.
-            models_list = response.get('models', [])
-            # Safely get model names using .get() and filter out any None results
-            # to prevent errors from malformed API responses.
-            local_models = [m.get('name') for m in models_list if isinstance(m, dict)]
-            local_models = [name for name in local_models if name]
-            required_models = [self.main_model_name, self.supervisor_model_name, self.fast_model_name, self.vision_model_name, self.scripter_model_name]
-            for model in required_models:
-                 if model not in local_models:
-                    print(f"[INFO] Model '{model}' not found locally. Attempting to pull it now...")
-                    try:
-                        # This will display a progress bar in the console
-                        ollama.pull(model)
-                        print(f"[SUCCESS] Model '{model}' pulled successfully.")
-                    except ResponseError as e:
-                        print(f"[ERROR] Ollama API Error while pulling model '{model}': {e.error}")
-                        raise
-                    except RequestError as e:
-                        print(f"[ERROR] Ollama Request Error while pulling model '{model}': {e.error}")
-                        raise
-                    except Exception as pull_error:
-                        print(f"[ERROR] Failed to pull model '{model}'.")
-                        print(f"Please ensure Ollama is running and you have an internet connection.")
-                        print(f"You can also try pulling it manually: 'ollama pull {model}'")
-                        raise ValueError(f"Required model '{model}' could not be pulled.") from pull_error
-        except ResponseError as e:
-            print(f"[ERROR] Ollama API Error: {e.error}")
-            print("[INFO] Please ensure the Ollama application is running and accessible.")
-            raise
-        except RequestError as e:
-            print(f"[ERROR] Ollama Request Error: {e.error}")
-            print("[INFO] Please ensure the Ollama application is running and accessible.")
-            raise
+            data = await asyncio.shield(prepared)
         except Exception as e:
-            print(f"[ERROR] Failed to connect to Ollama or list models: {e}")
-            print("[INFO] Please ensure the Ollama application is running and accessible.")
-            raise
+            self._prepared_images.pop(key, None)
+            print(f"[ERROR] Could not prepare the screenshot for the vision model: {e}. Sending the original.")
+            return {"type": "image_url", "image_url": {"url": f"data:image/png;base64,{encoded_image}"}}
+
+        if new_encode:
+            # Approximate decoded sizes; base64 carries 3 bytes in every 4 characters.
+            original_bytes, sent_bytes = len(encoded_image) * 3 // 4, len(data) * 3 // 4
+            self.image_stats["original_bytes"] += original_bytes
+            self.image_stats["sent_bytes"] += sent_bytes
+            print(f"[VISION] Prepared screenshot: {original_bytes // 1024} KB -> {sent_bytes // 1024} KB "
+                  f"({image_format}, max {max_size}px{', cropped' if region else ''}).")
+        return {"type": "image_url", "image_url": {"url": f"data:{VISION_MIME_TYPES[image_format]};base64,{data}"}}
+
+    @staticmethod
+    def response_json(response):
+        """
+        Returns the JSON object of a response, as parsed while it streamed in, or by
+        scanning the text for models that don't stream (e.g. the mock model).
+        """
+        message = response.generations[0][0].message
+        parsed = message.additional_kwargs.get("parsed_json")
+        if parsed is None:
+            parsed = extract_json_object(message.content)
+        return parsed
+
+    async def _generate_structured(self, call_type: str, model: BaseChatModel, messages: List[BaseMessage],
+                                   schema: type[BaseModel], max_repairs: Optional[int] = None, hedge: bool = False) -> Optional[dict]:
+        """
+        Asks for JSON that matches `schema`, with the schema passed to Ollama as `format` so
+        generation is constrained to it. An invalid answer is sent back with the validation
+        errors for at most `max_repairs` more attempts. Returns the validated dict, or None.
+        """
+        if max_repairs is None:
+            max_repairs = config.get_setting('STRUCTURED_OUTPUT_REPAIRS', 1)
+        stats = self.parse_stats.setdefault(call_type, {"calls": 0, "attempts": 0, "parse_failures": 0, "repaired": 0, "gave_up": 0})
+        stats["calls"] += 1
+        model_stats = self.model_parse_stats.setdefault(model.model_name, {"attempts": 0, "failures": 0})
+        messages = list(messages)
+        for attempt in range(max_repairs + 1):
+            stats["attempts"] += 1
+            model_stats["attempts"] += 1
+            response = await model.agenerate(messages=[messages], stop_at_json=True, format=schema.model_json_schema(),
+                                             call_type=CALL_ROLES.get(call_type, call_type), hedge=hedge)
+            raw = self.response_json(response)
+            try:
+                result = schema.model_validate(raw).model_dump()
+                if attempt:
+                    stats["repaired"] += 1
+                return result
+            except ValidationError as e:
+                stats["parse_failures"] += 1
+                model_stats["failures"] += 1
+                errors = "; ".join(f"{'.'.join(str(loc) for loc in err['loc']) or 'response'}: {err['msg']}" for err in e.errors())
+                print(f"[ERROR] Invalid {call_type} response (attempt {attempt + 1}/{max_repairs + 1}): {errors}")
+                messages += [
+                    AIMessage(content=response.generations[0][0].message.content),
+                    HumanMessage(content=f"That response was not valid: {errors}. Reply with only the corrected JSON object."),
+                ]
+        stats["gave_up"] += 1
+        return None
+
+    def get_parse_stats(self) -> Dict[str, Dict[str, Any]]:
+        """Structured output failure rate (failed attempts / attempts) per call type."""
+        return {
+            call_type: dict(stats, failure_rate=round(stats["parse_failures"] / max(1, stats["attempts"]), 3))
+            for call_type, stats in self.parse_stats.items()
+        }
+
+    async def _cascaded(self, call_type: str, large_model_name: str, fast_messages: List[BaseMessage],
+                        fast_schema: type[BaseModel], accept, escalate):
+        """
+        Cascade mode: the fast model answers `fast_messages` first, and `accept` turns its
+        answer into the result, or returns None when the answer is not confident enough.
+        Only then, or when the answer does not match `fast_schema`, is `escalate()` awaited
+        for the large model's answer.
+        """
+        if not config.get_setting('MODEL_CASCADE', True) or self.fast_model_name == large_model_name:
+            return await escalate()
+
+        stats = self.cascade_stats.setdefault(call_type, {
+            "calls": 0, "accepted": 0, "escalated": 0, "schema_failures": 0, "low_confidence": 0,
+            "fast_time": 0.0, "escalated_time": 0.0,
+        })
+        stats["calls"] += 1
+        start_time = time.monotonic()
+        result = await self._generate_structured(f"{call_type}_fast", self.fast_model, fast_messages, fast_schema, max_repairs=0)
+        stats["fast_time"] += time.monotonic() - start_time
+        if result is None:
+            stats["schema_failures"] += 1
+            reason = "invalid answer"
+        else:
+            accepted = accept(result)
+            if accepted is not None:
+                stats["accepted"] += 1
+                return accepted
+            stats["low_confidence"] += 1
+            reason = f"confidence below {config.get_setting('CASCADE_CONFIDENCE_THRESHOLD', 0.75)}"
+
+        stats["escalated"] += 1
+        print(f"[CASCADE] Escalating {call_type} from '{self.fast_model_name}' to '{large_model_name}' ({reason}).")
+        start_time = time.monotonic()
+        result = await escalate()
+        stats["escalated_time"] += time.monotonic() - start_time
+        return result
+
+    @staticmethod
+    def _confident(action: dict) -> bool:
+        return (action.get("confidence_score") or 0.0) >= config.get_setting('CASCADE_CONFIDENCE_THRESHOLD', 0.75)
+
+    def get_cascade_stats(self) -> Dict[str, Dict[str, Any]]:
+        """
+        Escalation rate and time per cascaded call type. The time saved is estimated from the
+        large model's mean time on escalated calls, minus everything spent on the fast model.
+        """
+        summary = {}
+        for call_type, stats in self.cascade_stats.items():
+            large_mean = stats["escalated_time"] / stats["escalated"] if stats["escalated"] else None
+            summary[call_type] = dict(
+                stats,
+                fast_time=round(stats["fast_time"], 3),
+                escalated_time=round(stats["escalated_time"], 3),
+                escalation_rate=round(stats["escalated"] / max(1, stats["calls"]), 3),
+                estimated_time_saved=(round(stats["accepted"] * large_mean - stats["fast_time"], 3)
+                                      if large_mean is not None else None),
+            )
+        return summary
 
     async def generate_and_set_dynamic_constitutions(self, objective: str):
         """
@@ -205,26 +625,30 @@ class AIModel:
         # User's Objective
         "{objective}"
         """
+        # Objectives that differ only in quoted values, numbers or URLs get the same constitutions.
+        template = normalize_objective(objective)
+        cache_key = self.constitution_cache.make_key(
+            template, self.supervisor_model_name, hashlib.sha1(SUPERVISOR_CONSTITUTION.encode("utf-8")).hexdigest()
+        )
+        cached = self.constitution_cache.get(cache_key)
+        if cached is not None:
+            self.agent_constitution = cached["agent_constitution"]
+            self.action_constitution = cached["action_constitution"]
+            print(f"[CACHE] Reusing the constitutions generated for objectives like '{template}'.")
+            return
+
         print("[INFO] Generating dynamic constitution...")
         messages = [HumanMessage(content=prompt)]
 
         try:
-            response = await self.supervisor_model.agenerate(messages=[messages])
-            response_text = response.generations[0][0].message.content
-
-            json_match = re.search(r"```json\s*({{.*?}})\s*```|({{.*}})", response_text, re.DOTALL)
-            if not json_match:
-                raise ValueError("No valid JSON block found in the supervisor's response.")
+            constitutions = await self._generate_structured("constitution", self.supervisor_model, messages, DynamicConstitutions)
+            if constitutions is None:
+                raise ValueError("The supervisor did not return valid constitutions.")
+            self.constitution_cache.put(cache_key, template, constitutions)
 
-            json_str = json_match.group(1) or json_match.group(2)
-            constitutions = json.loads(json_str.strip())
-
-            if "agent_constitution" in constitutions and "action_constitution" in constitutions:
-                self.agent_constitution = constitutions["agent_constitution"]
-                self.action_constitution = constitutions["action_constitution"]
-                print("[INFO] Dynamic constitutions generated and set successfully.")
-            else:
-                raise ValueError("Generated constitution is missing required keys.")
+            self.agent_constitution = constitutions["agent_constitution"]
+            self.action_constitution = constitutions["action_constitution"]
+            print("[INFO] Dynamic constitutions generated and set successfully.")
 
         except Exception as e:
             print(f"[ERROR] Failed to generate dynamic constitutions: {e}. Falling back to default.")
@@ -232,37 +656,48 @@ class AIModel:
             self.agent_constitution = AGENT_CONSTITUTION
             self.action_constitution = ACTION_CONSTITUTION
 
-    def update_models_based_on_objective(self, objective: str):
+    def update_models_based_on_objective(self, objective: str, domain: str = ""):
+        """
+        Picks the main, supervisor, fast and vision models from how models did on similar past
+        runs, within each role's latency budget. Roles without enough history keep their model.
+        """
         if not config.ENABLE_DYNAMIC_MODEL_SELECTION:
             return
 
-        objective_lower = objective.lower()
-        task_mapping = config.TASK_MODEL_MAPPING
-        selected_map = task_mapping.get("default", {})
-
-        for keyword, model_map in task_mapping.items():
-            if keyword in objective_lower:
-                selected_map = model_map
-                break
-
-        print(f"[INFO] Dynamic model selection activated. Using mapping for: '{keyword}'")
-
-        # Update model names
-        self.main_model_name = selected_map.get("MAIN_MODEL", self.main_model_name)
-        self.supervisor_model_name = selected_map.get("SUPERVISOR_MODEL", self.supervisor_model_name)
-        self.fast_model_name = selected_map.get("FAST_MODEL", self.fast_model_name)
-        self.vision_model_name = selected_map.get("VISION_MODEL", self.vision_model_name)
-
-        # Re-initialize the models with the new names
-        self.main_model = OllamaChatModel(model_name=self.main_model_name)
-        self.supervisor_model = OllamaChatModel(model_name=self.supervisor_model_name)
-        self.fast_model = OllamaChatModel(model_name=self.fast_model_name)
-        self.vision_model = OllamaChatModel(model_name=self.vision_model_name)
-
-        print(f"[INFO] Models updated: Main='{self.main_model_name}', Supervisor='{self.supervisor_model_name}', Fast='{self.fast_model_name}', Vision='{self.vision_model_name}'")
+        budgets = config.get_setting('MODEL_LATENCY_BUDGET') or {}
+        for role in ("main", "supervisor", "fast", "vision"):
+            attribute = f"{role}_model_name"
+            setattr(self, attribute, self.model_selector.select(
+                role, getattr(self, attribute), objective, domain, budgets.get(role),
+                min_runs=config.get_setting('MODEL_SELECTION_MIN_RUNS', 2),
+                min_success_rate=config.get_setting('MODEL_SELECTION_MIN_SUCCESS_RATE', 0.5),
+                min_parse_rate=config.get_setting('MODEL_SELECTION_MIN_PARSE_RATE', 0.8),
+            ))
+
+        print(f"[INFO] Models selected: Main='{self.main_model_name}', Supervisor='{self.supervisor_model_name}', Fast='{self.fast_model_name}', Vision='{self.vision_model_name}'")
+
+    def record_run_outcome(self, objective: str, domain: str, success: bool):
+        """Adds this run's per-model latency, parse rate and outcome to the selection history."""
+        models = {}
+        for role, model in self._models.items():
+            if not model.call_stats:
+                continue
+            # Load time depends on what else was loaded, so only inference time counts. Calls
+            # without Ollama metrics are only used when no call has them.
+            calls = [c for c in model.call_stats if c.get("load_time") is not None] or model.call_stats
+            inference_time = sum(c["total_time"] - (c.get("load_time") or 0) for c in calls)
+            parse = self.model_parse_stats.get(model.model_name, {})
+            models[role] = {
+                "model": model.model_name,
+                "calls": len(calls),
+                "mean_latency": inference_time / len(calls),
+                "parse_attempts": parse.get("attempts", 0),
+                "parse_failures": parse.get("failures", 0),
+            }
+        self.model_selector.record_run(objective, domain, success, models)
 
 
-    async def get_contextual_overview(self, encoded_image: str) -> str:
+    async def get_contextual_overview(self, encoded_image: str, region: Optional[Dict] = None) -> str:
         """
         Given a screenshot (no labels), return a one-sentence summary of the page's main state.
         This focuses on identifying the most prominent feature, like a pop-up.
@@ -278,14 +713,14 @@ class AIModel:
             HumanMessage(
                 content=[
                     {"type": "text", "text": prompt},
-                    {"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{encoded_image}"}},
+                    await self._image_content(encoded_image, region),
                 ]
             )
         ]
-        response = await self.vision_model.agenerate(messages=[messages])
+        response = await self.vision_model.agenerate(messages=[messages], call_type="vision-tool")
         return response.generations[0][0].message.content.strip()
 
-    async def analyze_layout(self, encoded_image: str, question: str) -> str:
+    async def analyze_layout(self, encoded_image: str, question: str, region: Optional[Dict] = None) -> str:
         """
         Given a screenshot and a question about the layout, return a textual answer.
         """
@@ -300,14 +735,14 @@ class AIModel:
             HumanMessage(
                 content=[
                     {"type": "text", "text": prompt},
-                    {"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{encoded_image}"}},
+                    await self._image_content(encoded_image, region),
                 ]
             )
         ]
-        response = await self.vision_model.agenerate(messages=[messages])
+        response = await self.vision_model.agenerate(messages=[messages], call_type="vision-tool")
         return response.generations[0][0].message.content.strip()
 
-    async def get_page_description(self, encoded_image, labeled_elements):
+    async def get_page_description(self, encoded_image, labeled_elements, region=None):
         element_texts = []
         for i, element in enumerate(labeled_elements):
             try:
@@ -332,20 +767,41 @@ Labeled elements provided:
             HumanMessage(
                 content=[
                     {"type": "text", "text": prompt},
-                    {"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{encoded_image}"}},
+                    await self._image_content(encoded_image, region),
                 ]
             )
         ]
-        response = await self.vision_model.agenerate(messages=[messages])
+        response = await self.vision_model.agenerate(messages=[messages], call_type="vision-tool")
         return response.generations[0][0].message.content.strip()
 
 
-    async def validate_action(self, objective: str, page_summary: str, proposed_action_json: dict) -> bool:
+    async def validate_action(self, objective: str, page_summary: str, proposed_action_json: dict,
+                              page_state: Optional[tuple] = None) -> bool:
         """
-        Uses a fast model to perform a "sanity check" on the proposed action.
+        Uses a fast model to perform a "sanity check" on the proposed action. Confident and
+        read-only actions are not checked. Verdicts are reused for the same action on the
+        same page state (see ObservationCache.current_state); without one nothing is cached.
         """
+        tool_name = proposed_action_json.get("tool")
+        confidence_score = proposed_action_json.get("confidence_score") or 0.0
+        if tool_name in config.get_setting('VALIDATION_SKIP_TOOLS', []):
+            self.validation_cache.stats["skipped_read_only"] += 1
+            print(f"[VALIDATION] Skipping validation of read-only tool '{tool_name}'.")
+            return True
+        if confidence_score >= config.get_setting('VALIDATION_SKIP_CONFIDENCE', 0.9):
+            self.validation_cache.stats["skipped_confidence"] += 1
+            print(f"[VALIDATION] Skipping validation of '{tool_name}' at confidence {confidence_score}.")
+            return True
+
+        cache_key = None
+        if page_state is not None:
+            cache_key = self.validation_cache.make_key("validation", objective, page_state, canonical_action(proposed_action_json))
+            cached = self.validation_cache.get(cache_key)
+            if cached is not None:
+                print(f"[VALIDATION] Reusing cached verdict for {json.dumps(canonical_action(proposed_action_json))}: {cached}")
+                return cached
+
         prompt = f"""
-        You are a logical validator. Your answer must be a single word: either 'true' or 'false'.
         - Main Objective: "{objective}"
         - Current page summary: "{page_summary}"
         - Proposed Action: {json.dumps(proposed_action_json)}
@@ -353,31 +809,58 @@ Labeled elements provided:
         Based on the objective and the page summary, is the proposed action a logical next step?
         """
         messages = [
+            SystemMessage(content=VALIDATOR_INSTRUCTIONS),
             HumanMessage(content=prompt)
         ]
-        response = await self.fast_model.agenerate(messages=[messages])
-        decision = response.generations[0][0].message.content.strip().lower()
+        # A validator answer is cheaper to redo than to repair, so there is no repair round.
+        decision = await self._generate_structured("validation", self.fast_model, messages, ValidationDecision, max_repairs=0, hedge=True)
+        if decision is None:
+            # Nothing was decided, so nothing is cached: ask again, this time with repair rounds.
+            print("[VALIDATION] No valid verdict from the fast path. Validating again without the cache.")
+            decision = await self._generate_structured("validation", self.fast_model, messages, ValidationDecision)
+            print(f"[VALIDATION] AI proposed action: {json.dumps(proposed_action_json)}. Validator response: {decision}")
+            if decision is None:
+                print(f"[VALIDATION] Not approving '{tool_name}': the validator's verdict could not be parsed.")
+                return False
+            return decision["valid"]
+        if cache_key is not None:
+            self.validation_cache.put(cache_key, decision["valid"])
         print(f"[VALIDATION] AI proposed action: {json.dumps(proposed_action_json)}. Validator response: {decision}")
-        return "true" in decision
+        return decision["valid"]
 
     async def verify_action_with_details(self, action_description: str, element_details: dict) -> bool:
         """
         Uses the fast model to verify if an element's details match the intended action.
         """
+        cache_key = self.validation_cache.make_key("verification", action_description, element_details)
+        cached = self.validation_cache.get(cache_key)
+        if cached is not None:
+            print(f"[VERIFICATION] Reusing cached verdict for '{action_description}': {cached}")
+            return cached
+
         prompt = f"""
-        You are a logical validator. Your answer must be a single word: either 'true' or 'false'.
         - Intended Action: "{action_description}"
         - Element Details: {json.dumps(element_details)}
 
         Based on the element's details, does this element seem appropriate for the intended action?
         """
         messages = [
+            SystemMessage(content=VALIDATOR_INSTRUCTIONS),
             HumanMessage(content=prompt)
         ]
-        response = await self.fast_model.agenerate(messages=[messages])
-        decision = response.generations[0][0].message.content.strip().lower()
+        decision = await self._generate_structured("verification", self.fast_model, messages, ValidationDecision, max_repairs=0, hedge=True)
+        if decision is None:
+            # Nothing was decided, so nothing is cached: ask again, this time with repair rounds.
+            print("[VERIFICATION] No valid verdict from the fast path. Verifying again without the cache.")
+            decision = await self._generate_structured("verification", self.fast_model, messages, ValidationDecision)
+            print(f"[VERIFICATION] Action: '{action_description}', Details: {json.dumps(element_details)}. Verifier response: {decision}")
+            if decision is None:
+                print(f"[VERIFICATION] Not verifying '{action_description}': the verifier's verdict could not be parsed.")
+                return False
+            return decision["valid"]
+        self.validation_cache.put(cache_key, decision["valid"])
         print(f"[VERIFICATION] Action: '{action_description}', Details: {json.dumps(element_details)}. Verifier response: {decision}")
-        return "true" in decision
+        return decision["valid"]
 
     async def get_self_critique(self, session_log):
         prompt = f"""
@@ -410,9 +893,16 @@ Labeled elements provided:
         messages = [
             HumanMessage(content=prompt)
         ]
-        response = await self.fast_model.agenerate(messages=[messages])
+        response = await self.fast_model.agenerate(messages=[messages], call_type="critique")
         return response.generations[0][0].message.content.strip()
 
+    async def get_batch_self_critique(self, session_logs: List[str]) -> str:
+        """One self-critique covering several runs that finished close together, in a single call."""
+        if len(session_logs) == 1:
+            return await self.get_self_critique(session_logs[0])
+        combined = "\n".join(f'<run index="{i + 1}">{log}</run>' for i, log in enumerate(session_logs))
+        return await self.get_self_critique(combined)
+
     async def get_strategic_plan(self, objective, history, page_description, self_critique, last_error=None):
         """First step of the cognitive cycle - generates high-level plan based on structured page data."""
         error_context = ""
@@ -424,8 +914,6 @@ You must learn from this mistake and create a new plan that avoids this error.
 """
 
         prompt = f"""
-        {self.agent_constitution}
-
         # Main Objective
         Your overall objective is: "{objective}".
         
@@ -444,33 +932,33 @@ You must learn from this mistake and create a new plan that avoids this error.
         Follow your cognitive cycle. Respond with a single JSON object containing "reflection", "world_model", and "plan".
         """
         
+        # The constitution is the same on every step, so it goes in the system message where
+        # Ollama can reuse its evaluated prefix; only the per-step context follows it.
         messages = [
+            SystemMessage(content=self.agent_constitution),
             HumanMessage(content=prompt)
         ]
-        text_model = self.main_model # if "llava" not in self.main_model_name else self.fast_model
-        
-        response = await text_model.agenerate(messages=[messages])
-        response_text = response.generations[0][0].message.content
-
-        try:
-            json_match = re.search(r"```json\s*({{.*?}})\s*```|({{.*}})", response_text, re.DOTALL)
-            if not json_match:
-                raise ValueError("No valid JSON block found in the AI's response for the plan.")
-            json_str = json_match.group(1) or json_match.group(2)
-            return json.loads(json_str.strip())
-        except Exception as e:
-            print(f"[ERROR] Failed to parse strategic plan: {e}")
+        fast_messages = [
+            SystemMessage(content=self.agent_constitution),
+            HumanMessage(content=prompt + '\n        Also include "confidence_score", from 0.0 to 1.0: how sure you are that the plan is right.'),
+        ]
+        strategic_plan = await self._cascaded(
+            "plan", self.main_model_name, fast_messages, ScoredStrategicPlan,
+            accept=lambda plan: StrategicPlan.model_validate(plan).model_dump() if self._confident(plan) else None,
+            escalate=lambda: self._generate_structured("plan", self.main_model, messages, StrategicPlan),
+        )
+        if strategic_plan is None:
+            print("[ERROR] Failed to get a valid strategic plan.")
             return {
                 "reflection": "Error parsing the strategic plan.",
                 "world_model": "Failed to generate valid plan. Need to retry.",
                 "plan": ["Re-evaluate the page"],
             }
+        return strategic_plan
 
-    async def get_tactical_action(self, plan, encoded_image, page_description):
+    async def get_tactical_action(self, plan, encoded_image, page_description, region=None):
         """Second step of the cognitive cycle - generates specific action based on plan."""
         prompt = f"""
-        {self.action_constitution}
-
         # High-Level Plan
         {json.dumps(plan, indent=2)}
 
@@ -482,39 +970,81 @@ You must learn from this mistake and create a new plan that avoids this error.
         If your confidence_score for the primary action is below 0.7, you MUST also include a 'potential_actions' key, which is a list of up to 3 other distinct and reasonable actions you could take.
         """
 
+        action_json = await self._cascaded(
+            "tactical", self.vision_model_name, self._text_only_messages(prompt), TacticalAction,
+            accept=lambda action: action if self._confident(action) else None,
+            escalate=lambda: self._generate_tactical("tactical", prompt, encoded_image, region, TacticalAction),
+        )
+        if action_json is None:
+            print("[ERROR] Failed to get a valid tactical action.")
+            return {
+                "tool": "pause_for_user",
+                "params": {"instruction_to_user": "Failed to generate valid action. Will retry."},
+                "confidence_score": 0.0,
+                "thought": "I encountered an error while trying to parse the tactical action from my own response.",
+                "potential_actions": []
+            }
+        return action_json
+
+    async def get_tactical_actions(self, plan, encoded_image, page_description, region=None) -> List[dict]:
+        """
+        Turns every step of the plan into an action in a single vision call, so the screenshot
+        and page description are sent once per plan instead of once per step. Returns the
+        actions in plan order (possibly fewer than the steps), or an empty list on failure.
+        """
+        prompt = f"""
+        # High-Level Plan
+        {json.dumps(plan, indent=2)}
+
+        # Current Screen Description (for context)
+        {page_description}
+
+        # Your Task
+        Generate one executable JSON action object for EACH step of the plan, in order, assuming the earlier actions succeed.
+        Give every action its own confidence_score. Later steps may act on elements that are not on the screen yet; lower their confidence accordingly.
+        If the confidence_score of an action is below 0.7, that action MUST also include a 'potential_actions' list of up to 3 other distinct and reasonable actions.
+        Respond with a single JSON object of the form {{"actions": [<action>, ...]}}.
+        """
+
+        def confident_prefix(action_plan):
+            # The leading confident actions are kept; the agent asks again for the steps after them.
+            actions = []
+            for action in action_plan["actions"][:len(plan)]:
+                if not self._confident(action):
+                    break
+                actions.append(action)
+            return {"actions": actions} if actions else None
+
+        action_plan = await self._cascaded(
+            "tactical_batch", self.vision_model_name, self._text_only_messages(prompt), TacticalActionPlan,
+            accept=confident_prefix,
+            escalate=lambda: self._generate_tactical("tactical_batch", prompt, encoded_image, region, TacticalActionPlan),
+        )
+        if action_plan is None:
+            print("[ERROR] Failed to get valid tactical actions for the plan.")
+            return []
+        return action_plan["actions"][:len(plan)]
+
+    async def _generate_tactical(self, call_type: str, prompt: str, encoded_image: str, region: Optional[Dict],
+                                 schema: type[BaseModel]) -> Optional[dict]:
+        """Asks the vision model, with the screenshot, for tactical JSON matching `schema`."""
         messages = [
+            SystemMessage(content=self.action_constitution),
             HumanMessage(
                 content=[
                     {"type": "text", "text": prompt},
-                    {"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{encoded_image}"}},
+                    await self._image_content(encoded_image, region),
                 ]
             )
         ]
-        response = await self.vision_model.agenerate(messages=[messages])
-        response_text = response.generations[0][0].message.content
+        return await self._generate_structured(call_type, self.vision_model, messages, schema)
 
-        try:
-            json_match = re.search(r"```json\s*({{.*?}})\s*```|({{.*}})", response_text, re.DOTALL)
-            if not json_match:
-                raise ValueError("No valid JSON action found")
-            json_str = json_match.group(1) or json_match.group(2)
-            action_json = json.loads(json_str.strip())
-
-            # Ensure potential_actions is a list if it exists, otherwise default to empty list
-            if 'potential_actions' in action_json and not isinstance(action_json['potential_actions'], list):
-                action_json['potential_actions'] = []
-
-            return action_json
-
-        except Exception as e:
-            print(f"[ERROR] Failed to parse tactical action: {e}")
-            return {
-                "tool": "pause_for_user",
-                "params": {"instruction_to_user": "Failed to generate valid action. Will retry."},
-                "confidence_score": 0.0,
-                "thought": "I encountered an error while trying to parse the tactical action from my own response.",
-                "potential_actions": []
-            }
+    def _text_only_messages(self, prompt: str) -> List[BaseMessage]:
+        """The tactical messages without the screenshot, for the fast model in cascade mode."""
+        return [
+            SystemMessage(content=self.action_constitution),
+            HumanMessage(content=f"{prompt}\n        {TEXT_ONLY_NOTE}"),
+        ]
 
     async def generate_macro_script(self, objective: str, tool_definitions: str, tool_name: str, class_name: str) -> str:
         """
@@ -543,7 +1073,7 @@ Generated Python script:
         messages = [
             HumanMessage(content=prompt)
         ]
-        response = await self.scripter_model.agenerate(messages=[messages])
+        response = await self.scripter_model.agenerate(messages=[messages], call_type="scripter")
         response_text = response.generations[0][0].message.content.strip()
 
         # Extract the python script from the response
@@ -590,7 +1120,7 @@ Generated Python script:
         messages = [
             HumanMessage(content=prompt)
         ]
-        response = await self.scripter_model.agenerate(messages=[messages])
+        response = await self.scripter_model.agenerate(messages=[messages], call_type="scripter")
         response_text = response.generations[0][0].message.content.strip()
 
         # Extract the python script from the response
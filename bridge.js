@@ -56,6 +56,214 @@
         return path;
     }
 
+    // Every response echoes the request_id of the command it answers so the
+    // backend can match it to the right pending request, and carries the current
+    // page revision so the backend can tell whether its last observation is stale.
+    function reply(event, request, payload) {
+        socket.emit(event, { page_revision: currentPageRevision(), ...payload, request_id: request && request.request_id });
+    }
+
+    // --- Interactive Element Registry ---
+    // The registry is kept up to date by a MutationObserver (elements added, removed or
+    // modified) and an IntersectionObserver (elements entering or leaving the viewport),
+    // so an observation only measures elements that are on screen and only re-reads the
+    // attributes of elements that changed. The backend receives deltas against the
+    // version it last acknowledged.
+
+    const INTERACTIVE_SELECTOR =
+        "a, button, input, textarea, select, [role='button'], [role='link'], " +
+        "[role='tab'], [role='checkbox'], [role='menuitem'], [role='option'], [role='switch']";
+
+    const bridgeSession = `${Date.now().toString(36)}-${Math.random().toString(36).slice(2, 10)}`;
+    const registry = new Map();          // element -> { label, dirty, attrs }
+    const labelToElement = new Map();    // label -> element
+    const intersecting = new Set();      // elements currently intersecting the viewport
+    let nextLabel = 1;
+    let domVersion = 0;
+    // Bumped whenever the page changes in a way an observation would show: DOM
+    // mutations, form input and scrolling. Unlike domVersion it does not depend on
+    // the backend observing the page.
+    let pageRevision = 0;
+
+    function currentPageRevision() {
+        return `${bridgeSession}:${pageRevision}`;
+    }
+
+    // html2canvas adds and removes its own container while taking a screenshot.
+    function isScreenshotMutation(mutation) {
+        const nodes = [...mutation.addedNodes, ...mutation.removedNodes];
+        return mutation.type === 'childList' && nodes.length > 0 &&
+            nodes.every(node => node.classList && node.classList.contains('html2canvas-container'));
+    }
+    let sentState = new Map();           // label -> serialized element data last sent to the backend
+
+    const intersectionObserver = new IntersectionObserver((entries) => {
+        for (const entry of entries) {
+            if (entry.isIntersecting) {
+                intersecting.add(entry.target);
+            } else {
+                intersecting.delete(entry.target);
+            }
+        }
+    }, { threshold: [0, 1] });
+
+    function registerElement(el) {
+        if (registry.has(el)) {
+            return;
+        }
+        const label = nextLabel++;
+        registry.set(el, { label: label, dirty: true, attrs: null });
+        labelToElement.set(label, el);
+        intersectionObserver.observe(el);
+    }
+
+    function unregisterElement(el) {
+        const entry = registry.get(el);
+        if (!entry) {
+            return;
+        }
+        registry.delete(el);
+        labelToElement.delete(entry.label);
+        intersecting.delete(el);
+        intersectionObserver.unobserve(el);
+    }
+
+    function registerSubtree(node) {
+        if (node.nodeType !== 1) {
+            return;
+        }
+        if (node.matches(INTERACTIVE_SELECTOR)) {
+            registerElement(node);
+        }
+        node.querySelectorAll(INTERACTIVE_SELECTOR).forEach(registerElement);
+    }
+
+    function markDirty(node) {
+        const el = node && (node.nodeType === 1 ? node : node.parentElement);
+        const interactive = el && el.closest(INTERACTIVE_SELECTOR);
+        const entry = interactive && registry.get(interactive);
+        if (entry) {
+            entry.dirty = true;
+        }
+    }
+
+    const registryObserver = new MutationObserver((mutations) => {
+        for (const mutation of mutations) {
+            if (isScreenshotMutation(mutation)) {
+                continue;
+            }
+            pageRevision += 1;
+            if (mutation.type === 'childList') {
+                mutation.addedNodes.forEach(registerSubtree);
+                // Removed elements are swept lazily on the next observation (isConnected).
+                markDirty(mutation.target);
+            } else {
+                if (mutation.type === 'attributes' && mutation.target.nodeType === 1 && mutation.target.matches(INTERACTIVE_SELECTOR)) {
+                    registerElement(mutation.target);
+                }
+                markDirty(mutation.target);
+            }
+        }
+    });
+
+    registerSubtree(document.documentElement);
+    registryObserver.observe(document.documentElement, {
+        childList: true, subtree: true, characterData: true, attributes: true,
+        // Only attributes that change what the agent is told about an element, or whether it
+        // is interactive. Visibility changes are tracked by the IntersectionObserver.
+        attributeFilter: ['role', 'aria-label', 'name', 'href', 'value', 'type', 'disabled', 'hidden']
+    });
+    // Form values are properties, not attributes, so the MutationObserver misses them.
+    document.addEventListener('input', (event) => { pageRevision += 1; markDirty(event.target); }, { capture: true });
+    document.addEventListener('change', (event) => { pageRevision += 1; markDirty(event.target); }, { capture: true });
+    window.addEventListener('scroll', () => { pageRevision += 1; }, { passive: true });
+
+    function readAttributes(el, entry) {
+        if (entry.dirty || !entry.attrs) {
+            entry.attrs = {
+                tag: el.tagName.toLowerCase(),
+                aria_label: el.getAttribute('aria-label'),
+                name: el.name,
+                text: el.innerText,
+                value: el.value,
+                href: el.href, // Will be undefined for non-links, which is fine
+            };
+            entry.dirty = false;
+        }
+        return entry.attrs;
+    }
+
+    function collectVisibleElements() {
+        // Apply any intersection changes the browser has computed but not yet delivered.
+        for (const entry of intersectionObserver.takeRecords()) {
+            if (entry.isIntersecting) {
+                intersecting.add(entry.target);
+            } else {
+                intersecting.delete(entry.target);
+            }
+        }
+        for (const el of Array.from(registry.keys())) {
+            if (!el.isConnected) {
+                unregisterElement(el);
+            }
+        }
+
+        const current = new Map();
+        for (const el of intersecting) {
+            const rect = el.getBoundingClientRect();
+            // Filter out invisible, zero-size or partially visible elements
+            if (rect.width > 0 && rect.height > 0 && rect.top >= 0 && rect.left >= 0 && rect.bottom <= window.innerHeight && rect.right <= window.innerWidth) {
+                const entry = registry.get(el);
+                current.set(entry.label, {
+                    label: entry.label,
+                    box: { x: rect.x, y: rect.y, width: rect.width, height: rect.height },
+                    ...readAttributes(el, entry),
+                });
+            }
+        }
+        return current;
+    }
+
+    function buildElementDelta(sinceVersion, session) {
+        const current = collectVisibleElements();
+        const serialized = new Map();
+        current.forEach((element, label) => serialized.set(label, JSON.stringify(element)));
+
+        const baseVersion = domVersion;
+        const full = session !== bridgeSession || sinceVersion !== domVersion;
+        const delta = { session: bridgeSession, base_version: baseVersion, version: domVersion + 1, full: full };
+
+        if (full) {
+            delta.elements = Array.from(current.values());
+        } else {
+            delta.added = [];
+            delta.changed = [];
+            delta.removed = [];
+            current.forEach((element, label) => {
+                if (!sentState.has(label)) {
+                    delta.added.push(element);
+                } else if (sentState.get(label) !== serialized.get(label)) {
+                    delta.changed.push(element);
+                }
+            });
+            sentState.forEach((_, label) => {
+                if (!current.has(label)) {
+                    delta.removed.push(label);
+                }
+            });
+        }
+
+        domVersion += 1;
+        sentState = serialized;
+
+        // Labels the agent can act on are the ones it was just shown.
+        window.labeledElements = {};
+        current.forEach((_, label) => {
+            window.labeledElements[label] = labelToElement.get(label);
+        });
+        return delta;
+    }
+
     // --- Event Recording ---
 
     function recordEvent(event) {
@@ -115,110 +323,99 @@
         try {
             console.log(`[Bridge] Navigating to: ${data.url}`);
             window.location.href = data.url;
-            // The 'load' event on the iframe in renderer.js will handle reinjection.
-            // No explicit success message needed as the page will reload.
+            // The 'load' event on the iframe in renderer.js will handle reinjection, and the
+            // bridge injected into the new page announces 'navigation_complete'.
         } catch (error) {
             console.error('[Bridge] Goto failed:', error);
-            socket.emit('action_response', { success: false, error: error.message, action: 'goto' });
+            socket.emit('navigation_complete', {
+                tab_id: window.__agentTabId || null,
+                success: false,
+                error: error.message,
+                url: window.location.href
+            });
         }
     });
 
-    socket.on('click', (data) => {
-        try {
-            console.log(`[Bridge] Clicking element with label: ${data.label}`);
-            const element = window.labeledElements[data.label];
-            if (!element) {
-                throw new Error(`Element with label ${data.label} not found.`);
-            }
-            element.click();
-            socket.emit('action_response', { success: true, action: 'click' });
-        } catch (error) {
-            console.error('[Bridge] Click failed:', error);
-            socket.emit('action_response', { success: false, error: error.message, action: 'click' });
+    // Performs one click/type/select/scroll command. Throws if it cannot be carried out.
+    function performAction(command) {
+        if (command.action === 'scroll') {
+            console.log(`[Bridge] Scrolling: ${command.direction}`);
+            const scrollAmount = command.direction === 'down' ? window.innerHeight : -window.innerHeight;
+            window.scrollBy(0, scrollAmount);
+            return;
         }
-    });
-
-    socket.on('type', (data) => {
-        try {
-            console.log(`[Bridge] Typing in element with label: ${data.label}`);
-            const element = window.labeledElements[data.label];
-            if (!element) {
-                throw new Error(`Element with label ${data.label} not found.`);
-            }
-            element.value = data.text;
-            // Dispatch input event to ensure frameworks like React update their state
-            element.dispatchEvent(new Event('input', { bubbles: true, cancelable: true }));
-            element.dispatchEvent(new Event('change', { bubbles: true, cancelable: true }));
-            socket.emit('action_response', { success: true, action: 'type' });
-        } catch (error) {
-            console.error('[Bridge] Type failed:', error);
-            socket.emit('action_response', { success: false, error: error.message, action: 'type' });
+        const element = window.labeledElements[command.label];
+        if (!element) {
+            throw new Error(`Element with label ${command.label} not found.`);
         }
-    });
+        switch (command.action) {
+            case 'click':
+                console.log(`[Bridge] Clicking element with label: ${command.label}`);
+                element.click();
+                break;
+            case 'type':
+                console.log(`[Bridge] Typing in element with label: ${command.label}`);
+                element.value = command.text;
+                // Dispatch input event to ensure frameworks like React update their state
+                element.dispatchEvent(new Event('input', { bubbles: true, cancelable: true }));
+                element.dispatchEvent(new Event('change', { bubbles: true, cancelable: true }));
+                break;
+            case 'select':
+                console.log(`[Bridge] Selecting in element with label: ${command.label}`);
+                element.value = command.value;
+                // Dispatch change event to ensure frameworks like React update their state
+                element.dispatchEvent(new Event('change', { bubbles: true, cancelable: true }));
+                break;
+            default:
+                throw new Error(`Unsupported action '${command.action}'.`);
+        }
+    }
 
-    socket.on('select', (data) => {
-        try {
-            console.log(`[Bridge] Selecting in element with label: ${data.label}`);
-            const element = window.labeledElements[data.label];
-            if (!element) {
-                throw new Error(`Element with label ${data.label} not found.`);
+    for (const action of ['click', 'type', 'select', 'scroll']) {
+        socket.on(action, (data) => {
+            try {
+                performAction(data);
+                reply('action_response', data, { success: true, action: action });
+            } catch (error) {
+                console.error(`[Bridge] ${action} failed:`, error);
+                reply('action_response', data, { success: false, error: error.message, action: action });
             }
-            element.value = data.value;
-            // Dispatch change event to ensure frameworks like React update their state
-            element.dispatchEvent(new Event('change', { bubbles: true, cancelable: true }));
-            socket.emit('action_response', { success: true, action: 'select' });
-        } catch (error) {
-            console.error('[Bridge] Select failed:', error);
-            socket.emit('action_response', { success: false, error: error.message, action: 'select' });
-        }
-    });
+        });
+    }
 
-    socket.on('scroll', (data) => {
-        try {
-            console.log(`[Bridge] Scrolling: ${data.direction}`);
-            const scrollAmount = data.direction === 'down' ? window.innerHeight : -window.innerHeight;
-            window.scrollBy(0, scrollAmount);
-            socket.emit('action_response', { success: true, action: 'scroll' });
-        } catch (error) {
-            console.error('[Bridge] Scroll failed:', error);
-            socket.emit('action_response', { success: false, error: error.message, action: 'scroll' });
+    // Runs an ordered list of commands in one round trip, reporting the outcome of each
+    // step and stopping at the first failure unless stop_on_failure is false. A command
+    // that loads a new page ends this page, so it must be the last one in the batch.
+    socket.on('batch', async (data) => {
+        const commands = data.commands || [];
+        const stopOnFailure = data.stop_on_failure !== false;
+        const results = [];
+        console.log(`[Bridge] Running a batch of ${commands.length} commands.`);
+        for (let i = 0; i < commands.length; i++) {
+            const command = commands[i];
+            try {
+                performAction(command);
+                results.push({ index: i, action: command.action, success: true });
+            } catch (error) {
+                console.error(`[Bridge] Batch step ${i} (${command.action}) failed:`, error);
+                results.push({ index: i, action: command.action, success: false, error: error.message });
+                if (stopOnFailure) {
+                    break;
+                }
+            }
+            // Let the page's own handlers react before the next step.
+            await new Promise(resolve => setTimeout(resolve, 0));
         }
+        const success = results.length === commands.length && results.every(result => result.success);
+        reply('batch_response', data, { success: success, results: results });
     });
 
-    socket.on('get_observation', async () => {
+    socket.on('get_observation', async (data) => {
         console.log('[Bridge] Received get_observation request.');
         try {
-            // Reset labeled elements
-            window.labeledElements = {};
-
-            // 1. Get interactive elements
-            const interactiveElements = Array.from(document.querySelectorAll(
-                "a, button, input, textarea, select, [role='button'], [role='link'], " +
-                "[role='tab'], [role='checkbox'], [role='menuitem'], [role='option'], [role='switch']"
-            ));
-
-            const elementsData = interactiveElements
-                .map((el, index) => {
-                    const rect = el.getBoundingClientRect();
-                    // Filter out invisible or zero-size elements
-                    if (rect.width > 0 && rect.height > 0 && rect.top >= 0 && rect.left >= 0 && rect.bottom <= window.innerHeight && rect.right <= window.innerWidth) {
-                        const label = index + 1;
-                        window.labeledElements[label] = el; // Store element with its label
-                        return {
-                            label: label,
-                            selector: getSelector(el),
-                            box: { x: rect.x, y: rect.y, width: rect.width, height: rect.height },
-                            tag: el.tagName.toLowerCase(),
-                            aria_label: el.getAttribute('aria-label'),
-                            name: el.name,
-                            text: el.innerText,
-                            value: el.value,
-                            href: el.href, // Will be undefined for non-links, which is fine
-                        };
-                    }
-                    return null;
-                })
-                .filter(Boolean); // Filter out nulls
+            // 1. Get the interactive elements that changed since the backend's version
+            const revision = currentPageRevision();
+            const delta = buildElementDelta(data && data.since_version, data && data.session);
 
             // 2. Take screenshot with html2canvas
             const canvas = await html2canvas(document.body, {
@@ -230,30 +427,66 @@
                 windowWidth: document.documentElement.offsetWidth,
                 windowHeight: document.documentElement.offsetHeight
             });
-            const screenshot = canvas.toDataURL('image/png').split(',')[1];
+            // Send the encoded PNG as a binary attachment instead of a base64 data URL.
+            const blob = await new Promise((resolve, reject) => {
+                canvas.toBlob(b => b ? resolve(b) : reject(new Error('Failed to encode screenshot.')), 'image/png');
+            });
+            const screenshot = await blob.arrayBuffer();
+            // The visible part of the page, in canvas pixels. The canvas starts at the body's
+            // top-left corner and is scaled by the device pixel ratio.
+            const bodyRect = document.body.getBoundingClientRect();
+            const scale = bodyRect.width ? canvas.width / bodyRect.width : 1;
+            const viewport = {
+                x: -bodyRect.left * scale,
+                y: -bodyRect.top * scale,
+                width: window.innerWidth * scale,
+                height: window.innerHeight * scale
+            };
 
             // 3. Send data back
-            console.log(`[Bridge] Sending observation data to backend (${elementsData.length} elements found).`);
-            socket.emit('observation_response', {
+            const changeCount = delta.full ? delta.elements.length : delta.added.length + delta.changed.length + delta.removed.length;
+            console.log(`[Bridge] Sending observation v${delta.version} to backend (${delta.full ? 'full' : 'delta'}, ${changeCount} elements).`);
+            reply('observation_response', data, {
                 success: true,
                 screenshot: screenshot,
-                elements: elementsData
+                // The revision the observation shows; later changes make it stale.
+                page_revision: revision,
+                viewport: viewport,
+                ...delta
             });
 
         } catch (error) {
             console.error('[Bridge] Get observation failed:', error);
-            socket.emit('observation_response', { success: false, error: error.message });
+            reply('observation_response', data, { success: false, error: error.message });
+        }
+    });
+
+    socket.on('get_selectors', (data) => {
+        try {
+            // Selectors are expensive (one querySelectorAll per ancestor), so they are
+            // only computed when the backend asks for specific labels.
+            const selectors = {};
+            for (const label of data.labels || []) {
+                const element = labelToElement.get(Number(label));
+                if (element) {
+                    selectors[label] = getSelector(element);
+                }
+            }
+            reply('selectors_response', data, { success: true, selectors: selectors });
+        } catch (error) {
+            console.error('[Bridge] Get selectors failed:', error);
+            reply('selectors_response', data, { success: false, error: error.message });
         }
     });
 
-    socket.on('get_page_content', () => {
+    socket.on('get_page_content', (data) => {
         try {
             console.log('[Bridge] Received get_page_content request.');
             const pageText = document.body.innerText;
-            socket.emit('page_content_response', { success: true, text: pageText });
+            reply('page_content_response', data, { success: true, text: pageText });
         } catch (error) {
             console.error('[Bridge] Get page content failed:', error);
-            socket.emit('page_content_response', { success: false, error: error.message });
+            reply('page_content_response', data, { success: false, error: error.message });
         }
     });
 
@@ -276,11 +509,11 @@
             }
 
             console.log(`[Bridge] Found ${matchingLabels.length} elements matching text.`);
-            socket.emit('found_elements_response', { success: true, labels: matchingLabels });
+            reply('found_elements_response', data, { success: true, labels: matchingLabels });
 
         } catch (error) {
             console.error('[Bridge] Find elements by text failed:', error);
-            socket.emit('found_elements_response', { success: false, error: error.message });
+            reply('found_elements_response', data, { success: false, error: error.message });
         }
     });
 
@@ -326,8 +559,74 @@
         }
     });
 
+    // --- Navigation Readiness ---
+
+    const SETTLE_QUIET_MS = 300;
+    const SETTLE_MAX_MS = 3000;
+
+    // Resolves with 'settled' once the DOM has stopped changing and no new resources have
+    // loaded for SETTLE_QUIET_MS, or with 'timeout' after SETTLE_MAX_MS.
+    function whenPageSettled() {
+        return new Promise(resolve => {
+            let quietTimer = null;
+            let maxTimer = null;
+            let resourceObserver = null;
+            const mutationObserver = new MutationObserver(restartQuietTimer);
+
+            function finish(ready) {
+                clearTimeout(quietTimer);
+                clearTimeout(maxTimer);
+                mutationObserver.disconnect();
+                if (resourceObserver) resourceObserver.disconnect();
+                resolve(ready);
+            }
+
+            function restartQuietTimer() {
+                clearTimeout(quietTimer);
+                quietTimer = setTimeout(() => finish('settled'), SETTLE_QUIET_MS);
+            }
+
+            function start() {
+                maxTimer = setTimeout(() => finish('timeout'), SETTLE_MAX_MS);
+                mutationObserver.observe(document.documentElement, { childList: true, subtree: true, attributes: true, characterData: true });
+                if (typeof PerformanceObserver !== 'undefined') {
+                    try {
+                        resourceObserver = new PerformanceObserver(restartQuietTimer);
+                        resourceObserver.observe({ type: 'resource' });
+                    } catch (e) {
+                        resourceObserver = null;
+                    }
+                }
+                restartQuietTimer();
+            }
+
+            if (document.readyState === 'loading') {
+                document.addEventListener('DOMContentLoaded', start, { once: true });
+            } else {
+                start();
+            }
+        });
+    }
+
+    // Tells the agent that the page this bridge lives in has loaded and settled.
+    function announceNavigationComplete() {
+        whenPageSettled().then(ready => {
+            socket.emit('navigation_complete', {
+                tab_id: window.__agentTabId || null,
+                success: true,
+                url: window.location.href,
+                title: document.title,
+                ready: ready
+            });
+        });
+    }
+
     socket.on('connect', () => {
         console.log("Bridge connected to backend via Socket.IO.");
+        // Join the room of the UI tab hosting this iframe, so an agent leasing that tab
+        // keeps reaching the bridge after every navigation.
+        socket.emit('register_bridge', { tab_id: window.__agentTabId || null });
+        announceNavigationComplete();
     });
 
     socket.on('start_recording_bridge', () => {
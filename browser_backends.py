@@ -0,0 +1,575 @@
+# FILE: browser_backends.py
+
+import asyncio
+import uuid
+from abc import ABC, abstractmethod
+from typing import Dict, List, Optional
+from playwright.async_api import async_playwright, Error as PlaywrightError, TimeoutError as PlaywrightTimeoutError
+import config
+
+
+class BrowserBackend(ABC):
+    """
+    The interface BrowserController uses to drive an actual browser.
+
+    Every method returns a response dictionary shaped like the bridge's Socket.IO
+    responses (at least a 'success' key, plus 'error' on failure), and raises
+    TimeoutError when the browser does not answer in time.
+    """
+    # True if the backend drives the iframe in the UI, so the UI should follow navigations.
+    uses_ui_iframe = False
+    # Socket id of the UI tab showing this backend's browser, or None to update every tab.
+    ui_room: Optional[str] = None
+    # Latest page revision reported by the browser, if the backend tracks one. Observations
+    # carry the revision they show, so a different value means the page has changed since.
+    page_revision: Optional[str] = None
+
+    async def start(self):
+        pass
+
+    async def close(self):
+        pass
+
+    async def health_check(self) -> bool:
+        """Returns False if the browser is gone and the backend should be replaced."""
+        return True
+
+    async def reset(self):
+        """Prepares a started backend for a new agent run."""
+        pass
+
+    async def propagate_settings(self, settings: Dict):
+        """Applies settings that can change while the browser is running."""
+        pass
+
+    @abstractmethod
+    async def goto(self, url: str) -> Dict:
+        """Navigates and returns once the new page is ready, with its final 'url' and 'title' when known."""
+        raise NotImplementedError
+
+    def expect_navigation(self):
+        """
+        Starts listening for the next completed page load. Call it before the action that
+        triggers the navigation and pass the returned token to wait_for_navigation.
+        """
+        return None
+
+    async def wait_for_navigation(self, token, timeout: Optional[float] = None) -> Dict:
+        """Waits for the navigation announced by expect_navigation to complete."""
+        return {'success': True}
+
+    def cancel_navigation(self, token):
+        """Stops listening for a navigation from expect_navigation that will not be awaited."""
+        pass
+
+    @abstractmethod
+    async def observe(self, since_version: Optional[int], session: Optional[str]) -> Dict:
+        """
+        Returns the screenshot as encoded bytes and the visible interactive elements,
+        either as a full list ('full': True, 'elements') or as a delta against
+        since_version ('added', 'changed', 'removed').
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    async def execute_action(self, command: Dict) -> Dict:
+        raise NotImplementedError
+
+    async def execute_batch(self, commands: List[Dict], stop_on_failure: bool = True) -> Dict:
+        """
+        Runs commands in order and returns {'success', 'results'}, with one result per
+        attempted step. Backends that can run a batch in a single round trip override this.
+        """
+        results = []
+        for index, command in enumerate(commands):
+            response = await self.execute_action(command)
+            results.append({'index': index, 'action': command['action'], 'success': bool(response.get('success')),
+                            'error': response.get('error')})
+            if stop_on_failure and not response.get('success'):
+                break
+        success = len(results) == len(commands) and all(result['success'] for result in results)
+        return {'success': success, 'results': results}
+
+    @abstractmethod
+    async def get_page_content(self) -> Dict:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def find_elements_by_text(self, text: str) -> Dict:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def get_selectors(self, labels: List[int]) -> Dict:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def element_screenshot(self, label: int) -> Dict:
+        raise NotImplementedError
+
+
+class BridgeBackend(BrowserBackend):
+    """
+    Drives the page loaded in the UI's iframe through the injected bridge.js,
+    over the '/bridge' Socket.IO namespace. If `room` is given, requests go only to
+    the bridge in that UI tab; otherwise they are broadcast to every connected bridge.
+    The room is the UI tab's Socket.IO id, which, unlike the bridge's own connection,
+    survives the iframe navigating.
+    """
+    uses_ui_iframe = True
+
+    # Request-response mechanism for browser actions.
+    # Every request emitted to the bridge carries a unique id; the matching
+    # response resolves the asyncio.Future registered under that id. The table is
+    # shared by all bridge backends because Socket.IO keeps one handler per event.
+    _pending_requests: Dict[str, asyncio.Future] = {}
+    # Navigations waiting for a 'navigation_complete' event, keyed by the room they happen in.
+    _pending_navigations: Dict[Optional[str], asyncio.Future] = {}
+
+    def __init__(self, socketio=None, testing=False, room: Optional[str] = None):
+        self.socketio = socketio
+        self.testing = testing
+        self.room = room
+        self.ui_room = room
+
+        # Event handlers for async communication with the bridge
+        if self.socketio:
+            self.socketio.on_event('observation_response', self._handle_observation_response, namespace='/bridge')
+            self.socketio.on_event('action_response', self._handle_action_response, namespace='/bridge')
+            self.socketio.on_event('batch_response', self._handle_batch_response, namespace='/bridge')
+            self.socketio.on_event('page_content_response', self._handle_page_content_response, namespace='/bridge')
+            self.socketio.on_event('found_elements_response', self._handle_found_elements_response, namespace='/bridge')
+            self.socketio.on_event('selectors_response', self._handle_selectors_response, namespace='/bridge')
+            # Sent by the bridge once a new page has settled, or by the UI when the bridge could not be injected.
+            self.socketio.on_event('navigation_complete', self._handle_navigation_complete, namespace='/bridge')
+            self.socketio.on_event('navigation_complete', self._handle_navigation_complete)
+
+    def _handle_observation_response(self, data):
+        print("[SOCKETS] Received observation response from bridge.")
+        self._resolve_bridge_request(data)
+
+    def _handle_action_response(self, data):
+        print(f"[SOCKETS] Received action response from bridge: {data}")
+        self._resolve_bridge_request(data)
+
+    def _handle_batch_response(self, data):
+        print(f"[SOCKETS] Received batch response from bridge: {data}")
+        self._resolve_bridge_request(data)
+
+    def _handle_page_content_response(self, data):
+        print("[SOCKETS] Received page_content response from bridge.")
+        self._resolve_bridge_request(data)
+
+    def _handle_found_elements_response(self, data):
+        print("[SOCKETS] Received found_elements response from bridge.")
+        self._resolve_bridge_request(data)
+
+    def _handle_selectors_response(self, data):
+        print("[SOCKETS] Received selectors response from bridge.")
+        self._resolve_bridge_request(data)
+
+    def _handle_navigation_complete(self, data):
+        if not isinstance(data, dict):
+            return
+        print(f"[SOCKETS] Navigation complete: {data.get('url')} (ready: {data.get('ready')}).")
+        future = self._pending_navigations.pop(data.get('tab_id'), None) or self._pending_navigations.pop(None, None)
+        if future is None:
+            # A navigation nobody is waiting for, e.g. the user browsing in the UI.
+            return
+        future.get_loop().call_soon_threadsafe(self._set_future_result, future, data)
+
+    def _resolve_bridge_request(self, data):
+        """
+        Resolves the future waiting on the request id carried by a bridge response.
+        Socket.IO handlers run on the server's thread, so the result is handed to
+        the agent's event loop with call_soon_threadsafe.
+        """
+        request_id = data.get('request_id') if isinstance(data, dict) else None
+        future = self._pending_requests.pop(request_id, None)
+        if future is None:
+            print(f"[SOCKETS] Ignoring bridge response for unknown request id: {request_id}")
+            return
+        future.get_loop().call_soon_threadsafe(self._set_future_result, future, data)
+
+    @staticmethod
+    def _set_future_result(future: asyncio.Future, data):
+        if not future.done():
+            future.set_result(data)
+
+    def _emit(self, event: str, payload: Dict):
+        if self.room:
+            self.socketio.emit(event, payload, namespace='/bridge', to=self.room)
+        else:
+            self.socketio.emit(event, payload, namespace='/bridge')
+
+    def _emit_bridge_request(self, event: str, payload: Optional[Dict] = None) -> str:
+        """
+        Emits a request to the bridge tagged with a new request id and registers a future
+        for its response. Must be called from the agent's event loop. Several requests can
+        be emitted before any of them is awaited.
+        """
+        request_id = uuid.uuid4().hex
+        payload = dict(payload or {})
+        payload['request_id'] = request_id
+        # Register before emitting so a fast response can never be missed.
+        self._pending_requests[request_id] = asyncio.get_running_loop().create_future()
+        self._emit(event, payload)
+        return request_id
+
+    async def _wait_for_bridge_response(self, request_id: str, timeout=15):
+        """Waits for the bridge response to a specific request without blocking the event loop."""
+        if self.testing:
+            print("[TESTING] Bypassing bridge wait and returning mock success.")
+            self._pending_requests.pop(request_id, None)
+            return {'success': True}
+
+        future = self._pending_requests.get(request_id)
+        if future is None:
+            raise KeyError(f"No pending bridge request with id {request_id}.")
+        try:
+            response = await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            raise TimeoutError("Timed out waiting for response from the browser bridge.")
+        finally:
+            self._pending_requests.pop(request_id, None)
+        if isinstance(response, dict) and response.get('page_revision') is not None:
+            self.page_revision = response['page_revision']
+        return response
+
+    async def _bridge_request(self, event: str, payload: Optional[Dict] = None, timeout=15):
+        """Emits a request to the bridge and awaits its correlated response."""
+        request_id = self._emit_bridge_request(event, payload)
+        return await self._wait_for_bridge_response(request_id, timeout=timeout)
+
+    async def health_check(self) -> bool:
+        if self.testing or not self.socketio or not self.room:
+            return True
+        try:
+            # The session lives as long as its UI tab is open.
+            return self.socketio.server.manager.is_connected(self.room, '/')
+        except Exception:
+            return False
+
+    async def propagate_settings(self, settings: Dict):
+        if self.socketio:
+            self._emit('update_bridge_settings', settings)
+
+    def expect_navigation(self):
+        if self.testing or not self.socketio:
+            return None
+        future = asyncio.get_running_loop().create_future()
+        self._pending_navigations[self.room] = future
+        return future
+
+    async def wait_for_navigation(self, token, timeout: Optional[float] = None) -> Dict:
+        if token is None:
+            return {'success': True}
+        try:
+            data = await asyncio.wait_for(token, timeout or config.PAGE_LOAD_TIMEOUT)
+        except asyncio.TimeoutError:
+            raise TimeoutError("Timed out waiting for the page to finish loading.")
+        finally:
+            self.cancel_navigation(token)
+        return {'success': data.get('success', True), 'url': data.get('url'), 'title': data.get('title'),
+                'ready': data.get('ready'), 'error': data.get('error')}
+
+    def cancel_navigation(self, token):
+        if token is None:
+            return
+        if self._pending_navigations.get(self.room) is token:
+            del self._pending_navigations[self.room]
+        token.cancel()
+
+    def _bridge_connected(self) -> bool:
+        """True if a bridge is connected to receive requests for this backend's room."""
+        if self.testing or not self.socketio:
+            return True
+        try:
+            return any(True for _ in self.socketio.server.manager.get_participants('/bridge', self.room))
+        except Exception as e:
+            print(f"[WARN] Could not check for a connected bridge: {e}")
+            return True
+
+    async def goto(self, url: str) -> Dict:
+        # Without the UI tab there is nothing that could navigate, so don't wait for the deadline.
+        if not await self.health_check():
+            return {'success': False, 'error': "The UI tab driving this browser is no longer connected."}
+        # The bridge that receives 'goto' is unloaded with its page, so completion is
+        # announced by the bridge injected into the new page once it has settled.
+        navigation = self.expect_navigation()
+        try:
+            if self._bridge_connected():
+                self._emit('goto', {'url': url})
+            else:
+                # No page with a bridge is loaded yet (e.g. a blank iframe), so the UI tab loads the URL itself.
+                self.socketio.emit('browser_navigated', {'url': url}, to=self.room)
+        except Exception:
+            self.cancel_navigation(navigation)
+            raise
+        return await self.wait_for_navigation(navigation)
+
+    async def observe(self, since_version: Optional[int], session: Optional[str]) -> Dict:
+        return await self._bridge_request('get_observation', {'since_version': since_version, 'session': session})
+
+    async def execute_action(self, command: Dict) -> Dict:
+        return await self._bridge_request(command['action'], command)
+
+    async def execute_batch(self, commands: List[Dict], stop_on_failure: bool = True) -> Dict:
+        return await self._bridge_request('batch', {'commands': commands, 'stop_on_failure': stop_on_failure})
+
+    async def get_page_content(self) -> Dict:
+        return await self._bridge_request('get_page_content')
+
+    async def find_elements_by_text(self, text: str) -> Dict:
+        return await self._bridge_request('find_elements_by_text', {'text': text})
+
+    async def get_selectors(self, labels: List[int]) -> Dict:
+        return await self._bridge_request('get_selectors', {'labels': labels})
+
+    async def element_screenshot(self, label: int) -> Dict:
+        return {'success': False, 'error': 'The bridge cannot capture element screenshots.'}
+
+
+# Labels interactive elements in the viewport and returns their data. Labels are kept
+# in a WeakMap on the page, so an element keeps its label across observations.
+_EXTRACT_ELEMENTS_JS = """
+(fullPage) => {
+    const SELECTOR = "a, button, input, textarea, select, [role='button'], [role='link'], " +
+        "[role='tab'], [role='checkbox'], [role='menuitem'], [role='option'], [role='switch']";
+    if (!window.__agentLabels) {
+        window.__agentLabels = new WeakMap();
+        window.__agentNextLabel = 1;
+    }
+    window.__agentLabeledElements = {};
+    const offsetX = fullPage ? window.scrollX : 0;
+    const offsetY = fullPage ? window.scrollY : 0;
+    const elements = [];
+    for (const el of document.querySelectorAll(SELECTOR)) {
+        const rect = el.getBoundingClientRect();
+        if (!(rect.width > 0 && rect.height > 0 && rect.top >= 0 && rect.left >= 0 &&
+              rect.bottom <= window.innerHeight && rect.right <= window.innerWidth)) {
+            continue;
+        }
+        let label = window.__agentLabels.get(el);
+        if (!label) {
+            label = window.__agentNextLabel++;
+            window.__agentLabels.set(el, label);
+        }
+        window.__agentLabeledElements[label] = el;
+        elements.push({
+            label: label,
+            box: { x: rect.x + offsetX, y: rect.y + offsetY, width: rect.width, height: rect.height },
+            tag: el.tagName.toLowerCase(),
+            aria_label: el.getAttribute('aria-label'),
+            name: el.name,
+            type: el.type,
+            text: el.innerText,
+            value: el.value,
+            href: el.href,
+        });
+    }
+    return elements;
+}
+"""
+
+_FIND_ELEMENTS_BY_TEXT_JS = """
+(searchText) => {
+    const matches = [];
+    const labeled = window.__agentLabeledElements || {};
+    for (const label in labeled) {
+        const element = labeled[label];
+        const elementText = element.innerText || element.value || element.getAttribute('aria-label') || '';
+        if (elementText && elementText.toLowerCase().includes(searchText.toLowerCase())) {
+            matches.push(label);
+        }
+    }
+    return matches;
+}
+"""
+
+_GET_SELECTORS_JS = """
+(labels) => {
+    function getSelector(element) {
+        if (element.id && document.querySelectorAll(`#${CSS.escape(element.id)}`).length === 1) {
+            return `#${CSS.escape(element.id)}`;
+        }
+        let path = '';
+        while (element && element.parentElement) {
+            let selector = element.tagName.toLowerCase();
+            const sameTagSiblings = Array.from(element.parentElement.children).filter(e => e.tagName === element.tagName);
+            if (sameTagSiblings.length > 1) {
+                selector += `:nth-of-type(${sameTagSiblings.indexOf(element) + 1})`;
+            }
+            path = selector + (path ? ' > ' + path : '');
+            if (document.querySelectorAll(path).length === 1) {
+                break;
+            }
+            element = element.parentElement;
+        }
+        return path;
+    }
+    const selectors = {};
+    const labeled = window.__agentLabeledElements || {};
+    for (const label of labels) {
+        if (labeled[label]) {
+            selectors[label] = getSelector(labeled[label]);
+        }
+    }
+    return selectors;
+}
+"""
+
+
+class PlaywrightBackend(BrowserBackend):
+    """
+    Drives a headless browser with Playwright. Screenshots come from the browser's
+    native capture, elements are extracted with page.evaluate, and navigation waits
+    on real load states, so no UI tab is needed.
+    """
+    def __init__(self):
+        self._playwright = None
+        self.browser = None
+        self.context = None
+        self.page = None
+
+    async def start(self):
+        self._playwright = await async_playwright().start()
+        browser_type = getattr(self._playwright, config.BROWSER_TYPE, self._playwright.chromium)
+        launch_options = {'headless': config.HEADLESS_BROWSER}
+        if config.USE_PROXY and config.PROXY_ADDRESS:
+            launch_options['proxy'] = {'server': config.PROXY_ADDRESS}
+        self.browser = await browser_type.launch(**launch_options)
+        self.context = await self.browser.new_context(
+            user_agent=config.USER_AGENT,
+            viewport={'width': config.VIEWPORT_WIDTH, 'height': config.VIEWPORT_HEIGHT},
+            java_script_enabled=config.ENABLE_JAVASCRIPT
+        )
+        if not config.LOAD_IMAGES:
+            await self.context.route(
+                "**/*",
+                lambda route: route.abort() if route.request.resource_type in ("image", "media") else route.continue_()
+            )
+        self.page = await self.context.new_page()
+        print(f"[INFO] Playwright backend started ({config.BROWSER_TYPE}, headless={config.HEADLESS_BROWSER}).")
+
+    async def close(self):
+        if self.browser:
+            await self.browser.close()
+        if self._playwright:
+            await self._playwright.stop()
+        self.browser = self.context = self.page = self._playwright = None
+
+    async def health_check(self) -> bool:
+        if not self.browser or not self.browser.is_connected() or not self.page or self.page.is_closed():
+            return False
+        try:
+            await asyncio.wait_for(self.page.evaluate("1"), timeout=5)
+            return True
+        except (PlaywrightError, asyncio.TimeoutError):
+            return False
+
+    async def reset(self):
+        """Clears state left behind by the previous run so runs stay independent."""
+        if config.CLEAR_COOKIES_ON_START:
+            await self.context.clear_cookies()
+        await self.page.goto('about:blank')
+
+    async def _wait_for_page_to_settle(self):
+        """Waits for the DOM to load and, briefly, for the network to go quiet."""
+        try:
+            await self.page.wait_for_load_state('domcontentloaded', timeout=config.PAGE_LOAD_TIMEOUT * 1000)
+            await self.page.wait_for_load_state('networkidle', timeout=config.NETWORK_IDLE_TIMEOUT * 1000)
+        except PlaywrightTimeoutError:
+            # Pages with long-polling or analytics never go fully idle.
+            pass
+
+    async def goto(self, url: str) -> Dict:
+        try:
+            await self.page.goto(url, wait_until='domcontentloaded', timeout=config.PAGE_LOAD_TIMEOUT * 1000)
+        except PlaywrightTimeoutError:
+            raise TimeoutError(f"Timed out navigating to {url}.")
+        except PlaywrightError as e:
+            return {'success': False, 'error': str(e)}
+        await self._wait_for_page_to_settle()
+        return {'success': True, 'url': self.page.url, 'title': await self.page.title()}
+
+    async def observe(self, since_version: Optional[int], session: Optional[str]) -> Dict:
+        full_page = bool(config.SCREENSHOT_FULL_PAGE)
+        try:
+            elements = await self.page.evaluate(_EXTRACT_ELEMENTS_JS, full_page)
+            screenshot = await self.page.screenshot(full_page=full_page, type='png')
+            # Where the visible part of a full-page screenshot is, so the model can be shown just that.
+            viewport = await self.page.evaluate(
+                "() => ({x: window.scrollX, y: window.scrollY, width: window.innerWidth, height: window.innerHeight})"
+            ) if full_page else None
+        except PlaywrightTimeoutError:
+            raise TimeoutError("Timed out capturing the page.")
+        except PlaywrightError as e:
+            return {'success': False, 'error': str(e)}
+        return {'success': True, 'screenshot': screenshot, 'full': True, 'elements': elements, 'viewport': viewport}
+
+    async def _get_element(self, label: int):
+        handle = await self.page.evaluate_handle(
+            "(label) => (window.__agentLabeledElements || {})[label] || null", label
+        )
+        element = handle.as_element()
+        if element is None:
+            raise ValueError(f"Element with label {label} not found.")
+        return element
+
+    async def execute_action(self, command: Dict) -> Dict:
+        action = command['action']
+        timeout = config.PAGE_LOAD_TIMEOUT * 1000
+        try:
+            if action == 'scroll':
+                await self.page.evaluate(
+                    "(direction) => window.scrollBy(0, direction === 'down' ? window.innerHeight : -window.innerHeight)",
+                    command.get('direction', 'down')
+                )
+            else:
+                element = await self._get_element(command.get('label'))
+                if action == 'click':
+                    await element.click(timeout=timeout)
+                    await self._wait_for_page_to_settle()
+                elif action == 'type':
+                    await element.fill(command.get('text', ''), timeout=timeout)
+                elif action == 'select':
+                    await element.select_option(command.get('value', ''), timeout=timeout)
+                else:
+                    return {'success': False, 'error': f"Unsupported action '{action}'.", 'action': action}
+            return {'success': True, 'action': action}
+        except PlaywrightTimeoutError:
+            raise TimeoutError(f"Timed out executing '{action}'.")
+        except (PlaywrightError, ValueError) as e:
+            return {'success': False, 'error': str(e), 'action': action}
+
+    async def get_page_content(self) -> Dict:
+        try:
+            return {'success': True, 'text': await self.page.inner_text('body')}
+        except PlaywrightError as e:
+            return {'success': False, 'error': str(e)}
+
+    async def find_elements_by_text(self, text: str) -> Dict:
+        try:
+            return {'success': True, 'labels': await self.page.evaluate(_FIND_ELEMENTS_BY_TEXT_JS, text)}
+        except PlaywrightError as e:
+            return {'success': False, 'error': str(e)}
+
+    async def get_selectors(self, labels: List[int]) -> Dict:
+        try:
+            return {'success': True, 'selectors': await self.page.evaluate(_GET_SELECTORS_JS, labels)}
+        except PlaywrightError as e:
+            return {'success': False, 'error': str(e)}
+
+    async def element_screenshot(self, label: int) -> Dict:
+        try:
+            element = await self._get_element(label)
+            return {'success': True, 'screenshot': await element.screenshot(type='png')}
+        except (PlaywrightError, ValueError) as e:
+            return {'success': False, 'error': str(e)}
+
+
+def create_browser_backend(socketio=None, testing=False, bridge_room: Optional[str] = None) -> BrowserBackend:
+    """Builds the backend selected by the BROWSER_BACKEND setting."""
+    if config.BROWSER_BACKEND == "playwright" and not testing:
+        return PlaywrightBackend()
+    return BridgeBackend(socketio=socketio, testing=testing, room=bridge_room)
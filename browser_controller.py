@@ -8,16 +8,95 @@ from PIL import Image, ImageDraw, ImageFont
 import config
 from website_graph import WebsiteGraph
 from recovery import ErrorRecovery
+from browser_backends import BrowserBackend, create_browser_backend
+from observation_cache import ObservationCache, compute_perceptual_hash, compute_elements_fingerprint
 import asyncio
-from queue import Queue, Empty, Full
-from threading import Event
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+
+# Annotation runs off the agent's event loop. A single worker keeps the cached
+# font object from being used by two threads at once.
+_annotation_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="annotator")
+
+ANNOTATION_MIME_TYPES = {"PNG": "image/png", "WEBP": "image/webp", "JPEG": "image/jpeg"}
+
+
+@lru_cache(maxsize=4)
+def _get_label_font(font_size: int):
+    """Loads the label font once per size instead of on every observation."""
+    return ImageFont.load_default(size=font_size)
+
+
+def render_annotated_screenshot(screenshot_bytes: bytes, elements: List[Dict], image_format: str = "PNG", quality: int = 80) -> bytes:
+    """
+    Draws a labeled bounding box for every element onto the screenshot and returns
+    the encoded result. This is CPU-bound and is meant to run in a worker thread.
+    """
+    img = Image.open(io.BytesIO(screenshot_bytes))
+    if image_format == "JPEG" and img.mode != "RGB":
+        img = img.convert("RGB")
+    draw = ImageDraw.Draw(img)
+    font = _get_label_font(18)
+
+    for element_data in elements:
+        label = str(element_data['label'])
+        box = element_data['box']
+
+        # Draw bounding box
+        draw.rectangle([box['x'], box['y'], box['x'] + box['width'], box['y'] + box['height']], outline="red", width=2)
+
+        # Prepare and draw label
+        bbox = draw.textbbox((0, 0), label, font=font)
+        text_width = bbox[2] - bbox[0]
+        text_height = bbox[3] - bbox[1]
+        padding = 2
+        label_x = box['x']
+        label_y = box['y'] - text_height - (padding * 2)
+        if label_y < 0:
+            label_y = box['y'] + box['height']
+
+        draw.rectangle(
+            [label_x, label_y, label_x + text_width + (padding * 2), label_y + text_height + (padding * 2)],
+            fill="red"
+        )
+        draw.text((label_x + padding, label_y + padding), label, fill="white", font=font)
+
+    annotated_buffer = io.BytesIO()
+    if image_format == "PNG":
+        img.save(annotated_buffer, format="PNG")
+    else:
+        img.save(annotated_buffer, format=image_format, quality=quality)
+    return annotated_buffer.getvalue()
+
+
+def crop_element_image(screenshot_bytes: bytes, box: Dict, padding: int = 8, max_size: int = 256) -> Optional[bytes]:
+    """
+    Crops an element's bounding box, plus some padding for context, out of the screenshot,
+    downscales it to fit in max_size pixels and returns it as PNG. Returns None if the box
+    lies outside the screenshot. Meant to run in a worker thread.
+    """
+    img = Image.open(io.BytesIO(screenshot_bytes))
+    left = max(0, int(box['x']) - padding)
+    top = max(0, int(box['y']) - padding)
+    right = min(img.width, int(box['x'] + box['width']) + padding)
+    bottom = min(img.height, int(box['y'] + box['height']) + padding)
+    if right <= left or bottom <= top:
+        return None
+
+    crop = img.crop((left, top, right, bottom))
+    crop.thumbnail((max_size, max_size), Image.Resampling.LANCZOS)
+    crop_buffer = io.BytesIO()
+    crop.save(crop_buffer, format="PNG")
+    return crop_buffer.getvalue()
+
 
 class BrowserController:
     """
-    A controller for managing a remote browser via Socket.IO,
-    handling page interactions, and annotating screenshots for an AI agent.
+    A controller for managing a browser through a pluggable backend (the Socket.IO
+    bridge or headless Playwright), handling page interactions, and annotating
+    screenshots for an AI agent.
     """
-    def __init__(self, run_folder: str, agent=None, website_graph: Optional[WebsiteGraph] = None, socketio=None, testing=False):
+    def __init__(self, run_folder: str, agent=None, website_graph: Optional[WebsiteGraph] = None, socketio=None, testing=False, backend: Optional[BrowserBackend] = None):
         self.run_folder = run_folder
         self.agent = agent
         self.socketio = socketio
@@ -26,104 +105,92 @@ class BrowserController:
         self.website_graph = website_graph
 
         self.labeled_elements: Dict[int, Dict] = {}
+        # The bridge sends element deltas against the last version we applied.
+        self.dom_session: Optional[str] = None
+        self.dom_version: Optional[int] = None
         self.current_screenshot_bytes: Optional[bytes] = None
+        self._encoded_screenshot: Optional[str] = None
+        self._annotation_future: Optional[asyncio.Future] = None
+        self._annotation_tasks = set()
+
+        # Fingerprints of recent observations, used to detect that an action changed nothing.
+        self.observation_cache = ObservationCache(
+            max_entries=config.OBSERVATION_CACHE_SIZE,
+            hash_threshold=config.OBSERVATION_HASH_THRESHOLD
+        )
+        self.page_unchanged = False
         self.current_url = "about:blank"
+        # Whether the page may have changed since current_screenshot_bytes was captured.
+        self._observation_stale = True
+        self.observed_revision: Optional[str] = None
+        # The visible part of a full-page screenshot, in screenshot pixels, if the backend reports it.
+        self.viewport: Optional[Dict] = None
 
         # Ensure the run folder exists for saving screenshots
         os.makedirs(self.run_folder, exist_ok=True)
 
-        # Event handlers for async communication with the bridge
-        if self.socketio:
-            self.socketio.on_event('observation_response', self._handle_observation_response, namespace='/bridge')
-            self.socketio.on_event('action_response', self._handle_action_response, namespace='/bridge')
-            self.socketio.on_event('page_content_response', self._handle_page_content_response, namespace='/bridge')
-            self.socketio.on_event('found_elements_response', self._handle_found_elements_response, namespace='/bridge')
-
-        # Request-response mechanism for browser actions
-        self.response_queue = Queue(maxsize=1)
-        self.pending_request_event = Event()
-
-
-    def _handle_observation_response(self, data):
-        print("[SOCKETS] Received observation response from bridge.")
-        self.pending_request_event.data = data
-        self.pending_request_event.set()
-
-    def _handle_action_response(self, data):
-        print(f"[SOCKETS] Received action response from bridge: {data}")
-        self.pending_request_event.data = data
-        self.pending_request_event.set()
-
-    def _handle_page_content_response(self, data):
-        print("[SOCKETS] Received page_content response from bridge.")
-        self.pending_request_event.data = data
-        self.pending_request_event.set()
-
-    def _handle_found_elements_response(self, data):
-        print("[SOCKETS] Received found_elements response from bridge.")
-        self.pending_request_event.data = data
-        self.pending_request_event.set()
-
-    async def _wait_for_bridge_response(self, timeout=15):
-        """Waits for a response from the bridge for a specific request."""
-        if self.testing:
-            print("[TESTING] Bypassing bridge wait and returning mock success.")
-            return {'success': True}
-
-        self.pending_request_event.clear()
-        if self.pending_request_event.wait(timeout):
-            return self.pending_request_event.data
-        else:
-            raise TimeoutError("Timed out waiting for response from the browser bridge.")
+        # The backend that actually drives the browser (the UI bridge or headless Playwright).
+        # A backend leased from a session pool is started and closed by the pool, not here.
+        self.owns_backend = backend is None
+        self.backend = backend or create_browser_backend(socketio=self.socketio, testing=self.testing)
 
 
     async def propagate_settings_to_bridge(self):
-        """Sends the current dynamic settings to the browser bridge."""
-        if self.socketio:
-            settings = {
-                'load_images': config.get_setting('LOAD_IMAGES'),
-                'enable_javascript': config.get_setting('ENABLE_JAVASCRIPT'),
-                # Note: Stealth and Proxy are context-level and cannot be changed on the fly.
-                # We send them for informational purposes or for future bridge-side logic.
-                'stealth_mode': config.get_setting('STEALTH_MODE'),
-                'use_proxy': config.get_setting('USE_PROXY')
-            }
-            # This is too noisy to log on every step
-            # print(f"[SETTINGS] Propagating settings to bridge: {settings}")
-            self.socketio.emit('update_bridge_settings', settings, namespace='/bridge')
+        """Sends the current dynamic settings to the browser backend."""
+        settings = {
+            'load_images': config.get_setting('LOAD_IMAGES'),
+            'enable_javascript': config.get_setting('ENABLE_JAVASCRIPT'),
+            # Note: Stealth and Proxy are context-level and cannot be changed on the fly.
+            # We send them for informational purposes or for future bridge-side logic.
+            'stealth_mode': config.get_setting('STEALTH_MODE'),
+            'use_proxy': config.get_setting('USE_PROXY')
+        }
+        # This is too noisy to log on every step
+        # print(f"[SETTINGS] Propagating settings to bridge: {settings}")
+        await self.backend.propagate_settings(settings)
 
     async def start(self):
-        """Starts the browser controller. No browser is launched here anymore."""
-        print("[INFO] BrowserController started. Ready to connect to bridge.")
-        # We need to wait until the UI and the bridge are ready.
-        # For now, we assume they will be ready when needed.
-        pass
+        """Starts the browser controller and its backend."""
+        if self.owns_backend:
+            await self.backend.start()
+        print(f"[INFO] BrowserController started with the {type(self.backend).__name__}.")
 
     async def close(self):
         """Closes the browser controller."""
+        # Let queued annotations finish writing to the run folder.
+        if self._annotation_tasks:
+            await asyncio.gather(*self._annotation_tasks, return_exceptions=True)
+        if self.owns_backend:
+            await self.backend.close()
         print("[INFO] BrowserController closed.")
-        pass
 
     async def goto_url(self, url: str):
-        """Navigates the remote browser to the specified URL."""
+        """Navigates the browser to the specified URL."""
         from_url = self.current_url
+        target_url = url if "://" in url or url.startswith("about:") else "http://" + url
 
         print(f"[ACTION] Navigating to URL: {url}")
-        self.socketio.emit('goto', {'url': url}, namespace='/bridge')
+        self._observation_stale = True
+        try:
+            response = await self.backend.goto(target_url)
+        except TimeoutError as e:
+            print(f"[ERROR] {e}")
+            response = {'success': False, 'error': str(e)}
+        if not response.get('success'):
+            print(f"[ERROR] Navigation to {url} failed: {response.get('error')}")
 
-        # Navigation is a special case. We don't get a direct 'action_response'.
-        # The page loads, the bridge re-injects, and we're ready for the next observation.
-        # We will update the URL optimistically. A failed navigation will be caught
-        # by the next observation.
-        self.current_url = url if "://" in url else "http://" + url
+        # The backend reports where the page actually ended up. If it could not tell (e.g. it
+        # timed out), update the URL optimistically; the next observation will show the truth.
+        self.current_url = response.get('url') or target_url
+        page_title = response.get('title') or "Title (Unknown)"
 
-        if self.socketio:
+        if self.socketio and self.backend.uses_ui_iframe:
             print(f"[SOCKETS] Emitting 'browser_navigated' event to UI. URL: {self.current_url}")
-            self.socketio.emit('browser_navigated', {'url': self.current_url})
+            self._emit_to_ui('browser_navigated', {'url': self.current_url})
 
         if self.website_graph:
             self.website_graph.add_page(from_url)
-            self.website_graph.add_page(self.current_url, page_title="Title (Unknown)") # Title is not available anymore
+            self.website_graph.add_page(self.current_url, page_title=page_title)
             action = {"type": "goto", "url": url}
             self.website_graph.add_edge(from_url, self.current_url, action)
 
@@ -134,6 +201,7 @@ class BrowserController:
         """
         from_url = self.current_url
         self.current_url = new_url
+        self._observation_stale = True
         print(f"[STATE] URL updated by user action: from '{from_url}' to '{self.current_url}'")
 
         if self.website_graph:
@@ -144,89 +212,291 @@ class BrowserController:
 
     async def observe_and_annotate(self, step: int) -> Tuple[str, List[Dict]]:
         """
-        Captures a screenshot via the bridge, annotates it with labels on interactive elements,
-        and returns the annotated image and the list of labeled elements.
+        Captures a screenshot via the backend, queues the labeled annotation for its consumers,
+        and returns the original encoded image and the list of labeled elements.
         """
         print("[ACTION] Requesting observation from bridge...")
-        self.socketio.emit('get_observation', {}, namespace='/bridge')
-        
+        self.page_unchanged = False
+        response = await self._request_observation()
+        if response and not response.get('full', True) and response.get('base_version') != self.dom_version:
+            # A delta only applies to the version it was computed against, so start over from a full list.
+            print(f"[WARN] Element delta is based on version {response.get('base_version')}, but we have {self.dom_version}. Requesting a full observation.")
+            self.dom_session = None
+            self.dom_version = None
+            response = await self._request_observation()
+            if response and not response.get('full', True):
+                print("[ERROR] Bridge sent an element delta when a full observation was requested.")
+                response = None
+        if response is None:
+            return "iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAQAAAC1HAwCAAAAC0lEQVR42mNkYAAAAAYAAjCB0C8AAAAASUVORK5CYII=", []
+
+        # Process the observation data. The bridge sends the screenshot as a binary
+        # attachment, so it arrives as raw encoded bytes; this single buffer is shared
+        # by the annotator, the disk writer and the model encoder.
+        screenshot_bytes = self._screenshot_to_bytes(response['screenshot'])
+        elements_to_label = self._apply_element_delta(response)
+        self._observation_stale = False
+        self.observed_revision = response.get('page_revision')
+        self.viewport = response.get('viewport')
+
+        # Fingerprint the observation to detect a page that did not change.
+        elements_fingerprint = compute_elements_fingerprint(elements_to_label)
+        phash = await asyncio.get_running_loop().run_in_executor(None, compute_perceptual_hash, screenshot_bytes)
+        cached, self.page_unchanged = self.observation_cache.lookup(self.current_url, elements_fingerprint, phash)
+
+        if cached:
+            # Same page state as a recent observation: keep the earlier buffer and its
+            # encoding so the model sees exactly the same image.
+            print(f"[CACHE] Observation matches a cached page state (unchanged since last step: {self.page_unchanged}).")
+            self.current_screenshot_bytes = cached['screenshot_bytes']
+            self._encoded_screenshot = cached['encoded_image']
+        else:
+            self.current_screenshot_bytes = screenshot_bytes
+            self._encoded_screenshot = None
+            self.observation_cache.store(
+                self.current_url, elements_fingerprint, phash, screenshot_bytes, self.get_encoded_screenshot()
+            )
+
+        # Annotated screenshots are rendered lazily in a worker thread, and only
+        # when something consumes them. An unchanged page is already on display.
+        self._annotation_future = None
+        if not self.page_unchanged:
+            self._schedule_annotation(step)
+
+        # Return the original, un-annotated image for the AI model
+        encoded_original_image = self.get_encoded_screenshot()
+
+        # Return a list of dictionaries, not ElementHandles
+        return encoded_original_image, list(self.labeled_elements.values())
+
+    async def _request_observation(self) -> Optional[Dict]:
+        """Asks the backend for an observation since dom_version. Returns None if it failed."""
         try:
-            response = await self._wait_for_bridge_response()
+            response = await self.backend.observe(self.dom_version, self.dom_session)
         except TimeoutError:
             print("[ERROR] Timed out waiting for observation from bridge.")
-            return "iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAQAAAC1HAwCAAAAC0lEQVR42mNkYAAAAAYAAjCB0C8AAAAASUVORK5CYII=", []
-
+            return None
         if not response.get('success'):
             print(f"[ERROR] Bridge failed to get observation: {response.get('error')}")
-            return "iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAQAAAC1HAwCAAAAC0lEQVR42mNkYAAAAAYAAjCB0C8AAAAASUVORK5CYII=", []
+            return None
+        return response
 
-        # Process the observation data
-        screenshot_bytes = base64.b64decode(response['screenshot'])
-        elements_to_label = response['elements']
-        self.current_screenshot_bytes = screenshot_bytes
-        self.labeled_elements = {el['label']: el for el in elements_to_label}
-
-        # Annotate the screenshot
-        img = Image.open(io.BytesIO(screenshot_bytes))
-        draw = ImageDraw.Draw(img)
-        font_size = 18
-        font = ImageFont.load_default(size=font_size)
-
-        for i, element_data in enumerate(elements_to_label):
-            label = str(element_data['label'])
-            box = element_data['box']
-
-            # Draw bounding box
-            draw.rectangle([box['x'], box['y'], box['x'] + box['width'], box['y'] + box['height']], outline="red", width=2)
-            
-            # Prepare and draw label
-            bbox = draw.textbbox((0, 0), label, font=font)
-            text_width = bbox[2] - bbox[0]
-            text_height = bbox[3] - bbox[1]
-            padding = 2
-            label_x = box['x']
-            label_y = box['y'] - text_height - (padding * 2)
-            if label_y < 0:
-                label_y = box['y'] + box['height']
-
-            draw.rectangle(
-                [label_x, label_y, label_x + text_width + (padding * 2), label_y + text_height + (padding * 2)],
-                fill="red"
-            )
-            draw.text((label_x + padding, label_y + padding), label, fill="white", font=font)
+    def _apply_element_delta(self, response: Dict) -> List[Dict]:
+        """
+        Updates labeled_elements from an observation response. The bridge sends either a
+        full element list or the elements added, changed and removed since dom_version,
+        which observe_and_annotate has checked to match ours.
+        Returns the resulting element list ordered by label.
+        """
+        if response.get('full', True):
+            self.labeled_elements = {el['label']: el for el in response.get('elements', [])}
+        else:
+            for label in response.get('removed', []):
+                self.labeled_elements.pop(label, None)
+            for el in response.get('added', []) + response.get('changed', []):
+                self.labeled_elements[el['label']] = el
 
-        # Save and send annotated image
-        annotated_buffer = io.BytesIO()
-        img.save(annotated_buffer, format="PNG")
-        annotated_image_bytes = annotated_buffer.getvalue()
+        self.dom_session = response.get('session')
+        self.dom_version = response.get('version')
+        return [self.labeled_elements[label] for label in sorted(self.labeled_elements)]
 
-        screenshot_path = os.path.join(self.run_folder, f"step_{step}_annotated.png")
-        with open(screenshot_path, "wb") as f:
-            f.write(annotated_image_bytes)
+    async def get_element_selectors(self, labels: List[int]) -> Dict[int, str]:
+        """
+        Returns CSS selectors for the given labels. Selectors are computed by the bridge on
+        demand and cached on the labeled element until that element changes.
+        """
+        missing = [label for label in labels if label in self.labeled_elements and 'selector' not in self.labeled_elements[label]]
+        if missing:
+            try:
+                response = await self.backend.get_selectors(missing)
+                if response.get('success'):
+                    for label, selector in response.get('selectors', {}).items():
+                        if int(label) in self.labeled_elements:
+                            self.labeled_elements[int(label)]['selector'] = selector
+                else:
+                    print(f"[ERROR] Bridge failed to compute selectors: {response.get('error')}")
+            except TimeoutError:
+                print("[ERROR] Timed out waiting for selectors from bridge.")
+        return {label: self.labeled_elements[label]['selector'] for label in labels
+                if label in self.labeled_elements and 'selector' in self.labeled_elements[label]}
+
+    def _annotation_settings(self) -> Tuple[str, int]:
+        image_format = str(config.ANNOTATION_FORMAT).upper()
+        if image_format not in ANNOTATION_MIME_TYPES:
+            print(f"[WARN] Unsupported annotation format '{config.ANNOTATION_FORMAT}'. Falling back to PNG.")
+            image_format = "PNG"
+        return image_format, int(config.ANNOTATION_QUALITY)
+
+    def _render_annotation_async(self, image_format: str, quality: int) -> asyncio.Future:
+        """Starts rendering the annotated screenshot for the current observation in the worker pool."""
+        elements = list(self.labeled_elements.values())
+        return asyncio.get_running_loop().run_in_executor(
+            _annotation_executor, render_annotated_screenshot,
+            self.current_screenshot_bytes, elements, image_format, quality
+        )
+
+    def _emit_to_ui(self, event: str, data: Dict):
+        """Emits to the UI tab showing this run's browser, or to every tab if there is none."""
+        if self.backend.ui_room:
+            self.socketio.emit(event, data, to=self.backend.ui_room)
+        else:
+            self.socketio.emit(event, data)
 
-        if self.socketio:
-            encoded_annotated_image = base64.b64encode(annotated_image_bytes).decode('utf-8')
-            self.socketio.emit('agent_view_updated', {'image': encoded_annotated_image})
+    def _has_ui_subscribers(self) -> bool:
+        """Returns True if the UI tab this run emits to (or any UI tab, if there is none) is connected."""
+        if not self.socketio:
+            return False
+        try:
+            return any(True for _ in self.socketio.server.manager.get_participants('/', self.backend.ui_room))
+        except KeyError:
+            # The namespace or room is gone, so nobody is watching.
+            return False
+        except Exception as e:
+            # If the server does not expose its participants, assume someone is watching.
+            print(f"[WARN] Could not check for connected UI clients: {e}")
+            return True
 
-        # Return the original, un-annotated image for the AI model
-        encoded_original_image = base64.b64encode(screenshot_bytes).decode('utf-8')
+    def _schedule_annotation(self, step: int):
+        """
+        Queues the annotated screenshot for the sinks that want it (the UI and the run
+        folder). Nothing is rendered if neither is active; tools can still request the
+        image later through get_annotated_screenshot().
+        """
+        to_ui = self._has_ui_subscribers()
+        to_disk = bool(config.SAVE_SCREENSHOTS)
+        if not (to_ui or to_disk):
+            self._annotation_future = None
+            return
+
+        image_format, quality = self._annotation_settings()
+        self._annotation_future = self._render_annotation_async(image_format, quality)
+        task = asyncio.create_task(self._publish_annotation(self._annotation_future, step, image_format, to_ui, to_disk))
+        self._annotation_tasks.add(task)
+        task.add_done_callback(self._annotation_tasks.discard)
+
+    async def _publish_annotation(self, annotation_future: asyncio.Future, step: int, image_format: str, to_ui: bool, to_disk: bool):
+        try:
+            annotated_image_bytes = await annotation_future
+        except Exception as e:
+            print(f"[ERROR] Failed to annotate screenshot for step {step}: {e}")
+            return
 
-        # Return a list of dictionaries, not ElementHandles
-        return encoded_original_image, list(self.labeled_elements.values())
+        if to_disk:
+            extension = "jpg" if image_format == "JPEG" else image_format.lower()
+            screenshot_path = os.path.join(self.run_folder, f"step_{step}_annotated.{extension}")
+            await asyncio.to_thread(self._write_file, screenshot_path, annotated_image_bytes)
+
+        if to_ui:
+            # Sent as a binary attachment; the UI renders it from a Blob.
+            self._emit_to_ui('agent_view_updated', {'image': annotated_image_bytes, 'mime': ANNOTATION_MIME_TYPES[image_format]})
 
+    @staticmethod
+    def _write_file(path: str, data: bytes):
+        with open(path, "wb") as f:
+            f.write(data)
 
-    async def execute_action(self, action_json: dict) -> Tuple[bool, str]:
+    async def get_annotated_screenshot(self) -> Optional[bytes]:
         """
-        Executes a browser action by sending a command to the bridge.
+        Returns the annotated screenshot for the current observation, rendering it on
+        demand if no sink has requested it yet.
+        """
+        if self.current_screenshot_bytes is None:
+            return None
+        if self._annotation_future is None:
+            self._annotation_future = self._render_annotation_async(*self._annotation_settings())
+        return await self._annotation_future
+
+    def observation_is_stale(self) -> bool:
         """
+        Returns True if the page may have changed since the cached observation: the agent
+        acted or navigated since, or the browser reported a newer page revision.
+        """
+        if self.current_screenshot_bytes is None or self._observation_stale:
+            return True
+        revision = self.backend.page_revision
+        return revision is not None and revision != self.observed_revision
+
+    async def ensure_fresh_observation(self):
+        """Re-observes the page only if the cached observation is stale."""
+        if self.observation_is_stale():
+            print("[INFO] Cached observation is stale. Re-observing the page.")
+            await self.observe_and_annotate(step=-1)
+
+    async def get_snapdom(self) -> Dict:
+        """
+        Returns a snapshot of the page's labeled elements for the vision tools, served from
+        the cached observation. Each element also carries its label as 'index' and its
+        ARIA label under 'attributes'.
+        """
+        await self.ensure_fresh_observation()
+        return {
+            "url": self.current_url,
+            "version": self.dom_version,
+            "labeledElements": [
+                {
+                    **element,
+                    "index": element['label'],
+                    "text": element.get('text') or "",
+                    "attributes": {"aria-label": element.get('aria_label') or ""},
+                }
+                for element in sorted(self.labeled_elements.values(), key=lambda el: el['label'])
+            ],
+        }
+
+    async def get_element_screenshot(self, label: int) -> Optional[str]:
+        """
+        Returns a padded, downscaled crop of one element from the cached screenshot as
+        base64-encoded PNG, or None if the element is not on the current observation.
+        """
+        await self.ensure_fresh_observation()
+        element = self.labeled_elements.get(int(label))
+        if not element or not element.get('box') or self.current_screenshot_bytes is None:
+            return None
+        crop = await asyncio.get_running_loop().run_in_executor(
+            _annotation_executor, crop_element_image, self.current_screenshot_bytes, element['box'],
+            config.ELEMENT_CROP_PADDING, config.ELEMENT_CROP_MAX_SIZE
+        )
+        return base64.b64encode(crop).decode('ascii') if crop else None
+
+    async def capture_screenshot(self) -> Optional[str]:
+        """Returns the page's screenshot base64-encoded, re-observing only if the cached one is stale."""
+        await self.ensure_fresh_observation()
+        return self.get_encoded_screenshot()
+
+    @staticmethod
+    def _screenshot_to_bytes(screenshot: Any) -> bytes:
+        """Normalizes a screenshot payload from the bridge to raw bytes without extra copies."""
+        if isinstance(screenshot, str):
+            # Older bridge versions send a base64 string.
+            return base64.b64decode(screenshot)
+        if isinstance(screenshot, memoryview):
+            return screenshot.tobytes()
+        # bytes(b) returns the same object when b is already bytes.
+        return bytes(screenshot)
+
+    def vision_region(self) -> Optional[Dict]:
+        """The region of the screenshot the vision model should see: the viewport, or None for all of it."""
+        return self.viewport if config.get_setting('VISION_CROP_TO_VIEWPORT', True) else None
+
+    def get_encoded_screenshot(self) -> Optional[str]:
+        """
+        Returns the current screenshot base64-encoded for the model. The encoding is done
+        at most once per observation and cached until the next observation replaces it.
+        """
+        if self.current_screenshot_bytes is None:
+            return None
+        if self._encoded_screenshot is None:
+            self._encoded_screenshot = base64.b64encode(self.current_screenshot_bytes).decode('ascii')
+        return self._encoded_screenshot
+
+
+    @staticmethod
+    def _build_command(action_json: dict) -> Dict:
+        """Translates an agent action into the command format the backends understand."""
         action_type = action_json.get("action_type")
         details = action_json.get("details", {})
         element_label = details.get("element_label")
 
-        if not action_type:
-            return False, "Action failed: Missing 'action_type'."
-
-        # Prepare command for the bridge
         command = {'action': action_type}
         if element_label is not None:
             command['label'] = int(element_label)
@@ -236,6 +506,62 @@ class BrowserController:
             command['value'] = details.get('value', '')
         elif action_type == 'scroll':
             command['direction'] = details.get('direction', 'down')
+        return command
+
+    async def execute_batch(self, actions: List[dict], stop_on_failure: bool = True, expect_navigation: bool = False) -> Tuple[bool, List[Dict]]:
+        """
+        Executes a sequence of actions in one round trip to the browser and returns whether
+        every step succeeded, plus the per-step results. Only the last action may load a new
+        page; with expect_navigation, the batch also waits for that page load.
+        """
+        for index, action_json in enumerate(actions):
+            if not action_json.get("action_type"):
+                return False, [{'index': index, 'success': False, 'error': "Missing 'action_type'."}]
+        commands = [self._build_command(action_json) for action_json in actions]
+        self._observation_stale = True
+
+        print(f"[ACTION] Executing a batch of {len(commands)} actions via {type(self.backend).__name__}: "
+              f"{[command['action'] for command in commands]}")
+        navigation = self.backend.expect_navigation() if expect_navigation else None
+        try:
+            try:
+                response = await self.backend.execute_batch(commands, stop_on_failure=stop_on_failure)
+            except TimeoutError:
+                return False, [{'index': None, 'success': False, 'error': "Timed out waiting for response from bridge."}]
+
+            results = response.get('results')
+            if results is None:
+                # Responses without per-step results (e.g. in testing mode) apply to every step.
+                results = [{'index': index, 'action': command['action'], 'success': bool(response.get('success'))}
+                           for index, command in enumerate(commands)]
+            success = bool(response.get('success')) and len(results) == len(commands) and all(r.get('success') for r in results)
+
+            if success and expect_navigation:
+                try:
+                    loaded = await self.backend.wait_for_navigation(navigation)
+                    if loaded.get('url'):
+                        self.current_url = loaded['url']
+                except TimeoutError as e:
+                    print(f"[ERROR] {e}")
+            return success, results
+        finally:
+            # A failed batch never loads the page, so a later load must not be taken for it.
+            self.backend.cancel_navigation(navigation)
+
+    async def execute_action(self, action_json: dict, expect_navigation: bool = False) -> Tuple[bool, str]:
+        """
+        Executes a browser action by sending a command to the bridge. With expect_navigation,
+        also waits for the page load the action triggers.
+        """
+        action_type = action_json.get("action_type")
+        details = action_json.get("details", {})
+        element_label = details.get("element_label")
+
+        if not action_type:
+            return False, "Action failed: Missing 'action_type'."
+
+        command = self._build_command(action_json)
+        self._observation_stale = True
 
         # Get element box for UI feedback
         box = None
@@ -244,14 +570,18 @@ class BrowserController:
 
         if self.socketio and box:
             print(f"[SOCKETS] Emitting 'action_executed' event for {action_type} on element {element_label}")
-            self.socketio.emit('action_executed', {'action': action_type, 'box': box})
+            self._emit_to_ui('action_executed', {'action': action_type, 'box': box})
 
-        print(f"[ACTION] Executing '{action_type}' on element '{element_label}' via bridge.")
-        self.socketio.emit(action_type, command, namespace='/bridge')
+        print(f"[ACTION] Executing '{action_type}' on element '{element_label}' via {type(self.backend).__name__}.")
 
+        navigation = self.backend.expect_navigation() if expect_navigation else None
         try:
-            response = await self._wait_for_bridge_response()
+            response = await self.backend.execute_action(command)
             if response.get('success'):
+                if expect_navigation:
+                    loaded = await self.backend.wait_for_navigation(navigation)
+                    if loaded.get('url'):
+                        self.current_url = loaded['url']
                 return True, f"Action '{action_type}' on element {element_label} completed successfully."
             else:
                 error_msg = response.get('error', 'Unknown error from bridge.')
@@ -278,6 +608,9 @@ class BrowserController:
             return False, f"Action '{action_type}' failed: Timed out waiting for response from bridge."
         except Exception as e:
             return False, f"Action '{action_type}' failed with exception: {e}"
+        finally:
+            # A failed action never loads the page, so a later load must not be taken for it.
+            self.backend.cancel_navigation(navigation)
 
     # --- Other methods that need to be refactored or removed ---
     # The methods below are largely placeholders or need to be adapted to the new model.
@@ -286,10 +619,8 @@ class BrowserController:
     async def get_page_content(self) -> tuple[bool, str]:
         """Gets the full text content of the current page via the bridge."""
         print("[ACTION] Requesting page content from bridge...")
-        self.socketio.emit('get_page_content', {}, namespace='/bridge')
-
         try:
-            response = await self._wait_for_bridge_response()
+            response = await self.backend.get_page_content()
             if response.get('success'):
                 return True, response.get('text', '')
             else:
@@ -298,9 +629,11 @@ class BrowserController:
         except TimeoutError:
             return False, "Timed out waiting for page content from bridge."
 
-    async def get_element_details(self, label: int) -> tuple[bool, dict | str]:
-        """Gets element details from the cached list."""
+    async def get_element_details(self, label: int, include_selector: bool = False) -> tuple[bool, dict | str]:
+        """Gets element details from the cached list, fetching the selector from the bridge if asked."""
         if label in self.labeled_elements:
+            if include_selector:
+                await self.get_element_selectors([label])
             return True, self.labeled_elements[label]
         else:
             return False, f"Invalid label {label}."
@@ -308,10 +641,8 @@ class BrowserController:
     async def find_elements_by_text(self, text_to_find: str) -> tuple[bool, list | str]:
         """Finds elements by text content via the bridge and returns their labels."""
         print(f"[ACTION] Requesting to find elements by text from bridge for: '{text_to_find}'")
-        self.socketio.emit('find_elements_by_text', {'text': text_to_find}, namespace='/bridge')
-
         try:
-            response = await self._wait_for_bridge_response()
+            response = await self.backend.find_elements_by_text(text_to_find)
             if response.get('success'):
                 return True, response.get('labels', [])
             else:
@@ -354,8 +685,6 @@ class BrowserController:
         try:
             # 1. Navigate to Google
             await self.goto_url("https://www.google.com")
-            # Let's add a small delay to ensure the page loads and the bridge is ready.
-            await asyncio.sleep(2)
 
             # 2. Observe the page to get labeled elements
             # We pass a dummy step number since this is an internal tool action.
@@ -395,23 +724,15 @@ class BrowserController:
                 if not search_button_label:
                     return False, "Could not find the Google Search button on the page."
 
-            # 4. Type the query into the search box
-            success, message = await self.execute_action({
-                "action_type": "type",
-                "details": {"element_label": search_box_label, "text": query}
-            })
-            if not success:
-                return False, f"Failed to type into search box: {message}"
-
-            await asyncio.sleep(1) # Small delay between actions
-
-            # 5. Click the search button
-            success, message = await self.execute_action({
-                "action_type": "click",
-                "details": {"element_label": search_button_label}
-            })
+            # 4. Type the query and click the search button in one batch, then wait for the results page
+            success, results = await self.execute_batch([
+                {"action_type": "type", "details": {"element_label": search_box_label, "text": query}},
+                {"action_type": "click", "details": {"element_label": search_button_label}}
+            ], expect_navigation=True)
             if not success:
-                return False, f"Failed to click search button: {message}"
+                failed = next((result for result in results if not result.get('success')), {})
+                step = ["type into search box", "click search button"][failed['index']] if failed.get('index') is not None else "run the search"
+                return False, f"Failed to {step}: {failed.get('error', 'Unknown error from bridge.')}"
 
             return True, f"Successfully performed Google search for '{query}'."
 
@@ -18,6 +18,31 @@ DEFAULT_SETTINGS = {
     "VISION_MODEL": "gemma:7b",
     "TEMPERATURE": 0.7,
     "TOP_P": 1.0,
+    "MODEL_KEEP_ALIVE": {  # How long Ollama keeps each role's model loaded between calls
+        "main": "30m",
+        "supervisor": "10m",
+        "fast": "30m",
+        "vision": "30m",
+        "scripter": "5m"
+    },
+    "LLM_MAX_LOADED_MODELS": 1,  # Models Ollama can hold in memory at once; calls are grouped to avoid swapping
+    "LLM_MAX_CONCURRENT_PER_MODEL": 2,  # Calls sent to the same model at the same time
+    "LLM_SWAP_GRACE": 2.0,  # Seconds a call for an unloaded model yields to calls for loaded ones
+    "OLLAMA_HOSTS": [],  # Ollama servers to spread calls over, e.g. ["http://127.0.0.1:11434", "http://gpu-box:11434"]. Empty uses the default server
+    "OLLAMA_CIRCUIT_FAILURES": 3,  # Consecutive errors after which a server gets no calls for a while
+    "OLLAMA_CIRCUIT_COOLDOWN": 30.0,  # Seconds a failing server is left alone
+    "OLLAMA_HEDGE_DELAY": 1.0,  # Seconds before a slow validator call is also sent to a second server (0 disables)
+    "MODEL_CHECK_TTL": 300.0,  # Seconds a server's model list is trusted before it is fetched again
+    "STRUCTURED_OUTPUT_REPAIRS": 1,  # Extra attempts when a plan, action or constitution doesn't match its schema
+    "TACTICAL_BATCHING": True,  # Turn a whole plan into actions with one vision call instead of one per step
+    "MODEL_CASCADE": True,  # Let FAST_MODEL plan and act from the page text first, escalating to the main or vision model when unsure
+    "CASCADE_CONFIDENCE_THRESHOLD": 0.75,  # Fast-model answers below this confidence_score are escalated
+    "VALIDATION_CACHE_SIZE": 256,  # Validator verdicts remembered for identical (objective, page, action) questions
+    "VALIDATION_SKIP_CONFIDENCE": 0.9,  # Actions at or above this confidence are not sent to the validator
+    "VALIDATION_SKIP_TOOLS": ["get_page_content", "get_all_links", "find_elements_by_text", "get_element_details", "take_screenshot"],  # Read-only tools are never validated
+    "HISTORY_TOKEN_BUDGET": 1500,  # Approximate tokens of step history sent to the planner
+    "HISTORY_RECENT_ENTRIES": 8,  # Most recent history entries sent verbatim; older ones are summarized
+    "HISTORY_RESULT_MAX_CHARS": 500,  # Tool results longer than this are shortened in the planner's history
 
     # Low Memory Mode
     "LOW_MEMORY_MODE": True,
@@ -28,31 +53,36 @@ DEFAULT_SETTINGS = {
 
     # Dynamic Model Selection
     "ENABLE_DYNAMIC_MODEL_SELECTION": True,
-    "TASK_MODEL_MAPPING": {
-        "research": {
-            "MAIN_MODEL": "mixtral:latest",
-            "SUPERVISOR_MODEL": "mixtral:latest"
-        },
-        "data_entry": {
-            "MAIN_MODEL": "mistral:7b",
-            "FAST_MODEL": "phi3"
-        },
-        "default": {
-            "MAIN_MODEL": "mixtral:latest",
-            "SUPERVISOR_MODEL": "mixtral:latest",
-            "FAST_MODEL": "phi3",
-            "VISION_MODEL": "gemma:7b"
-        }
+    "MODEL_STATS_PATH": "model_stats.json",  # Per-model latency, parse rate and run outcomes, kept across runs
+    "MODEL_STATS_MAX_RUNS": 50,  # Runs remembered per role and model
+    "MODEL_LATENCY_BUDGET": {  # Seconds per call a role's model may take on average to be selected
+        "main": 20.0,
+        "supervisor": 30.0,
+        "fast": 5.0,
+        "vision": 20.0
     },
+    "MODEL_SELECTION_MIN_RUNS": 2,  # Similar past runs (same domain or objective) a model needs before it is selected
+    "MODEL_SELECTION_MIN_SUCCESS_RATE": 0.5,
+    "MODEL_SELECTION_MIN_PARSE_RATE": 0.8,  # Share of structured outputs that matched their schema
+    "CONSTITUTION_CACHE_PATH": "constitution_cache.json",  # Generated constitutions, keyed by objective template
+    "CONSTITUTION_CACHE_TTL": 604800,  # Seconds a cached constitution is reused (7 days)
+    "CONSTITUTION_CACHE_SIZE": 200,  # Least recently used templates are dropped beyond this
 
     # Browser Configuration
     "AUTO_OPEN_BROWSER": True,
     "HEADLESS_BROWSER": False,
+    "BROWSER_BACKEND": "bridge",  # "bridge" (UI iframe) or "playwright" (headless, no UI tab needed)
     "BROWSER_TYPE": "chromium",
+    "SESSION_POOL_SIZE": 1,  # Browser sessions (bridges or headless browsers) that agents can run on in parallel
+    "SESSION_MAX_RUNS": 20,  # Runs after which a session's browser is recycled
+    "SESSION_QUEUE_SIZE": 4,  # Runs allowed to wait for a free session before new ones are rejected
+    "SESSION_ACQUIRE_TIMEOUT": 300.0,  # Seconds a queued run waits for a session
     "USER_AGENT": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36",
     "VIEWPORT_WIDTH": 1280,
     "VIEWPORT_HEIGHT": 720,
     "SCREENSHOT_FULL_PAGE": True,
+    "PAGE_LOAD_TIMEOUT": 30.0,  # Seconds to wait for a page to load
+    "NETWORK_IDLE_TIMEOUT": 5.0,  # Seconds to wait for the network to go quiet after a load
     "LOAD_IMAGES": True,
     "ENABLE_JAVASCRIPT": True,
 
@@ -74,11 +104,27 @@ DEFAULT_SETTINGS = {
     "CRITIQUE_FILE": "critique_log.txt",
     "SAVE_SCREENSHOTS": True,
     "SCREENSHOT_DIR": "runs/screenshots",
+    "ANNOTATION_FORMAT": "PNG",  # PNG, WEBP or JPEG
+    "ANNOTATION_QUALITY": 80,  # Used by WEBP and JPEG
 
     # Advanced Features
     "ENABLE_MACROS": True,
     "ENABLE_STRATEGY_LEARNING": True,
     "ENABLE_WEBSITE_GRAPH": True,
+    "OBSERVATION_CACHE_SIZE": 8,
+    "OBSERVATION_HASH_THRESHOLD": 4,  # Max differing perceptual-hash bits for an "unchanged" page
+    "ELEMENT_CROP_PADDING": 8,  # Pixels of context kept around element crops for the vision model
+    "ELEMENT_CROP_MAX_SIZE": 256,  # Element crops are downscaled to fit in this many pixels per side
+    "FINALIZER_QUEUE_SIZE": 8,  # Finished runs waiting for background finalization before new ones wait
+    "FINALIZER_BATCH_SIZE": 4,  # Runs finalized together, with one critique call and one write per file
+    "FINALIZER_COALESCE_DELAY": 2.0,  # Seconds the finalizer waits for more runs to join a batch
+    "VISION_IMAGE_FORMAT": "JPEG",  # JPEG, WEBP or PNG for screenshots sent to the vision model
+    "VISION_IMAGE_QUALITY": 85,  # Used by WEBP and JPEG
+    "VISION_CROP_TO_VIEWPORT": True,  # Send the visible part of full-page screenshots only
+    # Longest image side each vision model family works at, by model name prefix. Larger images
+    # are downscaled before they are sent.
+    "VISION_INPUT_SIZES": {"default": 1024, "llava": 672, "bakllava": 672, "moondream": 378,
+                           "gemma3": 896, "llama3.2-vision": 1120, "minicpm-v": 1344, "qwen2.5vl": 1288},
 
     # File Paths
     "PREPROCESSOR_PATH": "preprocessor.js",
@@ -139,6 +185,12 @@ def update_globals(config):
 config = get_config()
 update_globals(config)
 
+def get_setting(key, default=None):
+    """
+    Returns the current value of a single setting.
+    """
+    return globals().get(key, DEFAULT_SETTINGS.get(key, default))
+
 # For any code that needs to dynamically update settings
 def update_setting(key, value):
     """
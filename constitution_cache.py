@@ -0,0 +1,95 @@
+# FILE: constitution_cache.py
+
+import hashlib
+import json
+import os
+import re
+import time
+from typing import Dict, Optional
+
+# A quote only opens or closes a value away from letters, so apostrophes in words are kept.
+_QUOTED = re.compile(r"(?<!\w)(?:\"[^\"]*\"|'[^']*'|“[^”]*”)(?!\w)")
+_URL = re.compile(r"\b(?:https?://|www\.)\S+")
+_EMAIL = re.compile(r"\b[\w.+-]+@[\w-]+\.[\w.-]+\b")
+_NUMBER = re.compile(r"\d+(?:[.,:/-]\d+)*")
+
+
+def normalize_objective(objective: str) -> str:
+    """
+    Reduces an objective to its template: lowercase, single spaces, and quoted values,
+    URLs, e-mail addresses and numbers replaced by placeholders. Objectives that differ
+    only in those values share a template.
+    """
+    template = _QUOTED.sub("<value>", objective)
+    template = _URL.sub("<url>", template)
+    template = _EMAIL.sub("<email>", template)
+    template = _NUMBER.sub("<n>", template)
+    return " ".join(template.lower().split()).strip(" .!?")
+
+
+class ConstitutionCache:
+    """
+    Keeps generated constitutions in a JSON file, keyed by the objective's template and
+    whatever else decides what the supervisor would answer (its model and prompt).
+    Entries expire after `ttl` seconds, and the least recently used are dropped beyond
+    `max_entries`.
+    """
+    def __init__(self, cache_file_path: str, ttl: float = 7 * 24 * 3600, max_entries: int = 200):
+        self.cache_file_path = cache_file_path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.entries: Dict[str, Dict] = self._load_entries()
+        self.stats = {"hits": 0, "misses": 0, "expired": 0}
+
+    def _load_entries(self) -> Dict[str, Dict]:
+        if os.path.exists(self.cache_file_path):
+            try:
+                with open(self.cache_file_path, 'r', encoding='utf-8') as f:
+                    return json.load(f)
+            except (OSError, json.JSONDecodeError) as e:
+                print(f"[ERROR] Could not read the constitution cache {self.cache_file_path}: {e}")
+        return {}
+
+    def _save_entries(self):
+        temp_path = f"{self.cache_file_path}.tmp"
+        try:
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump(self.entries, f, indent=4)
+            os.replace(temp_path, self.cache_file_path)
+        except OSError as e:
+            print(f"[ERROR] Could not save the constitution cache {self.cache_file_path}: {e}")
+
+    @staticmethod
+    def make_key(template: str, *context: str) -> str:
+        return hashlib.sha1(json.dumps([template, *context]).encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[Dict[str, str]]:
+        # Re-read, so constitutions generated by runs in other processes are found too.
+        self.entries = self._load_entries()
+        entry = self.entries.get(key)
+        if entry is None:
+            self.stats["misses"] += 1
+            return None
+        if time.time() - entry["created"] > self.ttl:
+            self.stats["expired"] += 1
+            self.stats["misses"] += 1
+            del self.entries[key]
+            self._save_entries()
+            return None
+        self.stats["hits"] += 1
+        entry["last_used"] = time.time()
+        self._save_entries()
+        return entry["constitutions"]
+
+    def put(self, key: str, template: str, constitutions: Dict[str, str]):
+        self.entries = self._load_entries()
+        now = time.time()
+        self.entries[key] = {"template": template, "created": now, "last_used": now, "constitutions": constitutions}
+        expired = [k for k, entry in self.entries.items() if now - entry["created"] > self.ttl]
+        for k in expired:
+            del self.entries[k]
+        if len(self.entries) > self.max_entries:
+            by_use = sorted(self.entries, key=lambda k: self.entries[k]["last_used"])
+            for k in by_use[:len(self.entries) - self.max_entries]:
+                del self.entries[k]
+        self._save_entries()
@@ -0,0 +1,143 @@
+# FILE: finalizer.py
+
+import asyncio
+from datetime import datetime
+from typing import Dict, List, Optional
+import config
+from strategy_manager import StrategyManager
+from website_graph import WebsiteGraph
+
+DEVELOPER_SUGGESTIONS_FILE = "developer_suggestions.log"
+
+
+class RunFinalizer:
+    """
+    Finishes agent runs in the background so the next run does not wait for them.
+
+    Finished runs go into a bounded queue that one worker drains. Runs that are waiting
+    together when the worker picks them up are handled as one batch:
+    - each file (website graph, strategies) is read and written once for the batch;
+    - one self-critique call covers every run in the batch.
+    When the queue is full, submitting waits for room.
+    """
+    def __init__(self, max_queued: int = 8, max_batch: int = 4, coalesce_delay: float = 2.0):
+        self.max_queued = max_queued
+        self.max_batch = max(1, max_batch)
+        self.coalesce_delay = coalesce_delay
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+        self.stats = {"runs": 0, "batches": 0, "graph_writes": 0, "strategy_writes": 0, "critique_calls": 0}
+
+    def _ensure_worker(self):
+        loop = asyncio.get_running_loop()
+        if self._worker is None or self._worker.done() or self._worker.get_loop() is not loop:
+            self._queue = asyncio.Queue(maxsize=self.max_queued)
+            self._worker = loop.create_task(self._work())
+
+    async def submit(self, agent):
+        """Queues a finished agent run for finalization."""
+        self._ensure_worker()
+        if self._queue.full():
+            print("[FINALIZER] Queue is full. Waiting for earlier runs to be finalized...")
+        await self._queue.put(agent)
+
+    async def drain(self):
+        """Waits until every queued run is finalized, e.g. before the process exits."""
+        if self._queue is not None and self._worker is not None and not self._worker.done():
+            await self._queue.join()
+
+    async def _work(self):
+        while True:
+            batch = [await self._queue.get()]
+            # Give runs that finish at nearly the same time a moment to join this batch.
+            await asyncio.sleep(self.coalesce_delay)
+            while len(batch) < self.max_batch and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            try:
+                await self._finalize(batch)
+            except Exception as e:
+                print(f"[ERROR] Failed to finalize {len(batch)} run(s): {e}")
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    async def _finalize(self, agents: List):
+        self.stats["runs"] += len(agents)
+        self.stats["batches"] += 1
+        print(f"[FINALIZER] Finalizing {len(agents)} run(s).")
+        # Each step runs even if an earlier one failed, so one bad file does not cost the others.
+        try:
+            await asyncio.to_thread(self._flush_graphs, agents)
+        except Exception as e:
+            print(f"[ERROR] Failed to save the website graphs of {len(agents)} run(s): {e}")
+        try:
+            await asyncio.to_thread(self._flush_strategies, agents)
+        except Exception as e:
+            print(f"[ERROR] Failed to save the strategies of {len(agents)} run(s): {e}")
+        try:
+            await self._critique(agents)
+        except Exception as e:
+            print(f"[ERROR] Failed to critique {len(agents)} run(s): {e}")
+
+    def _flush_graphs(self, agents: List):
+        graphs: Dict[str, List[WebsiteGraph]] = {}
+        for agent in agents:
+            graphs.setdefault(agent.website_graph.graph_file_path, []).append(agent.website_graph)
+        for path, run_graphs in graphs.items():
+            # Reloaded, so pages other processes saved since these runs started are kept.
+            merged = WebsiteGraph(graph_file_path=path)
+            for graph in run_graphs:
+                merged.merge(graph.graph)
+            merged.save_graph()
+            self.stats["graph_writes"] += 1
+
+    def _flush_strategies(self, agents: List):
+        strategies: Dict[str, List] = {}
+        for agent in agents:
+            actions = agent.strategy_callback_handler.actions
+            if actions:
+                domain = agent.strategy_manager.get_domain(agent.start_url)
+                strategies.setdefault(agent.strategy_manager.strategy_file_path, []).append((domain, agent.objective, actions))
+        for path, new_strategies in strategies.items():
+            if StrategyManager(path).save_strategies(new_strategies):
+                self.stats["strategy_writes"] += 1
+
+    async def _critique(self, agents: List):
+        by_file: Dict[str, List] = {}
+        for agent in agents:
+            by_file.setdefault(agent.critique_file, []).append(agent)
+        for critique_file, runs in by_file.items():
+            if len(runs) == 1:
+                session_logs = [runs[0].working_memory.get_history()]
+            else:
+                # Several runs share one call, so each is sent in its compact form.
+                session_logs = [run.working_memory.get_history_for_prompt() for run in runs]
+            critique = await runs[-1].ai_model.get_batch_self_critique(session_logs)
+            self.stats["critique_calls"] += 1
+            await asyncio.to_thread(self._write_critique, critique_file, critique)
+
+    @staticmethod
+    def _write_critique(critique_file: str, critique: str):
+        if critique.startswith("Directive for developer:"):
+            with open(DEVELOPER_SUGGESTIONS_FILE, 'a', encoding='utf-8') as f:
+                f.write(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] {critique}\n")
+            print(f"[INFO] Developer suggestion logged to {DEVELOPER_SUGGESTIONS_FILE}")
+        else:
+            with open(critique_file, 'w', encoding='utf-8', errors='ignore') as f:
+                f.write(critique)
+            print(f"[INFO] Agent critique logged to {critique_file}")
+
+
+_finalizer: Optional[RunFinalizer] = None
+
+
+def get_finalizer() -> RunFinalizer:
+    """Returns the process-wide finalizer shared by every run."""
+    global _finalizer
+    if _finalizer is None:
+        _finalizer = RunFinalizer(
+            max_queued=config.get_setting('FINALIZER_QUEUE_SIZE', 8),
+            max_batch=config.get_setting('FINALIZER_BATCH_SIZE', 4),
+            coalesce_delay=config.get_setting('FINALIZER_COALESCE_DELAY', 2.0),
+        )
+    return _finalizer
@@ -0,0 +1,49 @@
+# FILE: image_prep.py
+
+import base64
+import io
+from typing import Dict, Optional
+from PIL import Image
+import config
+
+VISION_MIME_TYPES = {"JPEG": "image/jpeg", "WEBP": "image/webp", "PNG": "image/png"}
+
+
+def vision_input_size(model_name: str) -> int:
+    """
+    Longest image side the vision model works at, from VISION_INPUT_SIZES. Keys are model
+    name prefixes; the longest matching prefix wins, and "default" covers the rest.
+    """
+    sizes = config.get_setting('VISION_INPUT_SIZES') or {}
+    name = (model_name or "").lower().split(":", 1)[0]
+    matches = [prefix for prefix in sizes if prefix != "default" and name.startswith(prefix.lower())]
+    if matches:
+        return int(sizes[max(matches, key=len)])
+    return int(sizes.get("default", 1024))
+
+
+def prepare_vision_image(encoded_image: str, max_size: int, image_format: str = "JPEG", quality: int = 85,
+                         region: Optional[Dict] = None) -> str:
+    """
+    Crops a base64-encoded screenshot to `region` (a box in screenshot pixels), downscales
+    it to fit in max_size pixels per side and re-encodes it. A region outside the image is
+    ignored. Returns the result base64-encoded. CPU-bound, so meant to run in a worker thread.
+    """
+    img = Image.open(io.BytesIO(base64.b64decode(encoded_image)))
+    if region:
+        left = max(0, int(region['x']))
+        top = max(0, int(region['y']))
+        right = min(img.width, int(region['x'] + region['width']))
+        bottom = min(img.height, int(region['y'] + region['height']))
+        if right > left and bottom > top:
+            img = img.crop((left, top, right, bottom))
+
+    img.thumbnail((max_size, max_size), Image.Resampling.LANCZOS)
+    if image_format == "JPEG" and img.mode != "RGB":
+        img = img.convert("RGB")
+    buffer = io.BytesIO()
+    if image_format == "PNG":
+        img.save(buffer, format="PNG")
+    else:
+        img.save(buffer, format=image_format, quality=quality)
+    return base64.b64encode(buffer.getvalue()).decode('ascii')
@@ -0,0 +1,104 @@
+# FILE: json_stream.py
+
+import json
+from typing import Any, List, Optional
+
+
+class JSONObjectScanner:
+    """
+    Finds the first complete JSON object in text that arrives in pieces.
+
+    Tracks brace depth outside of strings, so it knows the moment the outermost object
+    closes without re-reading what came before. Text around the object (prose, markdown
+    fences) is ignored. If a candidate turns out not to be valid JSON, scanning resumes
+    after its opening brace: when its span is balanced but does not parse, or as soon as
+    a brace is followed by something other than a key or "}" (e.g. a stray "{" before
+    the object), which could otherwise keep the span from ever balancing.
+    """
+    def __init__(self):
+        self._chunks: List[str] = []
+        self._length = 0
+        self._start: Optional[int] = None
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+        # True right after an opening brace, until the first character that is not whitespace.
+        self._expect_key = False
+        self.result: Optional[Any] = None
+
+    @property
+    def text(self) -> str:
+        return "".join(self._chunks)
+
+    def feed(self, chunk: str) -> Optional[Any]:
+        """Adds a chunk of text. Returns the parsed object once it is complete, otherwise None."""
+        if self.result is not None or not chunk:
+            return self.result
+        offset = self._length
+        self._chunks.append(chunk)
+        self._length += len(chunk)
+        self._scan(chunk, offset)
+        return self.result
+
+    def _scan(self, chunk: str, offset: int):
+        for i, char in enumerate(chunk):
+            if self._start is None:
+                if char == "{":
+                    self._start, self._depth, self._expect_key = offset + i, 1, True
+            elif self._expect_key and not char.isspace():
+                self._expect_key = False
+                if char not in '"}':
+                    # An object can only start with a key or end at once, so this candidate is not JSON.
+                    self._restart(chunk, offset, i, retry_current=True)
+                    return
+                if char == '"':
+                    self._in_string = True
+                else:
+                    self._depth -= 1
+                    if self._depth == 0:
+                        self._complete(chunk, offset, i)
+                        return
+            elif self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == "\\":
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                self._in_string = True
+            elif char == "{":
+                self._depth += 1
+                self._expect_key = True
+            elif char == "}":
+                self._depth -= 1
+                if self._depth == 0:
+                    self._complete(chunk, offset, i)
+                    return
+
+    def _complete(self, chunk: str, offset: int, i: int):
+        """Parses the balanced span that ends at chunk[i]."""
+        try:
+            self.result = json.loads(self.text[self._start:offset + i + 1])
+            self._start = None
+        except json.JSONDecodeError:
+            # Not JSON after all (e.g. "{name}" in prose). Look for the next brace.
+            self._restart(chunk, offset, i, retry_current=False)
+
+    def _restart(self, chunk: str, offset: int, i: int, retry_current: bool):
+        """
+        Drops the current candidate and scans again from just after its opening brace, up
+        to chunk[i] (itself included if `retry_current`), then the rest of the chunk.
+        """
+        text = self.text
+        start = self._start
+        self._start, self._depth, self._in_string, self._escaped, self._expect_key = None, 0, False, False, False
+        end = offset + i + 1
+        self._scan(text[start + 1:end], start + 1)
+        if self.result is None:
+            self._scan(chunk[i + 1:], end)
+
+
+def extract_json_object(text: str) -> Optional[Any]:
+    """Returns the first complete JSON object in `text`, or None."""
+    return JSONObjectScanner().feed(text)
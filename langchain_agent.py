@@ -279,11 +279,11 @@ class NavigateToURLTool(BrowserTool):
             if action["type"] == "goto":
                 await self.controller.goto_url(action["url"])
             elif action["type"] == "click":
+                # Path edges are recorded from URL changes, so every click loads a new page.
                 await self.controller.execute_action({
                     "action_type": "click",
                     "details": {"element_label": action["element_label"]}
-                })
-            await asyncio.sleep(1) # Small delay to allow page to settle
+                }, expect_navigation=True)
 
         return f"Successfully navigated to {url} by following a known path."
 
@@ -0,0 +1,218 @@
+# FILE: llm_scheduler.py
+
+import asyncio
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import Any, Dict, List, Optional
+import config
+
+
+class _Waiter:
+    def __init__(self, model_name: str):
+        self.model_name = model_name
+        self.since = time.monotonic()
+
+
+class ModelScheduler:
+    """
+    Decides when an LLM call may start, based on which Ollama models are loaded.
+
+    Only `max_loaded_models` models are assumed to fit in memory at once. Calls for a
+    loaded model start straight away (up to `max_concurrent_per_model` at a time), while
+    a call that would load another model waits until a loaded model is idle, and lets
+    calls for loaded models go first. This groups queued calls by model, so parallel
+    runs don't swap weights on every request. A call that has waited `swap_grace`
+    seconds may evict a model even if other calls are queued for it, so nothing starves.
+    One scheduler is shared by every run in the process, including runs on other event
+    loops: each loop waits on its own condition, and the shared state is guarded by a lock.
+    """
+    def __init__(self, max_loaded_models: int = 1, max_concurrent_per_model: int = 2, swap_grace: float = 2.0):
+        self.max_loaded_models = max(1, max_loaded_models)
+        self.max_concurrent_per_model = max(1, max_concurrent_per_model)
+        self.swap_grace = swap_grace
+
+        self._loaded: "OrderedDict[str, None]" = OrderedDict()  # least recently used first
+        self._active: Dict[str, int] = {}
+        self._waiters: List[_Waiter] = []
+        self._lock = threading.Lock()
+        self._conditions: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Condition]" = weakref.WeakKeyDictionary()
+        self._synced = False
+        self._stats: Dict[str, Dict[str, float]] = {}
+
+    def _model_stats(self, model_name: str) -> Dict[str, float]:
+        return self._stats.setdefault(model_name, {
+            "calls": 0, "loads": 0, "queue_time": 0.0, "load_time": 0.0, "inference_time": 0.0, "unmetered_time": 0.0,
+        })
+
+    async def _sync_loaded(self, client):
+        """Learns which models Ollama already has in memory, once."""
+        self._synced = True
+        if client is None:
+            return
+        try:
+            response = await client.ps()
+            for model in response.get('models') or []:
+                name = model.get('model') or model.get('name')
+                with self._lock:
+                    if name and len(self._loaded) < self.max_loaded_models:
+                        self._loaded[name] = None
+        except Exception as e:
+            print(f"[SCHEDULER] Could not list loaded models: {e}")
+
+    def _starving(self, waiter: _Waiter) -> bool:
+        return time.monotonic() - waiter.since >= self.swap_grace
+
+    def _evictable(self, waiter: _Waiter) -> Optional[str]:
+        """Returns the loaded model this waiter may replace, if any."""
+        starving = self._starving(waiter)
+        idle = [name for name in self._loaded if not self._active.get(name)]
+        for name in idle:
+            if not any(w.model_name == name for w in self._waiters):
+                return name
+        return idle[0] if idle and starving else None
+
+    def _can_start(self, waiter: _Waiter) -> bool:
+        name = waiter.model_name
+        if name in self._loaded:
+            if self._active.get(name, 0) >= self.max_concurrent_per_model:
+                return False
+            # A loader that has waited long enough drains the loaded models so it can swap one out.
+            if len(self._loaded) >= self.max_loaded_models and any(
+                    w.model_name not in self._loaded and self._starving(w) for w in self._waiters):
+                return False
+            # Calls for the same model start in the order they arrived.
+            return next(w for w in self._waiters if w.model_name == name) is waiter
+        # Loading a model: let calls for loaded models go first, then the oldest loader.
+        if any(w.model_name in self._loaded for w in self._waiters) and not self._starving(waiter):
+            return False
+        if next(w for w in self._waiters if w.model_name not in self._loaded) is not waiter:
+            return False
+        return len(self._loaded) < self.max_loaded_models or self._evictable(waiter) is not None
+
+    def _start(self, waiter: _Waiter) -> bool:
+        """Claims a slot for the waiter. Returns True if its model has to be loaded."""
+        name = waiter.model_name
+        needs_load = name not in self._loaded
+        if needs_load and len(self._loaded) >= self.max_loaded_models:
+            evicted = self._evictable(waiter)
+            del self._loaded[evicted]
+            print(f"[SCHEDULER] Swapping out '{evicted}' to load '{name}'.")
+        self._loaded[name] = None
+        self._loaded.move_to_end(name)
+        self._active[name] = self._active.get(name, 0) + 1
+        self._waiters.remove(waiter)
+        return needs_load
+
+    def _condition(self) -> asyncio.Condition:
+        """The condition calls on the running loop wait on."""
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            condition = self._conditions.get(loop)
+            if condition is None:
+                condition = self._conditions[loop] = asyncio.Condition()
+        return condition
+
+    def _notify_all(self):
+        """Wakes waiting calls on every loop. Must be called holding the running loop's condition."""
+        current = asyncio.get_running_loop()
+        with self._lock:
+            conditions = list(self._conditions.items())
+        for loop, condition in conditions:
+            if loop is current:
+                condition.notify_all()
+            elif not loop.is_closed():
+                try:
+                    loop.call_soon_threadsafe(lambda c=condition: asyncio.ensure_future(self._wake(c)))
+                except RuntimeError:
+                    pass  # The loop closed meanwhile.
+
+    @staticmethod
+    async def _wake(condition: asyncio.Condition):
+        async with condition:
+            condition.notify_all()
+
+    @asynccontextmanager
+    async def slot(self, model_name: str, client=None):
+        """Waits until a call to `model_name` may start, and holds its slot while it runs."""
+        waiter = _Waiter(model_name)
+        condition = self._condition()
+        async with condition:
+            if not self._synced:
+                await self._sync_loaded(client)
+            with self._lock:
+                self._waiters.append(waiter)
+            try:
+                while True:
+                    with self._lock:
+                        needs_load = self._start(waiter) if self._can_start(waiter) else None
+                    if needs_load is not None:
+                        break
+                    # Re-check periodically so a starving loader can claim an idle model.
+                    try:
+                        await asyncio.wait_for(condition.wait(), self.swap_grace)
+                    except asyncio.TimeoutError:
+                        pass
+            except BaseException:
+                with self._lock:
+                    if waiter in self._waiters:
+                        self._waiters.remove(waiter)
+                self._notify_all()
+                raise
+            # Waking the others lets calls for the same model run alongside this one.
+            self._notify_all()
+
+        stats = self._model_stats(model_name)
+        stats["calls"] += 1
+        stats["queue_time"] += time.monotonic() - waiter.since
+        if needs_load:
+            stats["loads"] += 1
+        try:
+            yield
+        finally:
+            async with condition:
+                with self._lock:
+                    self._active[model_name] -= 1
+                self._notify_all()
+
+    def record(self, model_name: str, call_stats: Dict[str, Any]):
+        """Adds the load and inference time Ollama reported for a finished call."""
+        stats = self._model_stats(model_name)
+        load_time = call_stats.get("load_time")
+        if load_time is None:
+            # A call cut short has no load time, so its time cannot be split.
+            stats["unmetered_time"] += call_stats.get("total_time") or 0.0
+            return
+        stats["load_time"] += load_time
+        stats["inference_time"] += max(0.0, (call_stats.get("total_time") or 0.0) - load_time)
+
+    def report(self) -> Dict[str, Any]:
+        """Load versus inference time per model since the server started."""
+        models = {name: {key: round(value, 3) for key, value in stats.items()} for name, stats in self._stats.items()}
+        load_time = sum(s["load_time"] for s in self._stats.values())
+        inference_time = sum(s["inference_time"] for s in self._stats.values())
+        return {
+            "loaded": list(self._loaded),
+            "waiting": len(self._waiters),
+            "load_time": round(load_time, 3),
+            "inference_time": round(inference_time, 3),
+            "models": models,
+        }
+
+
+_scheduler: Optional[ModelScheduler] = None
+
+
+def get_llm_scheduler() -> ModelScheduler:
+    """Returns the process-wide scheduler, creating it from the current settings."""
+    global _scheduler
+    if _scheduler is None:
+        _scheduler = ModelScheduler(
+            # Each Ollama server holds its own set of loaded models.
+            max_loaded_models=config.get_setting('LLM_MAX_LOADED_MODELS', 1) * max(1, len(config.get_setting('OLLAMA_HOSTS') or [])),
+            max_concurrent_per_model=config.get_setting('LLM_MAX_CONCURRENT_PER_MODEL', 2),
+            swap_grace=config.get_setting('LLM_SWAP_GRACE', 2.0),
+        )
+    return _scheduler
@@ -0,0 +1,58 @@
+# FILE: llm_schemas.py
+
+from typing import Any, Dict, List
+from pydantic import BaseModel, ConfigDict, Field, field_validator
+
+# Schemas for the JSON the models are asked to produce. They mirror the response formats
+# in constitution.py, are sent to Ollama as `format` to constrain generation, and validate
+# what comes back.
+
+
+class StrategicPlan(BaseModel):
+    """AGENT_CONSTITUTION: {"reflection": "...", "world_model": "...", "plan": ["...", "..."]}"""
+    reflection: str = Field(description="What happened so far and what was learned from it.")
+    world_model: str = Field(description="The agent's understanding of the current page and situation.")
+    plan: List[str] = Field(description="Concise, high-level steps that achieve the objective from here.")
+
+
+class ScoredStrategicPlan(StrategicPlan):
+    """A plan with the model's confidence in it, asked of the fast model so it can hand over when unsure."""
+    confidence_score: float = Field(description="Confidence that the plan is right, from 0.0 to 1.0.")
+
+
+class TacticalAction(BaseModel):
+    """ACTION_CONSTITUTION: {"thought": "...", "confidence_score": <float>, "tool": "...", "params": {...}}"""
+    model_config = ConfigDict(extra="allow")
+
+    thought: str = Field(description="Why this tool was chosen and how confident the choice is.")
+    confidence_score: float = Field(description="Confidence in the choice, from 0.0 to 1.0.")
+    tool: str = Field(description="Name of the tool to run.")
+    params: Dict[str, Any] = Field(default_factory=dict, description="Arguments for the tool.")
+    potential_actions: List[Dict[str, Any]] = Field(
+        default_factory=list,
+        description="Up to 3 alternative actions, required when confidence_score is below 0.7."
+    )
+
+    @field_validator("potential_actions", mode="before")
+    @classmethod
+    def _potential_actions_list(cls, value):
+        # Alternatives are optional, so a malformed list is dropped instead of failing the action.
+        if not isinstance(value, list):
+            return []
+        return [action for action in value if isinstance(action, dict)]
+
+
+class TacticalActionPlan(BaseModel):
+    """One action per plan step, in plan order, from a single tactical call."""
+    actions: List[TacticalAction]
+
+
+class DynamicConstitutions(BaseModel):
+    """SUPERVISOR_CONSTITUTION: {"agent_constitution": "...", "action_constitution": "..."}"""
+    agent_constitution: str
+    action_constitution: str
+
+
+class ValidationDecision(BaseModel):
+    """Answer of the validator and verifier prompts."""
+    valid: bool
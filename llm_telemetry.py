@@ -0,0 +1,82 @@
+# FILE: llm_telemetry.py
+
+import json
+import os
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+
+class LLMTelemetry:
+    """
+    Collects the metrics Ollama reports for every call of one agent run, tagged with the
+    call's role (planner, tactical, validator, critique, vision-tool, scripter, ...).
+
+    Each call is appended to `metrics_path` as a JSON line as soon as it finishes, and
+    `on_update` receives the per-role totals after every call for live display.
+    """
+    def __init__(self, metrics_path: Optional[str] = None, on_update: Optional[Callable[[Dict[str, Any]], None]] = None):
+        self.metrics_path = metrics_path
+        self.on_update = on_update
+        self.records: List[Dict[str, Any]] = []
+        self._totals: Dict[str, Dict[str, float]] = {}
+
+    def record(self, stats: Dict[str, Any]):
+        record = dict(stats, type="call", timestamp=round(time.time(), 3))
+        self.records.append(record)
+
+        totals = self._totals.setdefault(record.get("call_type") or "unknown", {
+            "calls": 0, "metered_calls": 0, "total_time": 0.0, "ttft": 0.0, "load_time": 0.0,
+            "prompt_tokens": 0, "prompt_eval_time": 0.0, "completion_tokens": 0, "eval_time": 0.0,
+        })
+        totals["calls"] += 1
+        totals["total_time"] += record.get("total_time") or 0.0
+        totals["ttft"] += record.get("ttft") or 0.0
+        # A call whose stream was cut short has no Ollama metrics; it is counted, but not as zero tokens.
+        if record.get("eval_count") is not None:
+            totals["metered_calls"] += 1
+            totals["load_time"] += record.get("load_time") or 0.0
+            totals["prompt_tokens"] += record.get("prompt_eval_count") or 0
+            totals["prompt_eval_time"] += record.get("prompt_eval_time") or 0.0
+            totals["completion_tokens"] += record["eval_count"]
+            totals["eval_time"] += record.get("eval_time") or 0.0
+
+        self._append(record)
+        if self.on_update:
+            try:
+                self.on_update(self.summary())
+            except Exception as e:
+                print(f"[LLM] Could not publish metrics: {e}")
+
+    def summary(self) -> Dict[str, Dict[str, Any]]:
+        """Per-role totals, heaviest role first, with mean latency and generation speed."""
+        summary = {}
+        for call_type, totals in sorted(self._totals.items(), key=lambda item: -item[1]["total_time"]):
+            calls = max(1, totals["calls"])
+            summary[call_type] = {
+                "calls": totals["calls"],
+                "unmetered_calls": totals["calls"] - totals["metered_calls"],
+                "total_time": round(totals["total_time"], 3),
+                "mean_time": round(totals["total_time"] / calls, 3),
+                "mean_ttft": round(totals["ttft"] / calls, 3),
+                "load_time": round(totals["load_time"], 3),
+                "prompt_tokens": totals["prompt_tokens"],
+                "prompt_eval_time": round(totals["prompt_eval_time"], 3),
+                "completion_tokens": totals["completion_tokens"],
+                "eval_time": round(totals["eval_time"], 3),
+                "tokens_per_second": round(totals["completion_tokens"] / totals["eval_time"], 1) if totals["eval_time"] else None,
+            }
+        return summary
+
+    def write_totals(self):
+        """Appends the per-role totals as the last line of the metrics file."""
+        self._append({"type": "totals", "timestamp": round(time.time(), 3), "by_role": self.summary()})
+
+    def _append(self, line: Dict[str, Any]):
+        if not self.metrics_path:
+            return
+        try:
+            os.makedirs(os.path.dirname(self.metrics_path) or ".", exist_ok=True)
+            with open(self.metrics_path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(line, default=str) + "\n")
+        except OSError as e:
+            print(f"[LLM] Could not write metrics to {self.metrics_path}: {e}")
@@ -4,8 +4,10 @@ import argparse
 import asyncio
 from agent import WebAgent
 import config
+from session_pool import SessionPoolFullError
+from finalizer import get_finalizer
 
-async def run_agent_task(objective, url=config.START_URL, model=config.MAIN_MODEL, supervisor_model=config.SUPERVISOR_MODEL, fast_model=config.FAST_MODEL, vision_model=config.VISION_MODEL, max_steps=config.MAX_STEPS, low_memory=False, clarification_request_queue=None, clarification_response_queue=None, navigation_queue=None, paused_event=None, stopped_event=None, socketio=None):
+async def run_agent_task(objective, url=config.START_URL, model=config.MAIN_MODEL, supervisor_model=config.SUPERVISOR_MODEL, fast_model=config.FAST_MODEL, vision_model=config.VISION_MODEL, max_steps=config.MAX_STEPS, low_memory=False, clarification_request_queue=None, clarification_response_queue=None, navigation_queue=None, paused_event=None, stopped_event=None, socketio=None, session_pool=None, session_key=None):
     # Override models for low memory mode
     if low_memory or config.LOW_MEMORY_MODE:
         print("[INFO] Low memory mode enabled. Using smaller models.")
@@ -14,6 +16,19 @@ async def run_agent_task(objective, url=config.START_URL, model=config.MAIN_MODE
         fast_model = config.LOW_MEMORY_FAST_MODEL
         vision_model = config.LOW_MEMORY_VISION_MODEL
 
+    # When running alongside other agents, lease a browser session for the whole run. With a
+    # session_key (the UI tab that started the run), the session drives that tab's browser.
+    session = None
+    if session_pool:
+        try:
+            session = await session_pool.acquire(session_key)
+        except (SessionPoolFullError, TimeoutError) as e:
+            print(f"[FATAL] No browser session available: {e}")
+            return
+        except Exception as e:
+            print(f"[FATAL] Failed to start a browser session: {e}")
+            return
+
     try:
         agent = WebAgent(
             objective=objective,
@@ -28,21 +43,27 @@ async def run_agent_task(objective, url=config.START_URL, model=config.MAIN_MODE
             navigation_queue=navigation_queue,
             paused_event=paused_event,
             stopped_event=stopped_event,
-            socketio=socketio
+            socketio=socketio,
+            browser_backend=session.backend if session else None
         )
     except Exception as e:
         print(f"[FATAL] Failed to initialize the agent: {e}")
+        if session:
+            await session_pool.release(session)
         return
 
     try:
         await agent.run()
     finally:
-        # This block ensures that critique happens even if the run loop fails
+        # This block ensures that critique happens even if the run loop fails. The critique
+        # itself runs in the background, so the session is released right after.
         print("[INFO] Run loop finished. Proceeding to save and critique.")
         await agent.save_and_critique()
         # Ensure browser closes if it's still open, e.g., after an error
         await agent.browser.close()
         print("[INFO] Browser closed.")
+        if session:
+            await session_pool.release(session)
 
 async def main():
     parser = argparse.ArgumentParser(description="Run the professional Web Agent.")
@@ -78,6 +99,8 @@ async def main():
         max_steps=args.max_steps,
         low_memory=args.low_memory
     )
+    # The run's graph, strategy and critique are written in the background; let them finish.
+    await get_finalizer().drain()
 
 if __name__ == "__main__":
     try:
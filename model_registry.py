@@ -0,0 +1,155 @@
+# FILE: model_registry.py
+
+import asyncio
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+import config
+from ollama_pool import OllamaEndpoint, OllamaEndpointPool, get_ollama_pool
+
+
+def normalize_model_name(model_name: str) -> str:
+    """Ollama lists untagged models under their ':latest' tag."""
+    return model_name if ":" in model_name.rsplit("/", 1)[-1] else f"{model_name}:latest"
+
+
+class ModelRegistry:
+    """
+    Makes sure the models the agent uses are present on every Ollama server, without
+    holding up startup.
+
+    Each server's model list is fetched once per `ttl` seconds and shared by every check
+    in the process, and the servers are asked in parallel. A model that is missing is
+    pulled in the background, and its download progress goes to the callbacks subscribed
+    to that model, so each run only hears about the models it uses. A call only waits
+    for the check (or pull) of the model it is about to use.
+    """
+    def __init__(self, pool: OllamaEndpointPool, ttl: float = 300.0):
+        self.pool = pool
+        self.ttl = ttl
+        # Model -> progress callbacks of the runs waiting for it.
+        self._subscribers: Dict[str, List[Callable[[Dict[str, Any]], None]]] = {}
+        # Endpoint name -> (time listed, model names), and the list requests in flight.
+        self._listings: Dict[str, Tuple[float, set]] = {}
+        self._list_tasks: Dict[str, asyncio.Task] = {}
+        # (endpoint name, model) -> time the model was last seen or pulled there.
+        self._confirmed: Dict[Tuple[str, str], float] = {}
+        self._tasks: Dict[str, asyncio.Task] = {}
+
+    def is_confirmed(self, model_name: str) -> bool:
+        """True if the model was seen on every reachable server within the TTL."""
+        model_name = normalize_model_name(model_name)
+        now = time.monotonic()
+        return all(now - self._confirmed.get((ep.name, model_name), float("-inf")) < self.ttl
+                   for ep in self.pool.available())
+
+    def forget(self, endpoint: OllamaEndpoint, model_name: str):
+        """Drops what is known about the model on `endpoint`, e.g. after it answered 404, so the next check looks again."""
+        self._confirmed.pop((endpoint.name, normalize_model_name(model_name)), None)
+        self._listings.pop(endpoint.name, None)
+
+    def prefetch(self, model_names: Iterable[str], on_progress: Optional[Callable[[Dict[str, Any]], None]] = None) -> List[asyncio.Task]:
+        """
+        Starts checking the given models in the background, and subscribes `on_progress` to
+        their pull progress until it is unsubscribed. Must be called from a running loop.
+        """
+        model_names = [name for name in dict.fromkeys(model_names) if name]
+        if on_progress is not None:
+            self.subscribe(model_names, on_progress)
+        return [self._task_for(name) for name in model_names if not self.is_confirmed(name)]
+
+    def subscribe(self, model_names: Iterable[str], on_progress: Callable[[Dict[str, Any]], None]):
+        for name in model_names:
+            subscribers = self._subscribers.setdefault(normalize_model_name(name), [])
+            if on_progress not in subscribers:
+                subscribers.append(on_progress)
+
+    def unsubscribe(self, on_progress: Callable[[Dict[str, Any]], None]):
+        """Stops sending pull progress to `on_progress`, e.g. when its run has ended."""
+        for name, subscribers in list(self._subscribers.items()):
+            if on_progress in subscribers:
+                subscribers.remove(on_progress)
+            if not subscribers:
+                del self._subscribers[name]
+
+    async def ensure(self, model_name: str):
+        """Waits until the model is known to be available, pulling it if needed. Never raises."""
+        if self.is_confirmed(model_name):
+            return
+        # Shielded, so a cancelled call does not abort a pull other calls are waiting for.
+        await asyncio.shield(self._task_for(model_name))
+
+    def _task_for(self, model_name: str) -> asyncio.Task:
+        model_name = normalize_model_name(model_name)
+        loop = asyncio.get_running_loop()
+        task = self._tasks.get(model_name)
+        if task is None or task.done() or task.get_loop() is not loop:
+            task = self._tasks[model_name] = loop.create_task(self._ensure_model(model_name))
+        return task
+
+    async def _ensure_model(self, model_name: str):
+        await asyncio.gather(*(self._ensure_on(ep, model_name) for ep in self.pool.available()))
+
+    async def _ensure_on(self, endpoint: OllamaEndpoint, model_name: str):
+        try:
+            local_models = await self._list(endpoint)
+            if model_name not in local_models:
+                print(f"[INFO] Model '{model_name}' not found on {endpoint.name}. Pulling it in the background...")
+                await self._pull(endpoint, model_name)
+                local_models.add(model_name)
+                print(f"[SUCCESS] Model '{model_name}' pulled on {endpoint.name}.")
+            self._confirmed[(endpoint.name, model_name)] = time.monotonic()
+        except Exception as e:
+            # The call itself will report the error if the model really is unavailable.
+            print(f"[ERROR] Could not make model '{model_name}' available on {endpoint.name}: {e}")
+            print(f"You can also try pulling it manually: 'ollama pull {model_name}'")
+            self._publish({"model": model_name, "host": endpoint.name, "status": "error", "error": str(e)})
+
+    async def _list(self, endpoint: OllamaEndpoint) -> set:
+        listed = self._listings.get(endpoint.name)
+        if listed and time.monotonic() - listed[0] < self.ttl:
+            return listed[1]
+        loop = asyncio.get_running_loop()
+        task = self._list_tasks.get(endpoint.name)
+        if task is None or task.done() or task.get_loop() is not loop:
+            task = self._list_tasks[endpoint.name] = loop.create_task(self._fetch_list(endpoint))
+        return await asyncio.shield(task)
+
+    async def _fetch_list(self, endpoint: OllamaEndpoint) -> set:
+        try:
+            response = await endpoint.client.list()
+        except Exception:
+            self.pool.record_failure(endpoint)
+            raise
+        local_models = {m.model for m in response.models if m.model}
+        self._listings[endpoint.name] = (time.monotonic(), local_models)
+        return local_models
+
+    async def _pull(self, endpoint: OllamaEndpoint, model_name: str):
+        last_percent = None
+        last_status = None
+        async for progress in await endpoint.client.pull(model_name, stream=True):
+            percent = int(100 * progress.completed / progress.total) if progress.total and progress.completed else None
+            # Only status changes and whole-percent steps are published.
+            if progress.status == last_status and percent == last_percent:
+                continue
+            last_status, last_percent = progress.status, percent
+            self._publish({"model": model_name, "host": endpoint.name, "status": progress.status,
+                           "completed": progress.completed, "total": progress.total, "percent": percent})
+
+    def _publish(self, event: Dict[str, Any]):
+        for on_progress in list(self._subscribers.get(event["model"], ())):
+            try:
+                on_progress(event)
+            except Exception as e:
+                print(f"[INFO] Could not publish model pull progress: {e}")
+
+
+_registry: Optional[ModelRegistry] = None
+
+
+def get_model_registry() -> ModelRegistry:
+    """Returns the process-wide registry, so checks are shared by every run and the UI."""
+    global _registry
+    if _registry is None:
+        _registry = ModelRegistry(get_ollama_pool(), ttl=config.get_setting('MODEL_CHECK_TTL', 300.0))
+    return _registry
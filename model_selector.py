@@ -0,0 +1,119 @@
+# FILE: model_selector.py
+
+import json
+import os
+import re
+import time
+from typing import Any, Dict, List, Optional
+
+# Words that say nothing about what kind of task an objective is.
+_STOP_WORDS = {
+    "a", "an", "the", "and", "or", "to", "of", "in", "on", "for", "with", "at", "by", "from",
+    "is", "it", "this", "that", "me", "my", "i", "please", "then", "all", "find", "go", "page",
+}
+
+
+def objective_keywords(objective: str) -> List[str]:
+    """Normalized content words of an objective, for comparing objectives across runs."""
+    return sorted({word for word in re.findall(r"[a-z0-9]+", objective.lower()) if word not in _STOP_WORDS and len(word) > 1})
+
+
+class ModelSelector:
+    """
+    Picks each role's model from how models did in past runs, persisted in a JSON file.
+
+    For every run and role the file keeps the model used, its mean inference time per
+    call, its structured-output parse rate, and whether the run succeeded, together with
+    the run's domain and objective keywords. A role gets the fastest model within its
+    latency budget that parses reliably and has succeeded on runs like this one: the same
+    domain, or an objective sharing enough keywords. Without such history the configured
+    model is kept.
+    """
+    def __init__(self, stats_file_path: str, max_runs_per_model: int = 50):
+        self.stats_file_path = stats_file_path
+        self.max_runs_per_model = max_runs_per_model
+        self.stats = self._load_stats()
+
+    def _load_stats(self) -> Dict[str, Dict[str, List[Dict[str, Any]]]]:
+        if os.path.exists(self.stats_file_path):
+            try:
+                with open(self.stats_file_path, 'r', encoding='utf-8') as f:
+                    return json.load(f)
+            except (OSError, json.JSONDecodeError) as e:
+                print(f"[ERROR] Could not read model stats from {self.stats_file_path}: {e}")
+        return {}
+
+    def _save_stats(self):
+        # Written to a temporary file first so a crash never leaves a truncated file behind.
+        temp_path = f"{self.stats_file_path}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.stats, f, indent=4)
+        os.replace(temp_path, self.stats_file_path)
+
+    @staticmethod
+    def _similar(run: Dict[str, Any], domain: str, keywords: List[str], min_overlap: float) -> bool:
+        if domain and run.get("domain") == domain:
+            return True
+        run_keywords = set(run.get("keywords") or [])
+        if not run_keywords or not keywords:
+            return False
+        return len(run_keywords & set(keywords)) / len(run_keywords | set(keywords)) >= min_overlap
+
+    def select(self, role: str, default_model: str, objective: str, domain: str, latency_budget: Optional[float],
+               min_runs: int = 2, min_success_rate: float = 0.5, min_parse_rate: float = 0.8,
+               min_overlap: float = 0.3) -> str:
+        """Returns the model for `role`, or `default_model` if no model qualifies."""
+        keywords = objective_keywords(objective)
+        candidates = []
+        for model_name, runs in self.stats.get(role, {}).items():
+            calls = sum(run["calls"] for run in runs)
+            if not calls:
+                continue
+            # Speed and parse rate are properties of the model, so every run counts for them.
+            latency = sum(run["mean_latency"] * run["calls"] for run in runs) / calls
+            attempts = sum(run.get("parse_attempts", 0) for run in runs)
+            parse_rate = 1 - sum(run.get("parse_failures", 0) for run in runs) / attempts if attempts else 1.0
+            similar = [run for run in runs if self._similar(run, domain, keywords, min_overlap)]
+            if len(similar) < min_runs:
+                continue
+            success_rate = sum(1 for run in similar if run["success"]) / len(similar)
+            if success_rate < min_success_rate or parse_rate < min_parse_rate:
+                continue
+            if latency_budget is not None and latency > latency_budget:
+                continue
+            candidates.append((latency, -success_rate, model_name))
+
+        if not candidates:
+            return default_model
+        latency, _, model_name = min(candidates)
+        if model_name != default_model:
+            print(f"[INFO] Model selection: '{model_name}' for {role} ({latency:.1f}s per call, successful on similar past runs).")
+        return model_name
+
+    def record_run(self, objective: str, domain: str, success: bool, models: Dict[str, Dict[str, Any]]):
+        """
+        Adds one run to the history. `models` maps each role to the model it used and its
+        measurements for the run: calls, mean_latency, parse_attempts and parse_failures.
+        """
+        keywords = objective_keywords(objective)
+        # Pick up what concurrent runs in other processes wrote since this one loaded the file.
+        self.stats = self._load_stats()
+        for role, measured in models.items():
+            if not measured.get("calls"):
+                continue
+            runs = self.stats.setdefault(role, {}).setdefault(measured["model"], [])
+            runs.append({
+                "timestamp": round(time.time()),
+                "domain": domain,
+                "keywords": keywords,
+                "success": bool(success),
+                "calls": measured["calls"],
+                "mean_latency": round(measured["mean_latency"], 3),
+                "parse_attempts": measured.get("parse_attempts", 0),
+                "parse_failures": measured.get("parse_failures", 0),
+            })
+            del runs[:-self.max_runs_per_model]
+        try:
+            self._save_stats()
+        except OSError as e:
+            print(f"[ERROR] Could not save model stats to {self.stats_file_path}: {e}")
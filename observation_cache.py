@@ -0,0 +1,126 @@
+import hashlib
+import io
+import json
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+from PIL import Image
+
+
+def compute_perceptual_hash(image_bytes: bytes, hash_size: int = 8) -> int:
+    """
+    Computes a difference hash (dHash) of an encoded image. Visually identical
+    screenshots produce the same or nearly the same hash even if their encoded
+    bytes differ.
+    """
+    img = Image.open(io.BytesIO(image_bytes))
+    # draft() lets JPEG decoders skip most of the work for a tiny thumbnail.
+    img.draft("L", (hash_size * 16, hash_size * 16))
+    img = img.convert("L").resize((hash_size + 1, hash_size), Image.Resampling.BILINEAR)
+    pixels = list(img.getdata())
+
+    phash = 0
+    for row in range(hash_size):
+        for col in range(hash_size):
+            left = pixels[row * (hash_size + 1) + col]
+            right = pixels[row * (hash_size + 1) + col + 1]
+            phash = (phash << 1) | (1 if left > right else 0)
+    return phash
+
+
+def compute_elements_fingerprint(elements: List[Dict]) -> str:
+    """Hashes the parts of the labeled element list that matter to the agent."""
+    canonical = [
+        (
+            el.get("label"),
+            el.get("tag"),
+            el.get("text"),
+            el.get("value"),
+            el.get("href"),
+            tuple(round(el.get("box", {}).get(k, 0)) for k in ("x", "y", "width", "height")),
+        )
+        for el in elements
+    ]
+    return hashlib.sha1(json.dumps(canonical, default=str).encode("utf-8")).hexdigest()
+
+
+def hamming_distance(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+
+class ObservationCache:
+    """
+    Remembers recent observations by URL, element-list fingerprint and perceptual
+    hash so that the agent can tell when an action changed nothing visible and reuse
+    the work it already did for that page state.
+    """
+    def __init__(self, max_entries: int = 8, hash_threshold: int = 4):
+        self.max_entries = max_entries
+        self.hash_threshold = hash_threshold
+        self.entries: "OrderedDict[Tuple[str, str], Dict[str, Any]]" = OrderedDict()
+        self.last_key: Optional[Tuple[str, str]] = None
+        self.stats = {"observations": 0, "hits": 0, "misses": 0, "unchanged": 0, "plan_reuses": 0}
+
+    def lookup(self, url: str, elements_fingerprint: str, phash: int) -> Tuple[Optional[Dict[str, Any]], bool]:
+        """
+        Returns the cached entry matching this observation (or None) and whether it is
+        the same page state as the previous observation.
+        """
+        self.stats["observations"] += 1
+        key = (url, elements_fingerprint)
+        entry = self.entries.get(key)
+        if entry is None or hamming_distance(entry["phash"], phash) > self.hash_threshold:
+            self.stats["misses"] += 1
+            return None, False
+
+        self.stats["hits"] += 1
+        self.entries.move_to_end(key)
+        unchanged = key == self.last_key
+        if unchanged:
+            self.stats["unchanged"] += 1
+        self.last_key = key
+        return entry, unchanged
+
+    def store(self, url: str, elements_fingerprint: str, phash: int, screenshot_bytes: bytes, encoded_image: str) -> Dict[str, Any]:
+        key = (url, elements_fingerprint)
+        entry = {
+            "phash": phash,
+            "screenshot_bytes": screenshot_bytes,
+            "encoded_image": encoded_image,
+            "plan": None,
+        }
+        self.entries[key] = entry
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+        self.last_key = key
+        return entry
+
+    def current_state(self) -> Optional[Tuple[str, str, int]]:
+        """The latest page state: its URL, element-list fingerprint and perceptual hash."""
+        entry = self.entries.get(self.last_key)
+        return (*self.last_key, entry["phash"]) if entry is not None else None
+
+    def set_plan(self, plan: Optional[List]):
+        """Records the plan steps that are still valid for the latest page state."""
+        entry = self.entries.get(self.last_key)
+        if entry is not None:
+            entry["plan"] = list(plan) if plan else None
+
+    def get_plan(self) -> Optional[List]:
+        """Returns the remaining plan for the latest page state, counting it as a reuse."""
+        entry = self.entries.get(self.last_key)
+        if entry is None or not entry.get("plan"):
+            return None
+        self.stats["plan_reuses"] += 1
+        return list(entry["plan"])
+
+    def get_stats(self) -> Dict[str, Any]:
+        stats = dict(self.stats)
+        observations = stats["observations"]
+        stats["hit_rate"] = round(stats["hits"] / observations, 3) if observations else 0.0
+        stats["unchanged_rate"] = round(stats["unchanged"] / observations, 3) if observations else 0.0
+        return stats
+
+    def save_stats(self, file_path: str):
+        with open(file_path, 'w', encoding='utf-8') as f:
+            json.dump(self.get_stats(), f, indent=4)
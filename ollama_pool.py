@@ -0,0 +1,150 @@
+# FILE: ollama_pool.py
+
+import asyncio
+import re
+import time
+import weakref
+from typing import Dict, Iterable, List, Optional, Union
+import ollama
+import config
+
+# How long Ollama keeps a model loaded after a call when the request does not say.
+DEFAULT_KEEP_ALIVE = 300.0
+_DURATION_UNITS = {"ms": 0.001, "s": 1.0, "m": 60.0, "h": 3600.0}
+
+
+def keep_alive_seconds(keep_alive: Optional[Union[str, float]]) -> float:
+    """
+    Seconds a model stays loaded after a call made with `keep_alive`, given as seconds or as a
+    duration string such as "10m" or "1h30m". A negative value keeps it loaded indefinitely.
+    """
+    if keep_alive is None or keep_alive == "":
+        return DEFAULT_KEEP_ALIVE
+    if isinstance(keep_alive, (int, float)):
+        seconds = float(keep_alive)
+    else:
+        text = str(keep_alive).strip()
+        parts = re.findall(r"(-?\d+(?:\.\d+)?)(ms|s|m|h)?", text)
+        if not parts or "".join(number + unit for number, unit in parts) != text:
+            return DEFAULT_KEEP_ALIVE
+        seconds = sum(float(number) * _DURATION_UNITS[unit or "s"] for number, unit in parts)
+    return float("inf") if seconds < 0 else seconds
+
+
+class OllamaEndpoint:
+    """One Ollama server, with the state the pool routes on."""
+    def __init__(self, host: Optional[str] = None):
+        self.host = host
+        # An AsyncClient's connections belong to the loop that opened them, so each loop gets its own.
+        self._clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, ollama.AsyncClient]" = weakref.WeakKeyDictionary()
+        self.outstanding = 0
+        # Model -> time its keep_alive runs out, after which Ollama may have unloaded it.
+        self.loaded_models: Dict[str, float] = {}
+        self.consecutive_failures = 0
+        self.open_until = 0.0
+        self.stats = {"requests": 0, "failures": 0, "hedges": 0, "missing_model": 0}
+
+    @property
+    def client(self) -> ollama.AsyncClient:
+        """The client for the running event loop."""
+        loop = asyncio.get_running_loop()
+        client = self._clients.get(loop)
+        if client is None:
+            client = self._clients[loop] = ollama.AsyncClient(host=self.host)
+        return client
+
+    @property
+    def name(self) -> str:
+        return self.host or "default"
+
+    def has_loaded(self, model_name: str, now: float) -> bool:
+        """True if the model was used here recently enough to still be loaded."""
+        expires = self.loaded_models.get(model_name)
+        if expires is not None and now >= expires:
+            del self.loaded_models[model_name]
+            expires = None
+        return expires is not None
+
+    def is_open(self, now: float) -> bool:
+        """True while the circuit breaker keeps requests away from this endpoint."""
+        return now < self.open_until
+
+    def __repr__(self) -> str:
+        return f"OllamaEndpoint({self.name}, outstanding={self.outstanding})"
+
+
+class OllamaEndpointPool:
+    """
+    Routes model calls over several Ollama servers.
+
+    A call goes to an endpoint that already has its model loaded if possible, and among
+    those to the one with the fewest requests in flight. After `failure_threshold`
+    consecutive server or connection errors an endpoint's circuit opens for `cooldown`
+    seconds. After that it is tried again, and a single further failure reopens it
+    (half-open). If every circuit is open, the one that reopens first is used rather
+    than failing outright.
+    """
+    def __init__(self, hosts: Iterable[Optional[str]], failure_threshold: int = 3, cooldown: float = 30.0):
+        self.endpoints: List[OllamaEndpoint] = [OllamaEndpoint(host) for host in hosts] or [OllamaEndpoint()]
+        self.failure_threshold = max(1, failure_threshold)
+        self.cooldown = cooldown
+
+    def available(self, exclude: Iterable[OllamaEndpoint] = ()) -> List[OllamaEndpoint]:
+        now = time.monotonic()
+        return [ep for ep in self.endpoints if ep not in exclude and not ep.is_open(now)]
+
+    def pick(self, model_name: str, exclude: Iterable[OllamaEndpoint] = ()) -> OllamaEndpoint:
+        """Returns the endpoint the next call for `model_name` should go to."""
+        exclude = list(exclude)
+        candidates = self.available(exclude)
+        if not candidates:
+            candidates = [ep for ep in self.endpoints if ep not in exclude] or self.endpoints
+            return min(candidates, key=lambda ep: ep.open_until)
+        now = time.monotonic()
+        return min(candidates, key=lambda ep: (not ep.has_loaded(model_name, now), ep.outstanding))
+
+    def seconds_until_available(self) -> float:
+        now = time.monotonic()
+        return max(0.0, min(ep.open_until for ep in self.endpoints) - now)
+
+    def record_success(self, endpoint: OllamaEndpoint, model_name: str, keep_alive: Optional[Union[str, float]] = None):
+        endpoint.consecutive_failures = 0
+        endpoint.open_until = 0.0
+        endpoint.loaded_models[model_name] = time.monotonic() + keep_alive_seconds(keep_alive)
+
+    def record_missing_model(self, endpoint: OllamaEndpoint, model_name: str):
+        """Notes that the endpoint answered 404 for the model. The server itself is fine."""
+        endpoint.stats["missing_model"] += 1
+        endpoint.loaded_models.pop(model_name, None)
+
+    def record_failure(self, endpoint: OllamaEndpoint):
+        endpoint.stats["failures"] += 1
+        endpoint.consecutive_failures += 1
+        if endpoint.consecutive_failures >= self.failure_threshold:
+            endpoint.open_until = time.monotonic() + self.cooldown
+            # The server may have restarted, so its loaded models are unknown again.
+            endpoint.loaded_models.clear()
+            print(f"[OLLAMA] Circuit open for {endpoint.name} for {self.cooldown}s after "
+                  f"{endpoint.consecutive_failures} consecutive failures.")
+
+    def report(self) -> Dict[str, Dict]:
+        now = time.monotonic()
+        return {
+            ep.name: dict(ep.stats, outstanding=ep.outstanding, open=ep.is_open(now), loaded=sorted(m for m in list(ep.loaded_models) if ep.has_loaded(m, now)))
+            for ep in self.endpoints
+        }
+
+
+_pool: Optional[OllamaEndpointPool] = None
+
+
+def get_ollama_pool() -> OllamaEndpointPool:
+    """Returns the process-wide endpoint pool. With no OLLAMA_HOSTS it holds the default server."""
+    global _pool
+    if _pool is None:
+        _pool = OllamaEndpointPool(
+            config.get_setting('OLLAMA_HOSTS') or [],
+            failure_threshold=config.get_setting('OLLAMA_CIRCUIT_FAILURES', 3),
+            cooldown=config.get_setting('OLLAMA_CIRCUIT_COOLDOWN', 30.0),
+        )
+    return _pool
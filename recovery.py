@@ -25,7 +25,7 @@ class ErrorRecovery:
         print(f"[RECOVERY] Attempting to recover from failed click on element {element_label}.")
 
         # 1. Get details of the failed element to create a search query
-        success, details = await self.agent.browser.get_element_details(element_label)
+        success, details = await self.agent.browser.get_element_details(element_label, include_selector=True)
         if not success or not isinstance(details, dict):
             return False, f"Recovery failed: Could not get details for element {element_label}."
 
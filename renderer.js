@@ -316,11 +316,39 @@ document.addEventListener('DOMContentLoaded', () => {
         document.querySelector('.status-bar span:nth-child(5)').textContent = `Stealth: ${data.stealth}`;
     });
 
+    socket.on('llm_metrics', (data) => {
+        // Time spent per call role in the current run, heaviest first.
+        const llmMetrics = document.getElementById('llm-metrics');
+        const roles = Object.entries(data);
+        llmMetrics.textContent = 'LLM: ' + roles.slice(0, 3)
+            .map(([role, totals]) => `${role} ${totals.total_time.toFixed(1)}s (${totals.calls})`)
+            .join(' · ');
+        llmMetrics.title = roles
+            .map(([role, totals]) => `${role}: ${totals.calls} calls, ${totals.total_time}s, ${totals.prompt_tokens} prompt / ${totals.completion_tokens} completion tokens`)
+            .join('\n');
+    });
+
+    socket.on('model_pull_progress', (data) => {
+        // A missing model is being pulled in the background.
+        const llmMetrics = document.getElementById('llm-metrics');
+        llmMetrics.textContent = data.status === 'error'
+            ? `LLM: pull of ${data.model} failed`
+            : `LLM: pulling ${data.model}` + (data.percent != null ? ` ${data.percent}%` : ` (${data.status})`);
+        llmMetrics.title = data.error || `${data.model} on ${data.host}: ${data.status}`;
+    });
+
     socket.on('browser_navigated', (data) => {
         const browserIframe = document.getElementById('browser-iframe');
         const urlBar = document.getElementById('url-bar');
         console.log(`[SOCKETS] Received 'browser_navigated' event. URL: ${data.url}`);
-        if (browserIframe.src !== data.url) {
+        // The bridge usually has already navigated the iframe, so only load the URL if it is not showing yet.
+        let currentUrl;
+        try {
+            currentUrl = browserIframe.contentWindow.location.href;
+        } catch (e) {
+            currentUrl = browserIframe.src;
+        }
+        if (currentUrl !== data.url) {
             browserIframe.src = data.url;
         }
         urlBar.value = data.url;
@@ -330,7 +358,15 @@ document.addEventListener('DOMContentLoaded', () => {
         const overlay = document.getElementById('agent-view-overlay');
         const overlayImage = document.getElementById('agent-view-image');
         console.log('[SOCKETS] Received agent_view_updated event. Displaying annotated screenshot.');
-        overlayImage.src = `data:image/png;base64,${data.image}`;
+        // The annotated image arrives as a binary attachment (ArrayBuffer).
+        if (typeof data.image === 'string') {
+            overlayImage.src = `data:image/png;base64,${data.image}`;
+        } else {
+            if (overlayImage.src.startsWith('blob:')) {
+                URL.revokeObjectURL(overlayImage.src);
+            }
+            overlayImage.src = URL.createObjectURL(new Blob([data.image], { type: data.mime || 'image/png' }));
+        }
         overlay.style.display = 'flex';
     });
 
@@ -747,6 +783,12 @@ document.addEventListener('DOMContentLoaded', () => {
         browserIframe.contentWindow.location.reload();
     });
 
+    // Normally the injected bridge reports 'navigation_complete' once the page settles.
+    // When it cannot be injected, report the load ourselves so the agent does not wait for its deadline.
+    function announceNavigationWithoutBridge(url) {
+        socket.emit('navigation_complete', { tab_id: socket.id, success: true, url: url, title: null, ready: 'load' });
+    }
+
     // Update URL bar and inject bridge script when iframe navigation changes
     browserIframe.addEventListener('load', () => {
         try {
@@ -769,6 +811,8 @@ document.addEventListener('DOMContentLoaded', () => {
                     return response.text();
                 })
                 .then(scriptText => {
+                    // Tells the bridge which UI tab it belongs to (see 'register_bridge').
+                    browserIframe.contentWindow.__agentTabId = socket.id;
                     const script = browserIframe.contentDocument.createElement('script');
                     script.textContent = scriptText;
                     browserIframe.contentDocument.head.appendChild(script);
@@ -776,11 +820,13 @@ document.addEventListener('DOMContentLoaded', () => {
                 })
                 .catch(err => {
                     console.error('Error injecting bridge.js:', err);
+                    announceNavigationWithoutBridge(newLocation);
                 });
 
         } catch (e) {
             // This can happen due to cross-origin restrictions.
             console.warn("Could not access iframe location or inject script due to cross-origin policy.", e.message);
+            announceNavigationWithoutBridge(browserIframe.src);
         }
     });
 
@@ -1,8 +1,9 @@
 import subprocess
 import time
 import asyncio
-from unittest.mock import MagicMock
+from unittest.mock import MagicMock, ANY
 from agent import WebAgent
+from json_stream import JSONObjectScanner, extract_json_object
 import config
 
 async def main():
@@ -62,21 +63,21 @@ async def main():
             "action_type": "type",
             "details": {"element_label": 1, "text": "admin"}
         })
-        mock_socketio.emit.assert_any_call('type', {'action': 'type', 'label': 1, 'text': 'admin'}, namespace='/bridge')
+        mock_socketio.emit.assert_any_call('type', {'action': 'type', 'label': 1, 'text': 'admin', 'request_id': ANY}, namespace='/bridge')
 
         print("[TEST] Executing 'type' action for password...")
         await agent.browser.execute_action({
             "action_type": "type",
             "details": {"element_label": 2, "text": "password"}
         })
-        mock_socketio.emit.assert_any_call('type', {'action': 'type', 'label': 2, 'text': 'password'}, namespace='/bridge')
+        mock_socketio.emit.assert_any_call('type', {'action': 'type', 'label': 2, 'text': 'password', 'request_id': ANY}, namespace='/bridge')
 
         print("[TEST] Executing 'click' action for submit button...")
         await agent.browser.execute_action({
             "action_type": "click",
             "details": {"element_label": 3}
         })
-        mock_socketio.emit.assert_any_call('click', {'action': 'click', 'label': 3}, namespace='/bridge')
+        mock_socketio.emit.assert_any_call('click', {'action': 'click', 'label': 3, 'request_id': ANY}, namespace='/bridge')
 
         print("\n[SUCCESS] All test steps executed and socket emits were called as expected.")
 
@@ -89,6 +90,15 @@ async def main():
         assert "Detected suspicious pattern: \\.exe\\b" in threat_details
         print("[SUCCESS] Security filter test passed.")
 
+        # Test the streaming JSON scanner on a stray brace before the object
+        print("[TEST] Testing JSON scanner...")
+        scanner = JSONObjectScanner()
+        results = [scanner.feed(char) for char in '{{"a":1}']
+        assert results[-1] == {"a": 1}
+        assert all(result is None for result in results[:-1])
+        assert extract_json_object('{ note {"a": {"b": 2}} tail') == {"a": {"b": 2}}
+        print("[SUCCESS] JSON scanner test passed.")
+
     except Exception as e:
         print(f"\n[ERROR] An error occurred during the test: {e}")
         import traceback
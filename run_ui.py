@@ -1,5 +1,5 @@
-from flask import Flask, send_from_directory, jsonify
-from flask_socketio import SocketIO, emit
+from flask import Flask, send_from_directory, jsonify, request
+from flask_socketio import SocketIO, emit, join_room
 import os
 import json
 import asyncio
@@ -11,6 +11,9 @@ import webbrowser
 from threading import Timer
 from queue import Queue
 import config
+import uuid
+from browser_backends import create_browser_backend
+from session_pool import BrowserSessionPool
 
 # Virtual environment check
 # if sys.prefix == sys.base_prefix:
@@ -34,14 +37,18 @@ sys.stdout = log_stream
 sys.stderr = log_stream
 
 # --- Agent Task Management ---
-agent_thread = None
-agent_task = None
-agent_paused = threading.Event()
-agent_stopped = threading.Event()
+# All agent runs share one event loop in a background thread, so that they can
+# share the browser sessions leased from the session pool.
+agent_loop = None
+session_pool = None
+# run_id -> {'objective', 'tab_id', 'future', 'paused', 'stopped', and the run's own queues:
+# 'clarification_requests', 'clarification_responses', 'navigations'}. Events from a UI tab
+# only reach the runs started from that tab.
+agent_runs = {}
+agent_runs_lock = threading.Lock()
+# Socket ids of the connected UI tabs; each one can host a bridge session.
+ui_tabs = []
 agent_status = "Idle"
-clarification_request_queue = Queue()
-clarification_response_queue = Queue()
-navigation_queue = Queue()
 
 # --- Recording State ---
 is_recording = False
@@ -60,29 +67,60 @@ except Exception as e:
     ai_model_instance = None
 
 
-def run_agent_in_background(objective, req_q, res_q, nav_q, paused_event, stopped_event, socketio_instance):
-    """Runs the agent task in a separate thread."""
-    loop = asyncio.new_event_loop()
-    asyncio.set_event_loop(loop)
+def create_pooled_backend(tab_id):
+    """
+    Builds the backend for a pool session leased by a run started from `tab_id`. Bridge
+    sessions drive the browser in that tab only, so the tab has to be connected.
+    """
+    if tab_id not in ui_tabs:
+        raise RuntimeError(f"The UI tab {tab_id} that started the run is no longer connected.")
+    return create_browser_backend(socketio=socketio, bridge_room=tab_id)
+
+def get_agent_loop():
+    """Starts the shared agent event loop and the browser session pool on first use."""
+    global agent_loop, session_pool
+    if agent_loop is None:
+        agent_loop = asyncio.new_event_loop()
+        threading.Thread(target=agent_loop.run_forever, daemon=True).start()
+        session_pool = BrowserSessionPool(
+            create_pooled_backend,
+            size=config.SESSION_POOL_SIZE,
+            max_runs_per_session=config.SESSION_MAX_RUNS,
+            max_waiters=config.SESSION_QUEUE_SIZE,
+            acquire_timeout=config.SESSION_ACQUIRE_TIMEOUT
+        )
+    return agent_loop
+
+def get_active_runs(tab_id=None):
+    """Returns the runs that have not finished, optionally only those started from one UI tab."""
+    with agent_runs_lock:
+        return [run for run in agent_runs.values()
+                if not run['future'].done() and (tab_id is None or run['tab_id'] == tab_id)]
+
+async def run_agent_in_background(run_id, objective, tab_id, req_q, res_q, nav_q, paused_event, stopped_event, socketio_instance):
+    """Runs one agent task on the shared agent loop."""
     try:
         # Pass the queues and events to the agent task
-        loop.run_until_complete(run_agent_task(
+        await run_agent_task(
             objective,
             clarification_request_queue=req_q,
             clarification_response_queue=res_q,
             navigation_queue=nav_q,
             paused_event=paused_event,
             stopped_event=stopped_event,
-            socketio=socketio_instance
-        ))
+            socketio=socketio_instance,
+            session_pool=session_pool,
+            session_key=tab_id
+        )
     except Exception as e:
         print(f"Agent task failed with exception: {e}")
     finally:
-        print("Agent task finished or stopped. Notifying client.")
-        # Ensure the client is notified that the agent has stopped.
-        if not stopped_event.is_set():
-            socketio.emit('agent_finished', {'status': 'completed'})
-        loop.close()
+        print(f"Agent task {run_id} finished or stopped. Notifying client.")
+        with agent_runs_lock:
+            run = agent_runs.pop(run_id, None)
+        # Ensure the client that started the run is notified that the agent has stopped.
+        status = 'stopped' if stopped_event.is_set() else 'completed'
+        socketio.emit('agent_finished', {'status': status, 'run_id': run_id}, to=run['tab_id'] if run else None)
 
 # --- Flask Routes ---
 @app.route('/')
@@ -206,10 +244,24 @@ def get_scripts():
 @socketio.on('connect')
 def handle_connect():
     print('Client connected')
+    ui_tabs.append(request.sid)
     emit('response', {'data': 'Connected to server!'})
     scripts = get_scripts()
     emit('script_list', {'scripts': scripts})
 
+@socketio.on('disconnect')
+def handle_disconnect():
+    print('Client disconnected')
+    if request.sid in ui_tabs:
+        ui_tabs.remove(request.sid)
+
+@socketio.on('register_bridge', namespace='/bridge')
+def handle_register_bridge(data):
+    """Puts a freshly injected bridge into the room of the UI tab that hosts it."""
+    tab_id = (data or {}).get('tab_id')
+    if tab_id:
+        join_room(tab_id, namespace='/bridge')
+
 @socketio.on('run_script')
 def handle_run_script(json_data):
     """
@@ -230,40 +282,56 @@ def handle_run_script(json_data):
 
 @socketio.on('start_agent')
 def handle_start_agent(json_data):
-    global agent_thread, agent_paused, agent_stopped, agent_status, clarification_request_queue, clarification_response_queue
+    global agent_status
     objective = json_data.get('objective')
     if not objective:
         emit('error', {'message': 'Objective is required.'})
         return
 
-    if agent_thread and agent_thread.is_alive():
+    if get_active_runs(request.sid):
         emit('error', {'message': 'Agent is already running.'})
         return
 
+    loop = get_agent_loop()
+    if len(get_active_runs()) >= session_pool.size + session_pool.max_waiters:
+        emit('error', {'message': 'All browser sessions are busy and the queue is full. Try again later.'})
+        return
+
     print(f"Received start request for objective: {objective}")
     emit('response', {'data': f'Starting agent with objective: {objective}'})
 
-    # Reset events and queues
-    agent_paused.clear()
-    agent_stopped.clear()
     agent_status = "Running"
-    while not clarification_request_queue.empty():
-        clarification_request_queue.get()
-    while not clarification_response_queue.empty():
-        clarification_response_queue.get()
-
-    # Start the agent in a new thread
-    agent_thread = threading.Thread(
-        target=run_agent_in_background,
-        args=(objective, clarification_request_queue, clarification_response_queue, navigation_queue, agent_paused, agent_stopped, socketio)
-    )
-    agent_thread.start()
+
+    # Schedule the agent on the shared agent loop
+    run_id = uuid.uuid4().hex
+    paused_event = threading.Event()
+    stopped_event = threading.Event()
+    run = {
+        'objective': objective,
+        'tab_id': request.sid,
+        'paused': paused_event,
+        'stopped': stopped_event,
+        'clarification_requests': Queue(),
+        'clarification_responses': Queue(),
+        'navigations': Queue(),
+    }
+    with agent_runs_lock:
+        # Registered before the run starts, so its end always finds its entry.
+        agent_runs[run_id] = run
+        run['future'] = asyncio.run_coroutine_threadsafe(
+            run_agent_in_background(run_id, objective, request.sid, run['clarification_requests'],
+                                    run['clarification_responses'], run['navigations'],
+                                    paused_event, stopped_event, socketio),
+            loop
+        )
 
 @socketio.on('pause_agent')
 def handle_pause_agent():
-    global agent_paused, agent_status
-    if agent_thread and agent_thread.is_alive() and not agent_paused.is_set():
-        agent_paused.set()
+    global agent_status
+    runs = [run for run in get_active_runs(request.sid) if not run['paused'].is_set()]
+    for run in runs:
+        run['paused'].set()
+    if runs:
         agent_status = "Paused"
         print("Agent paused.")
         emit('status_update', {'status': 'Paused'})
@@ -271,9 +339,11 @@ def handle_pause_agent():
 
 @socketio.on('resume_agent')
 def handle_resume_agent():
-    global agent_paused, agent_status
-    if agent_thread and agent_thread.is_alive() and agent_paused.is_set():
-        agent_paused.clear()
+    global agent_status
+    runs = [run for run in get_active_runs(request.sid) if run['paused'].is_set()]
+    for run in runs:
+        run['paused'].clear()
+    if runs:
         agent_status = "Running"
         print("Agent resumed.")
         emit('status_update', {'status': 'Running'})
@@ -281,21 +351,26 @@ def handle_resume_agent():
 
 @socketio.on('stop_agent')
 def handle_stop_agent():
-    global agent_stopped, agent_thread, agent_status
-    if agent_thread and agent_thread.is_alive():
-        agent_stopped.set()
-        # Wait for the thread to finish
-        agent_thread.join()
-        agent_status = "Idle"
-        print("Agent stopped.")
-        emit('response', {'data': 'Agent stopped.'})
-        socketio.emit('agent_finished', {'status': 'stopped'})
+    runs = get_active_runs(request.sid)
+    for run in runs:
+        run['stopped'].set()
+        # A paused agent has to wake up to notice that it was stopped.
+        run['paused'].clear()
+    if runs:
+        # 'agent_finished' is emitted once each run has actually wound down.
+        print("Agent stop requested.")
+        emit('response', {'data': 'Agent stopping...'})
 
 @socketio.on('clarification_response')
 def handle_clarification_response(json_data):
-    """Handles the user's response to a clarification request."""
+    """Handles the user's response to a clarification request, for the run started from the same tab."""
     print(f"Received clarification response: {json_data}")
-    clarification_response_queue.put(json_data)
+    runs = get_active_runs(request.sid)
+    if not runs:
+        print("[UI] No run from this tab is waiting for a clarification. Ignoring the response.")
+        return
+    for run in runs:
+        run['clarification_responses'].put(json_data)
 
 @socketio.on('user_navigated')
 def handle_user_navigated(json_data):
@@ -303,9 +378,11 @@ def handle_user_navigated(json_data):
     Handles a notification from the UI that the user has navigated the browser iframe.
     """
     url = json_data.get('url')
-    if url and agent_thread and agent_thread.is_alive():
+    runs = get_active_runs(request.sid)
+    if url and runs:
         print(f"[UI] Received user navigation to: {url}. Queueing for agent.")
-        navigation_queue.put(url)
+        for run in runs:
+            run['navigations'].put(url)
 
 @socketio.on('save_settings')
 def handle_save_settings(json_data):
@@ -548,10 +625,11 @@ def handle_record_action(data):
 def stream_clarification_requests():
     """Periodically checks for clarification requests from the agent and sends them to the UI."""
     while True:
-        if not clarification_request_queue.empty():
-            request = clarification_request_queue.get()
-            socketio.emit('clarification_request', request)
-            print(f"Sent clarification request to client: {request}")
+        for run in get_active_runs():
+            while not run['clarification_requests'].empty():
+                request = run['clarification_requests'].get()
+                socketio.emit('clarification_request', request, to=run['tab_id'])
+                print(f"Sent clarification request to client: {request}")
         socketio.sleep(1) # Non-blocking sleep
 
 def stream_logs():
@@ -569,11 +647,13 @@ def stream_status():
     """Periodically sends status updates to the client."""
     global agent_status
     while True:
-        if not (agent_thread and agent_thread.is_alive()):
+        active_runs = get_active_runs()
+        if not active_runs:
             agent_status = "Idle"
 
         status_data = {
             'status': agent_status,
+            'active_runs': len(active_runs),
             'ip': config.get_setting('PROXY_ADDRESS') if config.get_setting('USE_PROXY') else '127.0.0.1',
             'user_agent': config.get_setting('USER_AGENT'),
             'speed': f"{config.get_setting('WAIT_BETWEEN_ACTIONS')}s delay",
@@ -0,0 +1,181 @@
+# FILE: session_pool.py
+
+import asyncio
+from contextlib import asynccontextmanager
+from typing import Callable, List, Optional, Set
+from browser_backends import BrowserBackend
+
+
+class SessionPoolFullError(RuntimeError):
+    """Raised when every browser session is leased and the wait queue is full."""
+
+
+class BrowserSession:
+    """A browser backend plus the bookkeeping the pool needs to lease and recycle it."""
+    def __init__(self, session_id: int, backend: Optional[BrowserBackend]):
+        self.session_id = session_id
+        self.backend = backend
+        self.runs = 0
+        self.started = False
+
+    def __repr__(self) -> str:
+        return f"BrowserSession(id={self.session_id}, backend={type(self.backend).__name__}, runs={self.runs})"
+
+
+class BrowserSessionPool:
+    """
+    Leases browser sessions to agent runs so several objectives can run in parallel.
+
+    Sessions are created lazily up to `size`, health-checked before every lease, and
+    recycled (closed and replaced) after `max_runs_per_session` runs or when a check
+    fails. At most `max_waiters` runs may wait for a free session; further requests
+    are rejected with SessionPoolFullError. The pool must be used from a single event loop.
+
+    A run may ask for a session bound to a key (the UI tab that started it), and the
+    factory builds backends for that key. A session whose backend drives a different
+    UI tab is rebuilt for the requested one before it is leased; backends without a UI
+    tab (ui_room None) serve any key.
+    """
+    def __init__(self, backend_factory: Callable[[Optional[str]], BrowserBackend], size: int = 1, max_runs_per_session: int = 20,
+                 max_waiters: int = 4, acquire_timeout: float = 300.0):
+        self.backend_factory = backend_factory
+        self.size = max(1, size)
+        self.max_runs_per_session = max_runs_per_session
+        self.max_waiters = max_waiters
+        self.acquire_timeout = acquire_timeout
+
+        self._idle: List[BrowserSession] = []
+        self._leased: Set[BrowserSession] = set()
+        self._waiters = 0
+        self._next_session_id = 1
+        self._condition = asyncio.Condition()
+
+    @property
+    def sessions(self) -> List[BrowserSession]:
+        return self._idle + list(self._leased)
+
+    def _has_capacity(self) -> bool:
+        return bool(self._idle) or len(self._idle) + len(self._leased) < self.size
+
+    def stats(self) -> dict:
+        return {
+            "size": self.size,
+            "idle": len(self._idle),
+            "leased": len(self._leased),
+            "waiting": self._waiters,
+        }
+
+    @staticmethod
+    def _bound_to(session: BrowserSession, key: Optional[str]) -> bool:
+        return session.backend.ui_room is None or session.backend.ui_room == key
+
+    def _take_idle(self, key: Optional[str]) -> BrowserSession:
+        """Takes an idle session, preferring one already bound to `key`."""
+        session = next((s for s in reversed(self._idle) if self._bound_to(s, key)), self._idle[-1])
+        self._idle.remove(session)
+        return session
+
+    async def acquire(self, key: Optional[str] = None) -> BrowserSession:
+        """
+        Leases a healthy, started session bound to `key`, waiting for one to free up if
+        necessary. Raises whatever the backend factory raises for a key it cannot serve.
+        """
+        async with self._condition:
+            if not self._has_capacity():
+                if self._waiters >= self.max_waiters:
+                    raise SessionPoolFullError(
+                        f"All {self.size} browser sessions are busy and {self._waiters} runs are already waiting."
+                    )
+                self._waiters += 1
+                try:
+                    print(f"[POOL] No free browser session. Waiting in queue (position {self._waiters}).")
+                    await asyncio.wait_for(self._condition.wait_for(self._has_capacity), self.acquire_timeout)
+                except asyncio.TimeoutError:
+                    raise TimeoutError(f"Timed out after {self.acquire_timeout}s waiting for a browser session.")
+                finally:
+                    self._waiters -= 1
+
+            if self._idle and (any(self._bound_to(s, key) for s in self._idle) or len(self.sessions) >= self.size):
+                session = self._take_idle(key)
+            else:
+                session = BrowserSession(self._next_session_id, None)
+                self._next_session_id += 1
+            self._leased.add(session)
+
+        # Starting a browser or checking its health can be slow, so it happens outside the lock.
+        try:
+            await self._prepare(session, key)
+        except Exception:
+            await self._discard(session)
+            raise
+        print(f"[POOL] Leased {session}.")
+        return session
+
+    async def _prepare(self, session: BrowserSession, key: Optional[str]):
+        if session.backend is not None and not self._bound_to(session, key):
+            print(f"[POOL] {session} drives another UI tab. Rebuilding it for the requesting one.")
+            await self._close_backend(session)
+            session.backend = None
+        if session.started:
+            if await session.backend.health_check():
+                await session.backend.reset()
+                return
+            print(f"[POOL] {session} failed its health check. Replacing its browser.")
+            await self._close_backend(session)
+            session.backend = None
+        if session.backend is None:
+            session.backend = self.backend_factory(key)
+            session.runs = 0
+        await session.backend.start()
+        session.started = True
+
+    async def release(self, session: BrowserSession):
+        """Returns a session to the pool, recycling it if it is worn out or unhealthy."""
+        session.runs += 1
+        recycle = session.runs >= self.max_runs_per_session
+        if not recycle:
+            try:
+                recycle = not await session.backend.health_check()
+            except Exception:
+                recycle = True
+
+        if recycle:
+            print(f"[POOL] Recycling {session}.")
+            await self._discard(session)
+            return
+
+        async with self._condition:
+            self._leased.discard(session)
+            self._idle.append(session)
+            self._condition.notify()
+
+    async def _discard(self, session: BrowserSession):
+        await self._close_backend(session)
+        async with self._condition:
+            self._leased.discard(session)
+            self._condition.notify()
+
+    @staticmethod
+    async def _close_backend(session: BrowserSession):
+        if session.backend is None:
+            return
+        try:
+            await session.backend.close()
+        except Exception as e:
+            print(f"[POOL] Error while closing {session}: {e}")
+        session.started = False
+
+    @asynccontextmanager
+    async def lease(self):
+        session = await self.acquire()
+        try:
+            yield session
+        finally:
+            await self.release(session)
+
+    async def close(self):
+        """Closes every idle session. Leased sessions are closed when they are released."""
+        async with self._condition:
+            idle, self._idle = self._idle, []
+        for session in idle:
+            await self._close_backend(session)
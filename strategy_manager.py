@@ -1,6 +1,6 @@
 import json
 import os
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Tuple
 from urllib.parse import urlparse
 from uuid import UUID
 from langchain.callbacks.base import AsyncCallbackHandler
@@ -58,16 +58,26 @@ class StrategyManager:
 
     def save_strategy(self, domain: str, objective: str, actions: List[Dict[str, Any]]):
         """Saves a new strategy."""
-        if not actions:
-            return
+        self.save_strategies([(domain, objective, actions)])
+
+    def save_strategies(self, strategies: List[Tuple[str, str, List[Dict[str, Any]]]]) -> bool:
+        """Saves several new (domain, objective, actions) strategies with one write. Returns True if any was new."""
+        added = False
+        for domain, objective, actions in strategies:
+            if not actions:
+                continue
+
+            if domain not in self.strategies:
+                self.strategies[domain] = {}
 
-        if domain not in self.strategies:
-            self.strategies[domain] = {}
+            # Do not overwrite existing strategies for now. This can be changed later.
+            if objective not in self.strategies[domain]:
+                self.strategies[domain][objective] = actions
+                added = True
+                print(f"[INFO] New strategy saved for domain '{domain}' and objective '{objective}'.")
+            else:
+                print(f"[INFO] Strategy for domain '{domain}' and objective '{objective}' already exists. Not overwriting.")
 
-        # Do not overwrite existing strategies for now. This can be changed later.
-        if objective not in self.strategies[domain]:
-            self.strategies[domain][objective] = actions
+        if added:
             self._save_strategies()
-            print(f"[INFO] New strategy saved for domain '{domain}' and objective '{objective}'.")
-        else:
-            print(f"[INFO] Strategy for domain '{domain}' and objective '{objective}' already exists. Not overwriting.")
+        return added
@@ -0,0 +1,48 @@
+import hashlib
+import json
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+
+def _digest(value: Any) -> str:
+    return hashlib.sha1(json.dumps(value, sort_keys=True, separators=(",", ":"), default=str).encode("utf-8")).hexdigest()
+
+
+def canonical_action(action_json: Dict) -> Dict:
+    """The part of an action that decides whether it is valid. The model's thought and
+    confidence differ between generations of the same action and are left out."""
+    return {"tool": action_json.get("tool"), "params": action_json.get("params") or {}}
+
+
+class ValidationCache:
+    """
+    Remembers validator verdicts by a hash of what was asked (objective, page state and
+    canonical action, or action description and element details), so an identical
+    question costs no model call. Least recently used verdicts are dropped first.
+    """
+    def __init__(self, max_entries: int = 256):
+        self.max_entries = max_entries
+        self.entries: "OrderedDict[str, bool]" = OrderedDict()
+        self.stats = {"hits": 0, "misses": 0, "skipped_confidence": 0, "skipped_read_only": 0}
+
+    @staticmethod
+    def make_key(*parts: Any) -> str:
+        return _digest([_digest(part) for part in parts])
+
+    def get(self, key: str) -> Optional[bool]:
+        verdict = self.entries.get(key)
+        if verdict is None:
+            self.stats["misses"] += 1
+            return None
+        self.stats["hits"] += 1
+        self.entries.move_to_end(key)
+        return verdict
+
+    def put(self, key: str, verdict: bool):
+        self.entries[key] = verdict
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def get_stats(self) -> Dict[str, int]:
+        return dict(self.stats, entries=len(self.entries))
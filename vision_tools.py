@@ -116,8 +116,8 @@ Candidates:
         messages = [HumanMessage(content=message_content)]
 
         # Use the vision model for this targeted task
-        response = await self.ai_model.vision_model.agenerate(messages=[messages])
-        response_text = response.generations[0].message.content.strip()
+        response = await self.ai_model.vision_model.agenerate(messages=[messages], stop_at_json=True, call_type="vision-tool")
+        response_text = response.generations[0][0].message.content.strip()
 
         print(f"[Vision Tool] Model response: {response_text}")
 
@@ -125,11 +125,8 @@ Candidates:
         import re
         import json
         try:
-            # Use regex to find the JSON block
-            json_match = re.search(r'\{.*?\}', response_text)
-            if json_match:
-                json_str = json_match.group(0)
-                parsed_json = json.loads(json_str)
+            parsed_json = self.ai_model.response_json(response)
+            if parsed_json:
                 final_label = parsed_json.get("label")
                 if final_label:
                     print(f"[Vision Tool] Successfully identified element with label: {final_label}")
@@ -180,7 +177,7 @@ class AnalyzeVisualLayoutTool(BaseTool):
         # 2. Use the vision model to answer the question
         # This calls a new method on the AIModel that we will create in the next step.
         try:
-            answer = await self.ai_model.analyze_layout(screenshot_b64, question)
+            answer = await self.ai_model.analyze_layout(screenshot_b64, question, region=self.browser.vision_region())
             print(f"[Vision Tool] Model response: {answer}")
             return answer
         except Exception as e:
@@ -26,6 +26,15 @@ class WebsiteGraph:
             json.dump(self.graph, f, indent=4)
         print(f"[INFO] Website graph saved to {self.graph_file_path}")
 
+    def merge(self, graph: Dict[str, Dict[str, Any]]):
+        """Adds the pages and edges of another graph (e.g. one saved by a different run)."""
+        for url, page in graph.items():
+            self.add_page(url, page.get("title"))
+            if self.graph[url].get("title") is None:
+                self.graph[url]["title"] = page.get("title")
+            for edge in page.get("edges", []):
+                self.add_edge(url, edge["to_url"], edge["action"])
+
     def add_page(self, url: str, page_title: Optional[str] = None):
         """
         Adds a page (node) to the graph if it doesn't already exist.
@@ -1,9 +1,26 @@
 import json
+import config
+
+def _compact(value) -> str:
+    return json.dumps(value, separators=(",", ":"), default=str)
+
+def _estimate_tokens(text: str) -> int:
+    # Roughly four characters per token for the English and JSON the agent produces.
+    return len(text) // 4 + 1
+
+def _shorten(text, max_chars: int) -> str:
+    text = str(text)
+    return text if len(text) <= max_chars else text[:max_chars] + "..."
 
 class WorkingMemory:
     def __init__(self):
         self.memory = {}
         self.history = []
+        # One-line summaries of the entries older than the recent window, built once per
+        # entry as it leaves the window, plus counts for the lines dropped to fit the budget.
+        self._summaries = []
+        self._summarized_upto = 0
+        self._dropped = {"entries": 0, "actions": 0, "failed_actions": 0}
 
     def upsert(self, key: str, value: any):
         self.memory[key] = value
@@ -39,6 +56,66 @@ class WorkingMemory:
     def get_history(self) -> str:
         return json.dumps(self.history, indent=4)
 
+    @staticmethod
+    def _is_failure(entry: dict) -> bool:
+        result = str(entry.get("result", "")).lower()
+        return result.startswith("error") or "failed" in result
+
+    @staticmethod
+    def _summarize_entry(entry: dict) -> str:
+        """Deterministic one-line summary of a history entry."""
+        if entry["type"] == "action_result":
+            status = "FAILED" if WorkingMemory._is_failure(entry) else "ok"
+            return f"{entry.get('tool')}({_shorten(_compact(entry.get('params')), 80)}) {status}: {_shorten(entry.get('result'), 100)}"
+        if entry["type"] == "plan":
+            return "plan: " + _shorten("; ".join(str(step) for step in entry.get("content") or []), 150)
+        return f"{entry['type']}: {_shorten(entry.get('content'), 100)}"
+
+    def get_history_for_prompt(self, token_budget: int = None, recent_entries: int = None) -> str:
+        """
+        Returns a view of the history whose size does not grow with the number of steps:
+        the most recent entries verbatim (long results shortened), and one-line summaries
+        of older ones. When that exceeds the token budget, the oldest summaries are folded
+        into counts. The view is compact JSON without indentation.
+        """
+        if token_budget is None:
+            token_budget = config.get_setting('HISTORY_TOKEN_BUDGET', 1500)
+        if recent_entries is None:
+            recent_entries = config.get_setting('HISTORY_RECENT_ENTRIES', 8)
+        max_result_chars = config.get_setting('HISTORY_RESULT_MAX_CHARS', 500)
+
+        # Summarize the entries that left the recent window since the last call.
+        window_start = max(0, len(self.history) - recent_entries)
+        for entry in self.history[self._summarized_upto:window_start]:
+            self._summaries.append({
+                "line": self._summarize_entry(entry),
+                "action": entry["type"] == "action_result",
+                "failed": entry["type"] == "action_result" and self._is_failure(entry),
+            })
+        self._summarized_upto = max(self._summarized_upto, window_start)
+
+        recent = []
+        for entry in self.history[self._summarized_upto:]:
+            if entry["type"] == "action_result":
+                entry = dict(entry, result=_shorten(entry.get("result"), max_result_chars))
+            recent.append(entry)
+
+        while True:
+            view = {}
+            if self._dropped["entries"]:
+                view["omitted"] = (f"{self._dropped['entries']} earliest entries, including {self._dropped['actions']} actions "
+                                   f"of which {self._dropped['failed_actions']} failed")
+            if self._summaries:
+                view["earlier"] = [summary["line"] for summary in self._summaries]
+            view["recent"] = recent
+            text = _compact(view)
+            if _estimate_tokens(text) <= token_budget or not self._summaries:
+                return text
+            summary = self._summaries.pop(0)
+            self._dropped["entries"] += 1
+            self._dropped["actions"] += summary["action"]
+            self._dropped["failed_actions"] += summary["failed"]
+
     def to_json(self) -> str:
         return json.dumps(self.memory, indent=4)
 